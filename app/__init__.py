@@ -2,26 +2,53 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
+from config import obter_config
+from .captura import configurar_captura
+from .engine import SessaoRoteada, configurar_bind_leitura, configurar_engines
+from .metrics import configurar_instrumentacao
+
+
+def _incluir_no_autogenerate(objeto, nome, tipo, refletido, comparado_com):
+    # Tabelas FTS5 (e as tabelas internas delas) são criadas à mão nas migrações
+    return not (tipo == "table" and "_fts" in nome)
+
 
 # Instância de SQLAlchemy fora da função
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={"class_": SessaoRoteada})
+migrate = Migrate(include_object=_incluir_no_autogenerate)
 
 
-def create_app():
+def create_app(config=None, ambiente=None):
     app = Flask(__name__)
 
-    # Configurações do banco de dados
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///supermarket.db"
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Configuração do ambiente (APP_ENV: development, production ou testing)
+    app.config.from_object(obter_config(ambiente))
+
+    # Sobrescritas explícitas (ex.: banco temporário nas verificações)
+    if config:
+        app.config.update(config)
 
     # Inicializar extensões
+    from .shards import configurar_binds
+
+    configurar_binds(app)
+    configurar_bind_leitura(app)
     db.init_app(app)
+    configurar_engines(app, db)
+    configurar_instrumentacao(app, db)
+    configurar_captura(app)
     migrate.init_app(app, db)
 
     # Registrar blueprints
+    from .metrics import metricas
     from .routes import main
 
     app.register_blueprint(main)
+    app.register_blueprint(metricas)
+
+    # Registrar comandos de linha de comando (flask <grupo> <comando>)
+    from .commands import register_commands
+
+    register_commands(app)
 
     return app
@@ -0,0 +1,589 @@
+"""
+Benchmark das rotas da API.
+
+Duas partes:
+
+- ``gerar_dados``: popula o banco com dados sintéticos determinísticos
+  (N usuários, M listas por usuário, K itens por lista), sempre os mesmos
+  para a mesma semente.
+- ``executar``: cria um banco temporário com as migrações, gera os dados,
+  exercita cada rota pelo test client e mede latência (p50/p95/p99),
+  comandos SQL, linhas lidas e pico de memória.
+
+Cada cenário tem um orçamento de comandos SQL por requisição; estourá-lo
+falha a execução. É o que pega regressões N+1: o número de comandos de uma
+rota não pode crescer com o número de listas ou itens.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from flask_migrate import upgrade
+from sqlalchemy import event, func, insert, select
+from werkzeug.security import generate_password_hash
+
+from . import catalogo, create_app, db, listas, shards
+from .metrics import COMANDOS_DE_CONTROLE
+from .models import Lista, User
+from .query_plans import DIRETORIO_MIGRACOES
+
+
+PRODUTOS = (
+    "Arroz", "Feijão", "Açúcar", "Café", "Leite", "Óleo", "Farinha", "Macarrão",
+    "Sal", "Manteiga", "Queijo", "Presunto", "Pão", "Ovos", "Banana", "Maçã",
+    "Tomate", "Cebola", "Batata", "Alho", "Frango", "Carne", "Sabão", "Detergente",
+)
+VARIANTES = ("", " Integral", " Light", " Tipo 1", " Premium", " 1kg", " 5kg")
+SUPERMERCADOS = (
+    "Atacadão", "Extra", "Carrefour", "Dia", "Assaí", "Pão de Açúcar",
+    "Sonda", "Hirota", "Tenda", "Makro",
+)
+
+REPETICOES_PADRAO = 20
+
+Cenario = namedtuple("Cenario", "nome metodo caminho corpo orcamento")
+
+
+def _payload_lista(aleatorio, user_id, data, itens_por_lista):
+    return {
+        "userId": user_id,
+        "data": data.isoformat(),
+        "itens": [
+            {
+                "produto": aleatorio.choice(PRODUTOS) + aleatorio.choice(VARIANTES),
+                "valor": round(aleatorio.uniform(1, 80), 2),
+                "quantidade": aleatorio.randint(1, 6),
+                "supermercado": aleatorio.choice(SUPERMERCADOS),
+            }
+            for _ in range(itens_por_lista)
+        ],
+    }
+
+
+def gerar_dados(usuarios, listas_por_usuario, itens_por_lista, semente=42):
+    """
+    Insere usuários, listas e itens sintéticos no banco da aplicação.
+
+    As listas passam pelo mesmo caminho da importação em massa, então
+    catálogos, resumos e versões ficam consistentes. Retorna os ids do
+    primeiro e do último usuário criados.
+    """
+    aleatorio = random.Random(semente)
+    # Um único hash para todos: gerar um por usuário dominaria o tempo
+    senha_hash = generate_password_hash("senha")
+
+    ids = db.session.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [
+            {
+                "nome": f"Usuário {n}",
+                "telefone": f"11 9{n:04d}-{n % 10000:04d}",
+                "email": f"usuario{n}@exemplo.com",
+                "senha_hash": senha_hash,
+            }
+            for n in range(1, usuarios + 1)
+        ],
+    ).scalars().all()
+    # Catálogo completo, qualquer que seja o tamanho dos dados: os cenários
+    # usam esses nomes, e o custo deles não pode depender de já existirem
+    catalogo.ids_produtos([p + v for p in PRODUTOS for v in VARIANTES])
+    catalogo.ids_supermercados(SUPERMERCADOS)
+    db.session.commit()
+
+    inicio = datetime(2024, 1, 1, 9, 0)
+
+    def linhas():
+        for user_id in ids:
+            for _ in range(listas_por_usuario):
+                data = inicio + timedelta(hours=aleatorio.randint(0, 24 * 365))
+                yield json.dumps(
+                    _payload_lista(aleatorio, user_id, data, itens_por_lista)
+                )
+
+    resultado = listas.importar_ndjson(linhas())
+    if resultado["erros"]:
+        raise RuntimeError(f"Falha ao gerar listas: {resultado['erros'][:3]}")
+    return ids[0], ids[-1]
+
+
+def _cenarios(primeiro_usuario, ultimo_usuario, listas_por_usuario, itens_por_lista):
+    """
+    Cenários medidos. ``caminho`` e ``corpo`` podem ser funções do número da
+    repetição, para escritas que não podem se repetir (e-mail único, lista
+    já excluída). ``orcamento`` é o máximo de comandos SQL por requisição,
+    ou ``None`` para rotas sem limite fixo.
+    """
+    aleatorio = random.Random(7)
+    lista = _payload_lista(aleatorio, primeiro_usuario, datetime(2024, 6, 1), itens_por_lista)
+    # O último usuário fornece as listas que o cenário de exclusão apaga
+    primeira_lista_excluivel = (ultimo_usuario - 1) * listas_por_usuario + 1
+
+    def novo_usuario(i):
+        return {
+            "json": {
+                "nome": f"Novo {i}",
+                "telefone": f"21 9{i:04d}-0000",
+                "email": f"novo{i}@exemplo.com",
+                "senha": "senha",
+            }
+        }
+
+    def atualizacao(_):
+        itens = [dict(item, valor=item["valor"] + 1) for item in lista["itens"]]
+        return {"json": {"itens": itens}}
+
+    return [
+        Cenario("usuarios_criar", "POST", "/api/users", novo_usuario, 1),
+        Cenario(
+            "login", "POST", "/api/login",
+            {"json": {"nome": "Usuário 1", "telefone": "11 90001-0001"}}, 1,
+        ),
+        Cenario("usuarios_pagina", "GET", "/api/users?limit=50&after=0", {}, 1),
+        # Em stream, um SELECT por lote de 500: cresce com o número de usuários
+        Cenario("usuarios_stream", "GET", "/api/users?stream=1", {}, None),
+        Cenario("listas_criar", "POST", "/api/listas", {"json": lista}, 7),
+        # Inclui a conferência dos usuários do lote (um SELECT por lote)
+        Cenario(
+            "listas_importar", "POST", "/api/listas/importar",
+            {"data": "\n".join(json.dumps(lista) for _ in range(10))}, 17,
+        ),
+        Cenario(
+            "listas_lote", "POST", "/api/listas/lote",
+            {
+                "json": {
+                    "operacoes": [
+                        {"op": "criar", "ref": f"r{n}", "lista": lista} for n in range(10)
+                    ]
+                    + [{"op": "excluir", "listaId": f"$r{n}"} for n in range(5)]
+                }
+            },
+            None,
+        ),
+        Cenario("listas_por_query", "GET", "/api/listas?userId=1", {}, 3),
+        Cenario("listas_por_query_pagina", "GET", "/api/listas?userId=1&limit=20&after=0", {}, 3),
+        Cenario("listas_do_usuario", "GET", "/api/listas/usuario/1", {}, 3),
+        Cenario("listas_alteracoes", "GET", "/api/listas/changes?userId=1&since=0", {}, 4),
+        Cenario("listas_alteracoes_recentes", "GET", "/api/listas/changes?userId=1&since=1000000", {}, 4),
+        Cenario("listas_do_usuario_pagina", "GET", "/api/listas/usuario/1?limit=20&after=0", {}, 3),
+        Cenario("listas_do_usuario_campos", "GET", "/api/listas/usuario/1?fields=id,data,itens.produto", {}, 3),
+        Cenario("listas_do_supermercado", "GET", "/api/listas/supermercado/Extra?limit=50&after=0", {}, 2),
+        Cenario("listas_filtro", "GET", "/api/listas/filtro?supermercado=Extra&precoMax=20&de=2024-01-01", {}, 4),
+        Cenario("listas_filtro_pagina", "GET", "/api/listas/filtro?userId=1&precoMin=10&limit=20&after=1", {}, 2),
+        Cenario("itens_busca", "GET", "/api/itens/Arroz", {}, 1),
+        Cenario("itens_busca_curta", "GET", "/api/itens/Sa", {}, 1),
+        Cenario("exportar_usuario_csv", "GET", f"/api/exportar/usuarios/{primeiro_usuario}", {}, 2),
+        Cenario("exportar_usuario_ndjson", "GET", f"/api/exportar/usuarios/{primeiro_usuario}?formato=ndjson", {}, 2),
+        Cenario("exportar_tudo_csv", "GET", "/api/exportar", {}, 1),
+        Cenario("cotacao_lista", "GET", "/api/cotacao?listaId=1", {}, 3),
+        Cenario("cotacao_produtos", "GET", "/api/cotacao?produto=Arroz&produto=Feijão&produto=Sal", {}, 2),
+        Cenario("analytics_lista", "GET", "/api/analytics/listas/1", {}, 1),
+        Cenario("analytics_gastos", "GET", f"/api/analytics/usuarios/{primeiro_usuario}/gastos", {}, 1),
+        Cenario("analytics_precos_produto", "GET", "/api/analytics/precos?produto=Arroz", {}, 1),
+        Cenario("analytics_precos_supermercado", "GET", "/api/analytics/precos?supermercado=Extra", {}, 1),
+        Cenario("listas_atualizar", "PUT", "/api/listas/1", atualizacao, 14),
+        Cenario(
+            "listas_excluir", "DELETE",
+            lambda i: f"/api/listas/{primeira_lista_excluivel + i}", {}, 10,
+        ),
+        # Marca todas as listas do penúltimo usuário; as repetições não acham
+        # mais nada. O expurgo roda na requisição (ver executar_benchmark)
+        Cenario(
+            "listas_excluir_em_massa", "POST", "/api/listas/excluir",
+            {"json": {"userId": ultimo_usuario - 1}}, 11,
+        ),
+    ]
+
+
+class _Contador:
+    """Conta comandos SQL e linhas lidas em todos os engines da aplicação."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.comandos = 0
+        self.linhas = 0
+
+    def _ao_executar(self, conn, cursor, sql, parametros, context, executemany):
+        if not sql.lstrip().upper().startswith(COMANDOS_DE_CONTROLE):
+            self.comandos += 1
+
+    def _contar_linha(self, cursor, linha):
+        self.linhas += 1
+        return linha
+
+    def _ao_emprestar(self, dbapi_connection, connection_record, connection_proxy):
+        # O row_factory do sqlite3 é chamado a cada linha lida do banco
+        dbapi_connection.row_factory = self._contar_linha
+
+    def _ao_devolver(self, dbapi_connection, connection_record):
+        dbapi_connection.row_factory = None
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._ao_executar)
+            event.listen(engine, "checkout", self._ao_emprestar)
+            event.listen(engine, "checkin", self._ao_devolver)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._ao_executar)
+            event.remove(engine, "checkout", self._ao_emprestar)
+            event.remove(engine, "checkin", self._ao_devolver)
+
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    posicao = max(0, min(len(ordenadas) - 1, round(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[posicao]
+
+
+def _resolver(valor, repeticao):
+    return valor(repeticao) if callable(valor) else valor
+
+
+def _medir(cliente, engines, cenario, repeticoes):
+    """
+    A primeira requisição é instrumentada (comandos, linhas e memória); as
+    demais só medem tempo, sem o custo da instrumentação.
+    """
+    def requisitar(i):
+        resposta = cliente.open(
+            _resolver(cenario.caminho, i),
+            method=cenario.metodo,
+            **_resolver(cenario.corpo, i),
+        )
+        resposta.get_data()  # consome respostas em stream
+        resposta.close()
+        return resposta.status_code
+
+    tracemalloc.start()
+    try:
+        with _Contador(engines) as contador:
+            status = requisitar(0)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    tempos = []
+    for i in range(1, repeticoes + 1):
+        inicio = time.perf_counter()
+        requisitar(i)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    return {
+        "metodo": cenario.metodo,
+        "caminho": _resolver(cenario.caminho, 0),
+        "status": status,
+        "p50_ms": round(_percentil(tempos, 50), 3),
+        "p95_ms": round(_percentil(tempos, 95), 3),
+        "p99_ms": round(_percentil(tempos, 99), 3),
+        "comandos_sql": contador.comandos,
+        "orcamento_sql": cenario.orcamento,
+        "linhas_lidas": contador.linhas,
+        "memoria_pico_kb": round(pico / 1024, 1),
+    }
+
+
+def _app_com_dados(diretorio, usuarios, listas_por_usuario, itens_por_lista,
+                   semente, config=None):
+    """Aplicação sobre um banco novo em ``diretorio``, já com os dados gerados."""
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+            + os.path.join(diretorio, "benchmark.db"),
+            # Mede o acesso ao banco, não o cache de respostas
+            "CACHE_LISTAS_TAMANHO": 0,
+            # Expurgo em segundo plano contaria comandos nos cenários seguintes
+            "EXPURGO_EM_SEGUNDO_PLANO": False,
+            # Um banco só, mesmo com SHARDS no ambiente
+            "SHARDS": (),
+            # O tráfego sintético não entra na captura
+            "CAPTURA_ARQUIVO": None,
+            **(config or {}),
+        }
+    )
+    with app.app_context():
+        upgrade(directory=DIRETORIO_MIGRACOES)
+        usuarios_gerados = gerar_dados(
+            usuarios, listas_por_usuario, itens_por_lista, semente
+        )
+        engines = list(db.engines.values())
+    return app, engines, usuarios_gerados
+
+
+def executar(usuarios=100, listas_por_usuario=10, itens_por_lista=8,
+             repeticoes=REPETICOES_PADRAO, semente=42, filtro=None):
+    """
+    Roda o benchmark em um banco temporário e retorna ``(relatorio, falhas)``.
+
+    ``falhas`` lista as rotas que estouraram o orçamento de comandos SQL ou
+    responderam com erro 5xx; lista vazia significa sucesso.
+    """
+    if repeticoes < 1:
+        raise ValueError("repeticoes deve ser pelo menos 1.")
+    if usuarios < 2 or listas_por_usuario < repeticoes + 1:
+        raise ValueError(
+            "São necessários ao menos 2 usuários e repeticoes + 1 listas por "
+            "usuário (o cenário de exclusão apaga listas do último usuário)."
+        )
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        app, engines, (primeiro, ultimo) = _app_com_dados(
+            diretorio, usuarios, listas_por_usuario, itens_por_lista, semente
+        )
+
+        cenarios = _cenarios(primeiro, ultimo, listas_por_usuario, itens_por_lista)
+        if filtro:
+            cenarios = [c for c in cenarios if filtro in c.nome]
+
+        rotas = {}
+        falhas = []
+        try:
+            cliente = app.test_client()
+            for cenario in cenarios:
+                resultado = _medir(cliente, engines, cenario, repeticoes)
+                rotas[cenario.nome] = resultado
+
+                if resultado["status"] >= 500:
+                    falhas.append(f"{cenario.nome}: status {resultado['status']}")
+                if (
+                    cenario.orcamento is not None
+                    and resultado["comandos_sql"] > cenario.orcamento
+                ):
+                    falhas.append(
+                        f"{cenario.nome}: {resultado['comandos_sql']} comandos SQL "
+                        f"(orçamento {cenario.orcamento})"
+                    )
+        finally:
+            for engine in engines:
+                engine.dispose()
+
+    relatorio = {
+        "parametros": {
+            "usuarios": usuarios,
+            "listas_por_usuario": listas_por_usuario,
+            "itens_por_lista": itens_por_lista,
+            "repeticoes": repeticoes,
+            "semente": semente,
+        },
+        "rotas": rotas,
+    }
+    return relatorio, falhas
+
+
+# Métricas comparadas com a linha de base e a variação relativa que é
+# reportada (tempos oscilam mais que contagens)
+TOLERANCIAS = {
+    "p50_ms": 0.25,
+    "p95_ms": 0.25,
+    "p99_ms": 0.50,
+    "comandos_sql": 0.0,
+    "linhas_lidas": 0.0,
+    "memoria_pico_kb": 0.25,
+}
+
+
+def comparar(relatorio, base):
+    """
+    Compara o relatório com uma linha de base salva anteriormente.
+
+    Retorna linhas ``(rota, métrica, valor_base, valor_atual)`` para as
+    métricas que pioraram além da tolerância.
+    """
+    if relatorio["parametros"] != base.get("parametros"):
+        raise ValueError("A linha de base foi gerada com outros parâmetros.")
+
+    pioras = []
+    for nome, atual in relatorio["rotas"].items():
+        anterior = base["rotas"].get(nome)
+        if anterior is None:
+            continue
+        for metrica, tolerancia in TOLERANCIAS.items():
+            antes, agora = anterior.get(metrica), atual[metrica]
+            if antes is not None and agora > antes * (1 + tolerancia):
+                pioras.append((nome, metrica, antes, agora))
+    return pioras
+
+
+def tempestade_de_cadastros(cadastradores=8, leituras=200, processos=None,
+                            usuarios=20, listas_por_usuario=10, itens_por_lista=8):
+    """
+    Mede a latência de uma leitura barata (uma página de listas) sozinha e
+    durante uma rajada de cadastros feita por ``cadastradores`` threads.
+
+    ``processos`` sobrescreve ``SENHAS_PROCESSOS`` (0 faz o hash na thread
+    da requisição, para comparação). Retorna a latência nas duas situações e
+    a contagem de respostas dos cadastros por status.
+    """
+    config = {} if processos is None else {"SENHAS_PROCESSOS": processos}
+    leitura = "/api/listas/usuario/1?limit=20&after=0"
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        app, engines, _ = _app_com_dados(
+            diretorio, usuarios, listas_por_usuario, itens_por_lista, 42, config
+        )
+        cliente = app.test_client()
+
+        def medir_leituras():
+            tempos = []
+            for _ in range(leituras):
+                inicio = time.perf_counter()
+                cliente.get(leitura).close()
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            return {
+                "p50_ms": round(_percentil(tempos, 50), 3),
+                "p95_ms": round(_percentil(tempos, 95), 3),
+                "p99_ms": round(_percentil(tempos, 99), 3),
+            }
+
+        parar = threading.Event()
+        status = Counter()
+        lock_status = threading.Lock()
+
+        def cadastrar(numero):
+            i = 0
+            while not parar.is_set():
+                i += 1
+                resposta = cliente.post(
+                    "/api/users",
+                    json={
+                        "nome": f"Rajada {numero}-{i}",
+                        "telefone": "0",
+                        "email": f"rajada{numero}-{i}@exemplo.com",
+                        "senha": "senha",
+                    },
+                )
+                resposta.close()
+                with lock_status:
+                    status[resposta.status_code] += 1
+                if resposta.status_code == 503:
+                    # Respeita o Retry-After em escala reduzida
+                    time.sleep(0.05)
+
+        try:
+            sozinha = medir_leituras()
+            threads = [
+                threading.Thread(target=cadastrar, args=(n,), daemon=True)
+                for n in range(cadastradores)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                durante = medir_leituras()
+            finally:
+                parar.set()
+                for thread in threads:
+                    thread.join()
+        finally:
+            for engine in engines:
+                engine.dispose()
+
+    return {
+        "leitura": leitura,
+        "sozinha": sozinha,
+        "durante_cadastros": durante,
+        "cadastros_por_status": {str(k): v for k, v in sorted(status.items())},
+    }
+
+
+def _preparar_shards(app, primeiro):
+    """Migra os shards e põe o usuário ``primeiro + k`` no shard k."""
+    from .rebalanceamento import mover
+
+    with app.app_context():
+        for indice in shards.indices()[1:]:
+            upgrade(directory=DIRETORIO_MIGRACOES, x_arg=[f"shard={indice}"])
+            shards.preparar(indice)
+        for indice in shards.indices()[1:]:
+            mover(primeiro + indice, indice)
+
+
+def rajada_de_escritas(escritores=16, operacoes=50, agrupada=True, quantidade_shards=0):
+    """
+    ``escritores`` threads criam ``operacoes`` listas cada uma, ao mesmo
+    tempo, e medem a vazão de escrita com ou sem commit em grupo. Uma em
+    cada dez operações é uma atualização inválida, que deve falhar sozinha
+    (400) sem derrubar as outras do mesmo lote.
+
+    Com ``quantidade_shards``, cada thread escreve para um usuário de um
+    shard (em rodízio, o principal incluído): cada shard tem o seu lock de
+    escrita, e a vazão pode crescer com eles enquanto houver CPU e disco.
+    """
+    config = {"ESCRITA_AGRUPADA": agrupada}
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        config["SHARDS"] = tuple(
+            "sqlite:///" + os.path.join(diretorio, f"shard{indice}.db")
+            for indice in range(1, quantidade_shards + 1)
+        )
+        app, engines, (primeiro, _) = _app_com_dados(
+            diretorio, max(4, quantidade_shards + 1), 2, 4, 42, config
+        )
+        if quantidade_shards:
+            _preparar_shards(app, primeiro)
+        cliente = app.test_client()
+        aleatorio = random.Random(3)
+        listas_por_shard = [
+            _payload_lista(aleatorio, primeiro + indice, datetime(2024, 6, 1), 5)
+            for indice in range(quantidade_shards + 1)
+        ]
+        lista = listas_por_shard[0]
+        invalida = {"itens": [dict(lista["itens"][0], id=10**9)]}
+
+        status = Counter()
+        tempos = []
+        lock = threading.Lock()
+
+        def escrever(lista):
+            for i in range(operacoes):
+                inicio = time.perf_counter()
+                if i % 10 == 9:
+                    resposta = cliente.put("/api/listas/1", json=invalida)
+                else:
+                    resposta = cliente.post("/api/listas", json=lista)
+                resposta.close()
+                with lock:
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                    status[resposta.status_code] += 1
+
+        threads = [
+            threading.Thread(
+                target=escrever, args=(listas_por_shard[i % len(listas_por_shard)],)
+            )
+            for i in range(escritores)
+        ]
+        try:
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+
+            with app.app_context():
+                gravadas = 0
+                for indice in shards.indices():
+                    with shards.usar(indice):
+                        gravadas += db.session.execute(
+                            select(func.count()).select_from(Lista)
+                        ).scalar_one()
+        finally:
+            for engine in engines:
+                engine.dispose()
+
+    return {
+        "agrupada": agrupada,
+        "shards": quantidade_shards,
+        "operacoes": escritores * operacoes,
+        "operacoes_por_segundo": round(escritores * operacoes / duracao, 1),
+        "p50_ms": round(_percentil(tempos, 50), 3),
+        "p99_ms": round(_percentil(tempos, 99), 3),
+        "respostas_por_status": {str(k): v for k, v in sorted(status.items())},
+        "listas_gravadas": gravadas,
+    }
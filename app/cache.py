@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+from sqlalchemy.dialects.sqlite import insert
+
+from . import db
+from .models import VersaoListas
+
+
+TAMANHO_PADRAO_CACHE = 256
+
+# Cabeçalhos refeitos a cada resposta, fora do cache
+CABECALHOS_NAO_GUARDADOS = ("ETag", "Content-Length", "Set-Cookie")
+
+
+def versao_listas(user_id):
+    """Versão atual das listas do usuário (0 se ele nunca escreveu)."""
+    versao = db.session.execute(
+        db.select(VersaoListas.versao).where(VersaoListas.user_id == user_id)
+    ).scalar()
+    return versao or 0
+
+
+def incrementar_versao(user_id):
+    """
+    Incrementa a versão das listas do usuário na transação corrente.
+
+    Deve ser chamado por toda rota que cria, altera ou exclui listas, antes
+    do commit, para invalidar ETags e respostas em cache. Retorna a nova
+    versão, que é também a revisão gravada nas listas e itens alterados.
+    """
+    stmt = insert(VersaoListas).values(user_id=user_id, versao=1)
+    return db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[VersaoListas.user_id],
+            set_={"versao": VersaoListas.versao + 1},
+        ).returning(VersaoListas.versao)
+    ).scalar_one()
+
+
+class CacheLRU:
+    """Cache LRU em memória, seguro para uso entre threads."""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._dados.get(chave)
+            if valor is not None:
+                self._dados.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        if self.tamanho <= 0:
+            return
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho:
+                self._dados.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+_respostas = None
+
+
+def _cache_respostas():
+    global _respostas
+    if _respostas is None:
+        _respostas = CacheLRU(
+            current_app.config.get("CACHE_LISTAS_TAMANHO", TAMANHO_PADRAO_CACHE)
+        )
+    return _respostas
+
+
+def condicional_por_usuario(obter_user_id):
+    """
+    Responde GETs de listas com ETag derivada da versão das listas do usuário.
+
+    ``obter_user_id`` recebe os argumentos da rota e devolve o id do usuário,
+    ou ``None`` para deixar a rota tratar a requisição (ex.: parâmetro
+    inválido). Um ``If-None-Match`` igual à versão atual é respondido com 304
+    sem consultar listas e itens; corpos já serializados para a mesma versão
+    saem do cache LRU, com os cabeçalhos da rota (ex.: ``X-Next-Cursor``).
+    """
+
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = obter_user_id(**kwargs)
+            if user_id is None:
+                return view(*args, **kwargs)
+
+            versao = versao_listas(user_id)
+            etag = f"{user_id}-{versao}"
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+
+            chave = (user_id, versao, request.full_path)
+            guardada = _cache_respostas().obter(chave)
+            if guardada is not None:
+                corpo, cabecalhos = guardada
+                response = current_app.response_class(corpo, headers=cabecalhos)
+                response.set_etag(etag, weak=True)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                if not response.is_streamed:
+                    # Cabeçalhos da rota (Content-Type, X-Next-Cursor) voltam
+                    # junto com o corpo
+                    cabecalhos = [
+                        (nome, valor)
+                        for nome, valor in response.headers.items()
+                        if nome not in CABECALHOS_NAO_GUARDADOS
+                    ]
+                    _cache_respostas().guardar(chave, (response.get_data(), cabecalhos))
+            return response
+
+        return wrapper
+
+    return decorador
@@ -0,0 +1,189 @@
+"""
+Captura de tráfego para reprodução (ver app/reproducao.py).
+
+Com ``CAPTURA_ARQUIVO`` configurado, uma fração ``CAPTURA_AMOSTRA`` das
+requisições é gravada nesse arquivo, uma por linha em JSON: instante,
+método, caminho, query, regra e argumentos da rota, corpo, status, duração
+e os ids que a resposta revelou ao cliente (``ids_criados``), para que a
+reprodução troque os ids da captura pelos que ela mesma criar.
+
+O corpo é copiado enquanto a rota o lê, sem ler antes dela: as rotas que
+consomem o corpo em stream continuam em stream. Só o que a rota leu entra,
+até ``CAPTURA_CORPO_MAXIMO`` bytes; acima disso o registro sai marcado com
+``corpoTruncado``. Os campos de ``CAPTURA_CAMPOS_OCULTOS`` (senhas) são
+gravados como ``"***"``.
+
+Cada linha vai em um único ``write`` em um arquivo aberto com
+``O_APPEND``: os workers de ``serve.py`` podem gravar no mesmo arquivo
+sem misturar linhas.
+"""
+import json
+import os
+import random
+import time
+
+from flask import g, request
+
+
+# Valor gravado no lugar dos campos ocultos
+OCULTO = "***"
+
+# Rotas que não são capturadas
+ROTAS_IGNORADAS = ("/metrics",)
+
+
+class _EntradaCopiada:
+    """Envolve o ``wsgi.input`` e guarda os primeiros bytes lidos."""
+
+    def __init__(self, entrada, limite):
+        self._entrada = entrada
+        self._limite = limite
+        self.copia = bytearray()
+        self.truncado = False
+
+    def _copiar(self, dados):
+        espaco = self._limite - len(self.copia)
+        if len(dados) > espaco:
+            self.truncado = True
+        if espaco > 0:
+            self.copia += dados[:espaco]
+        return dados
+
+    def read(self, *args):
+        return self._copiar(self._entrada.read(*args))
+
+    def readline(self, *args):
+        return self._copiar(self._entrada.readline(*args))
+
+    def readlines(self, *args):
+        return [self._copiar(linha) for linha in self._entrada.readlines(*args)]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        linha = self.readline()
+        if not linha:
+            raise StopIteration
+        return linha
+
+
+def ids_criados(rota, status, dados):
+    """
+    Ids que a resposta de ``rota`` revela ao cliente:
+    ``{"listas": [...], "usuarios": [...]}`` (só as chaves com ids).
+    """
+    if not isinstance(dados, dict):
+        return {}
+    if rota == "/api/login" and status == 200:
+        return {"usuarios": [dados["id"]]} if "id" in dados else {}
+    if rota == "/api/listas" and status == 201:
+        return {"listas": [dados["listaId"]]} if "listaId" in dados else {}
+    if rota == "/api/listas/lote" and status == 200:
+        listas = [
+            r["listaId"]
+            for r in dados.get("resultados", ())
+            if r.get("status") == 201 and isinstance(r.get("listaId"), int)
+        ]
+        return {"listas": listas} if listas else {}
+    return {}
+
+
+def ocultar(valor, campos):
+    """Troca por ``OCULTO`` os valores dos ``campos``, em qualquer nível."""
+    if isinstance(valor, dict):
+        return {
+            k: OCULTO if k in campos else ocultar(v, campos) for k, v in valor.items()
+        }
+    if isinstance(valor, list):
+        return [ocultar(v, campos) for v in valor]
+    return valor
+
+
+def _texto_do_corpo(bruto, campos):
+    texto = bruto.decode("utf-8", errors="replace")
+    if not texto or not campos:
+        return texto
+    try:
+        return json.dumps(ocultar(json.loads(texto), campos), ensure_ascii=False)
+    except ValueError:
+        pass
+    # NDJSON: linha a linha
+    linhas = []
+    for linha in texto.splitlines():
+        try:
+            linhas.append(json.dumps(ocultar(json.loads(linha), campos), ensure_ascii=False))
+        except ValueError:
+            linhas.append(linha)
+    return "\n".join(linhas)
+
+
+def caminho_do_arquivo(app):
+    """Caminho absoluto do arquivo de captura, ou ``None`` se desligada."""
+    arquivo = app.config.get("CAPTURA_ARQUIVO")
+    if not arquivo:
+        return None
+    return os.path.join(app.instance_path, arquivo)
+
+
+def configurar_captura(app):
+    """Registra os hooks de captura, se ``CAPTURA_ARQUIVO`` estiver configurado."""
+    caminho = caminho_do_arquivo(app)
+    if caminho is None:
+        return
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    # Aberto uma vez: os workers herdam o descritor no fork
+    descritor = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    amostra = app.config.get("CAPTURA_AMOSTRA", 1.0)
+    limite = app.config.get("CAPTURA_CORPO_MAXIMO", 1024 * 1024)
+    campos = frozenset(app.config.get("CAPTURA_CAMPOS_OCULTOS") or ())
+
+    @app.before_request
+    def iniciar_captura():
+        if request.path in ROTAS_IGNORADAS or random.random() >= amostra:
+            return
+        g.captura_instante = time.time()
+        g.captura_inicio = time.perf_counter()
+        # O stream da requisição é criado no primeiro acesso, a partir daqui
+        if "stream" not in request.__dict__:
+            entrada = _EntradaCopiada(request.environ["wsgi.input"], limite)
+            request.environ["wsgi.input"] = entrada
+            g.captura_entrada = entrada
+
+    @app.after_request
+    def gravar_captura(response):
+        inicio = g.get("captura_inicio")
+        if inicio is None:
+            return response
+
+        duracao = time.perf_counter() - inicio
+        rota = request.url_rule.rule if request.url_rule else None
+        entrada = g.get("captura_entrada")
+
+        dados = None
+        if response.is_json and not response.is_streamed:
+            dados = response.get_json(silent=True)
+
+        registro = {
+            "t": g.captura_instante,
+            "metodo": request.method,
+            "caminho": request.path,
+            "query": request.query_string.decode("latin-1"),
+            "rota": rota,
+            "argumentos": request.view_args or {},
+            "tipoConteudo": request.content_type,
+            "corpo": _texto_do_corpo(bytes(entrada.copia), campos) if entrada else "",
+            "status": response.status_code,
+            "duracaoMs": round(duracao * 1000, 3),
+            "criados": ids_criados(rota, response.status_code, dados),
+        }
+        if entrada is not None and entrada.truncado:
+            registro["corpoTruncado"] = True
+
+        linha = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+        try:
+            os.write(descritor, linha.encode("utf-8"))
+        except OSError:
+            app.logger.exception("Falha ao gravar a captura em %s", caminho)
+        return response
@@ -0,0 +1,140 @@
+"""
+Catálogos de produtos e supermercados.
+
+Itens guardam apenas os ids dos catálogos. Os ids já resolvidos ficam em um
+cache em memória (nome normalizado -> id), consultado pelo caminho de
+escrita antes de ir ao banco. Ids só entram no cache depois do commit da
+transação que os leu ou criou, para que um rollback nunca deixe no cache um
+id que não existe. Cada shard (app/shards.py) tem o seu catálogo, e o seu
+cache.
+"""
+import threading
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as upsert
+
+from . import db
+from .engine import SessaoRoteada, shard_atual
+from .models import Produto, Supermercado
+
+
+CHAVE_PENDENTES = "catalogo_pendentes"
+
+
+def nome_exibicao(nome):
+    """Nome como será exibido: espaços extras removidos."""
+    return " ".join(str(nome).split())
+
+
+def normalizar(nome):
+    """Chave de unicidade do catálogo: espaços colapsados e sem caixa."""
+    return nome_exibicao(nome).casefold()
+
+
+class CacheIds:
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        return self._ids.get(chave)
+
+    def guardar(self, ids):
+        with self._lock:
+            self._ids.update(ids)
+
+    def limpar(self):
+        with self._lock:
+            self._ids.clear()
+
+
+_caches = {}
+
+
+def _cache(shard, modelo):
+    # setdefault é atômico: duas threads nunca ficam com caches diferentes
+    return _caches.setdefault((shard, modelo), CacheIds())
+
+
+def _resolver(modelo, nomes, criar):
+    shard = shard_atual.get()
+    cache = _cache(shard, modelo)
+    chaves = {nome: normalizar(nome) for nome in nomes}
+
+    ids = {}
+    faltando = []
+    for chave in set(chaves.values()):
+        catalogo_id = cache.obter(chave)
+        if catalogo_id is None:
+            faltando.append(chave)
+        else:
+            ids[chave] = catalogo_id
+
+    if faltando:
+        if criar:
+            stmt = upsert(modelo).on_conflict_do_nothing(
+                index_elements=[modelo.nome_normalizado]
+            )
+            # Na primeira ocorrência de um nome, vale a grafia recebida
+            exibicao = {}
+            for nome, chave in chaves.items():
+                exibicao.setdefault(chave, nome_exibicao(nome))
+            db.session.execute(
+                stmt,
+                [
+                    {"nome": exibicao[chave], "nome_normalizado": chave}
+                    for chave in faltando
+                ],
+            )
+
+        encontrados = dict(
+            db.session.execute(
+                select(modelo.nome_normalizado, modelo.id).where(
+                    modelo.nome_normalizado.in_(faltando)
+                )
+            ).all()
+        )
+        ids.update(encontrados)
+        db.session.info.setdefault(CHAVE_PENDENTES, []).append(
+            (shard, modelo, encontrados)
+        )
+
+    return {nome: ids.get(chave) for nome, chave in chaves.items()}
+
+
+def ids_produtos(nomes):
+    """Mapeia nomes de produto para ids, criando os que ainda não existem."""
+    return _resolver(Produto, nomes, criar=True)
+
+
+def ids_supermercados(nomes):
+    """Mapeia nomes de supermercado para ids, criando os que ainda não existem."""
+    return _resolver(Supermercado, nomes, criar=True)
+
+
+def ids_produtos_existentes(nomes):
+    """Mapeia nomes de produto para ids, com ``None`` para os desconhecidos."""
+    return _resolver(Produto, nomes, criar=False)
+
+
+def id_produto_existente(nome):
+    """Id do produto, ou ``None`` se ele não está no catálogo."""
+    return _resolver(Produto, [nome], criar=False)[nome]
+
+
+def id_supermercado_existente(nome):
+    """Id do supermercado, ou ``None`` se ele não está no catálogo."""
+    return _resolver(Supermercado, [nome], criar=False)[nome]
+
+
+@event.listens_for(SessaoRoteada, "after_commit")
+def _promover_pendentes(session):
+    for shard, modelo, ids in session.info.pop(CHAVE_PENDENTES, []):
+        _cache(shard, modelo).guardar(ids)
+
+
+@event.listens_for(SessaoRoteada, "after_soft_rollback")
+def _descartar_pendentes(session, transacao_anterior):
+    # Conservador: qualquer rollback (inclusive de savepoint) descarta tudo
+    # o que estava pendente; os ids voltam a ser lidos do banco depois
+    session.info.pop(CHAVE_PENDENTES, None)
@@ -0,0 +1,286 @@
+import click
+from flask.cli import AppGroup
+
+
+busca_cli = AppGroup("busca", help="Manutenção do índice de busca de produtos.")
+
+
+@busca_cli.command("reconstruir")
+def reconstruir_busca():
+    """Reconstrói o índice FTS a partir do catálogo de produtos (de cada shard)."""
+    from . import shards
+    from .search import reconstruir_indice
+
+    for indice in shards.indices():
+        with shards.usar(indice):
+            reconstruir_indice()
+    click.echo("Índice de busca reconstruído.")
+
+
+planos_cli = AppGroup("planos", help="Verificação dos planos de consulta.")
+
+
+@planos_cli.command("verificar")
+def verificar_planos():
+    """Falha se alguma rota fizer varredura completa de tabela."""
+    from .query_plans import verificar_planos
+
+    falhas = verificar_planos()
+    for metodo, caminho, tabela, sql in falhas:
+        click.echo(f"{metodo} {caminho}: SCAN {tabela}\n    {' '.join(sql.split())}")
+
+    if falhas:
+        raise click.ClickException(f"{len(falhas)} consulta(s) sem índice.")
+    click.echo("Nenhuma varredura completa de tabela encontrada.")
+
+
+resumos_cli = AppGroup("resumos", help="Manutenção das tabelas de resumo.")
+
+
+@resumos_cli.command("recalcular")
+def recalcular_resumos():
+    """Reconstrói os resumos de gastos e preços a partir de listas e itens."""
+    from . import shards
+    from .resumos import recalcular
+
+    for indice in shards.indices():
+        with shards.usar(indice):
+            recalcular()
+    click.echo("Resumos recalculados.")
+
+
+listas_cli = AppGroup("listas", help="Manutenção das listas.")
+
+
+@listas_cli.command("expurgar")
+def expurgar_listas():
+    """Apaga agora as listas excluídas em massa que aguardam o expurgo."""
+    from .expurgo import expurgar
+
+    click.echo(f"{expurgar()} lista(s) expurgada(s).")
+
+
+@listas_cli.command("expurgar-marcas")
+@click.option("--dias", type=int, help="Sobrescreve EXCLUSOES_RETENCAO_DIAS.")
+def expurgar_marcas(dias):
+    """Apaga as marcas de exclusão da sincronização mais antigas que a retenção."""
+    from .expurgo import expurgar_marcas
+
+    if dias is not None and dias < 0:
+        raise click.BadParameter("dias não pode ser negativo.")
+    click.echo(f"{expurgar_marcas(dias)} marca(s) de exclusão expurgada(s).")
+
+
+shards_cli = AppGroup("shards", help="Shards das listas por usuário.")
+
+
+@shards_cli.command("preparar")
+def preparar_shards():
+    """Aplica as migrações em cada shard e reserva a faixa de ids dele."""
+    from flask_migrate import upgrade
+
+    from . import shards
+
+    if not shards.ativo():
+        raise click.ClickException("Nenhum shard configurado em SHARDS.")
+    for indice in shards.indices()[1:]:
+        upgrade(x_arg=[f"shard={indice}"])
+        shards.preparar(indice)
+        click.echo(f"Shard {indice} pronto.")
+
+
+@shards_cli.command("mover")
+@click.argument("user_id", type=int)
+@click.argument("destino", type=int)
+def mover_usuario(user_id, destino):
+    """Muda as listas de um usuário para o shard DESTINO (0 é o principal)."""
+    from .rebalanceamento import mover
+
+    try:
+        copiadas = mover(user_id, destino)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Usuário {user_id} no shard {destino}: {copiadas} lista(s) copiada(s).")
+
+
+@shards_cli.command("distribuir")
+def distribuir_usuarios():
+    """Move os usuários do banco principal para os shards calculados."""
+    from .rebalanceamento import distribuir
+
+    movidos = distribuir()
+    click.echo(
+        f"{len(movidos)} usuário(s) e {sum(movidos.values())} lista(s) movidos."
+    )
+
+
+benchmark_cli = AppGroup("benchmark", help="Benchmark das rotas da API.")
+
+
+@benchmark_cli.command("gerar")
+@click.option("--usuarios", default=100, show_default=True)
+@click.option("--listas", "listas_por_usuario", default=10, show_default=True)
+@click.option("--itens", "itens_por_lista", default=8, show_default=True)
+@click.option("--semente", default=42, show_default=True)
+def gerar_dados(usuarios, listas_por_usuario, itens_por_lista, semente):
+    """Popula o banco configurado com dados sintéticos determinísticos."""
+    from .benchmark import gerar_dados
+
+    gerar_dados(usuarios, listas_por_usuario, itens_por_lista, semente)
+    click.echo(
+        f"{usuarios} usuários, {usuarios * listas_por_usuario} listas e "
+        f"{usuarios * listas_por_usuario * itens_por_lista} itens gerados."
+    )
+
+
+@benchmark_cli.command("rodar")
+@click.option("--usuarios", default=100, show_default=True)
+@click.option("--listas", "listas_por_usuario", default=25, show_default=True)
+@click.option("--itens", "itens_por_lista", default=8, show_default=True)
+@click.option("--repeticoes", default=20, show_default=True)
+@click.option("--semente", default=42, show_default=True)
+@click.option("--rota", "filtro", help="Mede só os cenários cujo nome contém o texto.")
+@click.option("--saida", type=click.Path(dir_okay=False), help="Grava o relatório JSON.")
+@click.option(
+    "--base",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Relatório anterior para comparação.",
+)
+def rodar_benchmark(usuarios, listas_por_usuario, itens_por_lista, repeticoes,
+                    semente, filtro, saida, base):
+    """Mede as rotas e falha se alguma estourar o orçamento de comandos SQL."""
+    import json
+
+    from .benchmark import comparar, executar
+
+    try:
+        relatorio, falhas = executar(
+            usuarios, listas_por_usuario, itens_por_lista, repeticoes, semente, filtro
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    for nome, r in relatorio["rotas"].items():
+        orcamento = "-" if r["orcamento_sql"] is None else r["orcamento_sql"]
+        click.echo(
+            f"{nome:32} {r['status']} p50 {r['p50_ms']:8.2f}ms "
+            f"p95 {r['p95_ms']:8.2f}ms p99 {r['p99_ms']:8.2f}ms "
+            f"sql {r['comandos_sql']:3}/{orcamento:<3} "
+            f"linhas {r['linhas_lidas']:6} mem {r['memoria_pico_kb']:9.1f}KB"
+        )
+
+    if saida:
+        with open(saida, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False, sort_keys=True)
+
+    if base:
+        with open(base, encoding="utf-8") as arquivo:
+            try:
+                pioras = comparar(relatorio, json.load(arquivo))
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        for nome, metrica, antes, agora in pioras:
+            click.echo(f"piorou: {nome} {metrica} {antes} -> {agora}")
+
+    for falha in falhas:
+        click.echo(f"FALHA {falha}")
+    if falhas:
+        raise click.ClickException(f"{len(falhas)} rota(s) fora do orçamento.")
+
+
+@benchmark_cli.command("cadastros")
+@click.option("--threads", "cadastradores", default=8, show_default=True)
+@click.option("--leituras", default=200, show_default=True)
+@click.option(
+    "--processos",
+    type=int,
+    help="Sobrescreve SENHAS_PROCESSOS (0 faz o hash na thread da requisição).",
+)
+def rajada_de_cadastros(cadastradores, leituras, processos):
+    """Latência de leitura sozinha e durante uma rajada de cadastros."""
+    import json
+
+    from .benchmark import tempestade_de_cadastros
+
+    resultado = tempestade_de_cadastros(cadastradores, leituras, processos)
+    click.echo(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+@benchmark_cli.command("escritas")
+@click.option("--threads", "escritores", default=16, show_default=True)
+@click.option("--operacoes", default=50, show_default=True, help="Por thread.")
+@click.option("--agrupada/--individual", default=True, show_default=True)
+@click.option("--shards", "quantidade_shards", default=0, show_default=True,
+              help="Shards além do banco principal.")
+def rajada_de_escritas(escritores, operacoes, agrupada, quantidade_shards):
+    """Vazão de escritas concorrentes, com ou sem commit em grupo e shards."""
+    import json
+
+    from .benchmark import rajada_de_escritas
+
+    resultado = rajada_de_escritas(escritores, operacoes, agrupada, quantidade_shards)
+    click.echo(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+trafego_cli = AppGroup("trafego", help="Reprodução do tráfego capturado.")
+
+
+@trafego_cli.command("reproduzir")
+@click.argument("arquivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--concorrencia", default=8, show_default=True, help="Threads de envio.")
+@click.option(
+    "--velocidade",
+    default=1.0,
+    show_default=True,
+    help="Multiplica o ritmo da captura (0: sem intervalos).",
+)
+@click.option(
+    "--url",
+    help="Servidor alvo (ex.: http://127.0.0.1:5000). Sem ele, usa a própria aplicação.",
+)
+@click.option("--saida", type=click.Path(dir_okay=False), help="Grava o relatório JSON.")
+def reproduzir_trafego(arquivo, concorrencia, velocidade, url, saida):
+    """Reproduz uma captura (CAPTURA_ARQUIVO) e mede vazão e latência por rota."""
+    import json
+
+    from . import create_app
+    from .reproducao import ClienteHttp, ClienteLocal, ler_captura, reproduzir
+
+    try:
+        registros = ler_captura(arquivo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    # A reprodução local não entra na captura que ela mesma lê
+    cliente = ClienteHttp(url) if url else ClienteLocal(create_app({"CAPTURA_ARQUIVO": None}))
+    try:
+        relatorio = reproduzir(registros, cliente, concorrencia, velocidade)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    for nome, r in relatorio["rotas"].items():
+        status = " ".join(f"{s}x{n}" for s, n in sorted(r["status"].items()))
+        click.echo(
+            f"{nome:48} n {r['requisicoes']:6} {r['vazao_rps']:8.2f}/s "
+            f"p50 {r['p50_ms']:8.2f}ms p95 {r['p95_ms']:8.2f}ms "
+            f"p99 {r['p99_ms']:8.2f}ms status {status}"
+        )
+    click.echo(
+        f"total {relatorio['requisicoes']} requisições em {relatorio['duracao_s']}s "
+        f"({relatorio['vazao_rps']}/s), atraso p99 {relatorio['atraso_p99_ms']}ms, "
+        f"{relatorio['ignoradas']} ignorada(s) por corpo truncado"
+    )
+
+    if saida:
+        with open(saida, "w", encoding="utf-8") as arquivo_saida:
+            json.dump(relatorio, arquivo_saida, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+def register_commands(app):
+    app.cli.add_command(busca_cli)
+    app.cli.add_command(planos_cli)
+    app.cli.add_command(resumos_cli)
+    app.cli.add_command(listas_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(benchmark_cli)
+    app.cli.add_command(trafego_cli)
@@ -0,0 +1,252 @@
+"""
+Cotação de uma lista de produtos em todos os supermercados.
+
+Os preços vêm de preco_produto: o preço de um produto em um supermercado é
+a média dos valores já registrados em itens, mantida pelas escritas. Cada
+processo guarda esses preços em uma matriz em memória, com um
+``array('d')`` por produto e uma coluna por supermercado (``inf`` onde não
+há preço). Antes de cada cotação, a matriz lê só as linhas de preco_produto
+com ``revisao`` maior que a versão que ela já tem. Só ``resumos.recalcular``,
+que reescreve a tabela (``versao_remocao``), faz a matriz ser relida inteira.
+
+Com a matriz em dia, cotar é somar vetores: o total de cada supermercado é
+a soma das linhas dos produtos multiplicadas pelas quantidades, e a divisão
+mais barata pega o mínimo de cada linha.
+
+Com shards (app/shards.py), cada um tem o seu preco_produto e os seus ids
+de catálogo. A cotação então lê, em todos os shards, só as linhas dos
+produtos cotados, soma-as pelos nomes normalizados e monta uma matriz
+só para essa cotação.
+"""
+import math
+import os
+import threading
+from array import array
+from collections import Counter
+from itertools import repeat
+from operator import add, mul
+
+from sqlalchemy import func, select
+
+from . import catalogo, db, shards
+from .models import Item, Lista, PrecoProduto, Produto, Supermercado, VersaoPrecos
+
+
+SEM_PRECO = math.inf
+
+
+class MatrizPrecos:
+    """Preço médio de cada produto (linha) em cada supermercado (coluna)."""
+
+    def __init__(self):
+        self.versao = None
+        self.supermercados = []  # nome de cada coluna
+        self._colunas = {}  # supermercado_id -> coluna
+        self._linhas = {}  # produto_id -> array('d')
+        self._lock = threading.Lock()
+
+    def _coluna(self, supermercado_id, nome):
+        coluna = self._colunas.get(supermercado_id)
+        if coluna is None:
+            coluna = self._colunas[supermercado_id] = len(self.supermercados)
+            self.supermercados.append(nome)
+            for linha in self._linhas.values():
+                linha.append(SEM_PRECO)
+        return coluna
+
+    def _aplicar(self, precos):
+        for produto_id, supermercado_id, nome, soma, ocorrencias in precos:
+            coluna = self._coluna(supermercado_id, nome)
+            linha = self._linhas.get(produto_id)
+            if linha is None:
+                linha = self._linhas[produto_id] = array(
+                    "d", repeat(SEM_PRECO, len(self.supermercados))
+                )
+            # Par zerado: o último item com esse preço foi removido
+            linha[coluna] = soma / ocorrencias if ocorrencias > 0 else SEM_PRECO
+
+    def atualizar(self):
+        """Aplica as escritas feitas em preco_produto desde a última leitura."""
+        versao, versao_remocao = db.session.execute(
+            select(VersaoPrecos.versao, VersaoPrecos.versao_remocao).where(
+                VersaoPrecos.id == 1
+            )
+        ).one_or_none() or (0, 0)
+        if versao == self.versao:
+            return
+
+        stmt = select(
+            PrecoProduto.produto_id,
+            PrecoProduto.supermercado_id,
+            Supermercado.nome,
+            PrecoProduto.soma_valor,
+            PrecoProduto.ocorrencias,
+        ).join(Supermercado, Supermercado.id == PrecoProduto.supermercado_id)
+
+        if self.versao is None or versao_remocao > self.versao:
+            self.supermercados, self._colunas, self._linhas = [], {}, {}
+        else:
+            stmt = stmt.where(PrecoProduto.revisao > self.versao)
+        self._aplicar(db.session.execute(stmt))
+        self.versao = versao
+
+    def cotar(self, quantidades, nomes, desconhecidos=()):
+        """
+        ``quantidades``: produto_id -> quantidade; ``nomes``: produto_id ->
+        nome exibido; ``desconhecidos``: nomes fora do catálogo. Retorna o
+        dict da resposta de ``GET /api/cotacao``.
+        """
+        with self._lock:
+            self.atualizar()
+            return self._cotar(quantidades, nomes, list(desconhecidos))
+
+    def _cotar(self, quantidades, nomes, sem_preco):
+        colunas = len(self.supermercados)
+        totais = array("d", repeat(0.0, colunas))
+        faltando = [len(sem_preco)] * colunas
+        divisao, total_divisao = [], 0.0
+
+        for produto_id, quantidade in quantidades.items():
+            if quantidade <= 0:
+                continue
+            linha = self._linhas.get(produto_id)
+            minimo = min(linha) if linha else SEM_PRECO
+            if minimo == SEM_PRECO:
+                sem_preco.append(nomes[produto_id])
+                faltando = [n + 1 for n in faltando]
+                continue
+
+            totais = array("d", map(add, totais, map(mul, linha, repeat(quantidade))))
+            faltando = list(map(add, faltando, map(math.isinf, linha)))
+
+            subtotal = minimo * quantidade
+            total_divisao += subtotal
+            divisao.append(
+                {
+                    "produto": nomes[produto_id],
+                    "quantidade": quantidade,
+                    "supermercado": self.supermercados[linha.index(minimo)],
+                    "preco": minimo,
+                    "subtotal": subtotal,
+                }
+            )
+
+        supermercados = sorted(
+            (
+                {
+                    "supermercado": nome,
+                    "total": total if not n else None,
+                    "produtosSemPreco": n,
+                }
+                for nome, total, n in zip(self.supermercados, totais, faltando)
+            ),
+            key=lambda item: (item["produtosSemPreco"], item["total"] or 0),
+        )
+        return {
+            "supermercados": supermercados,
+            "divisao": {"total": total_divisao, "itens": divisao},
+            "semPreco": sem_preco,
+        }
+
+
+_matriz = MatrizPrecos()
+
+
+def _precos_por_nome(chaves):
+    return db.session.execute(
+        select(
+            Produto.nome_normalizado,
+            Supermercado.nome_normalizado,
+            Supermercado.nome,
+            PrecoProduto.soma_valor,
+            PrecoProduto.ocorrencias,
+        )
+        .join(Produto, Produto.id == PrecoProduto.produto_id)
+        .join(Supermercado, Supermercado.id == PrecoProduto.supermercado_id)
+        .where(Produto.nome_normalizado.in_(chaves), PrecoProduto.ocorrencias > 0)
+    ).all()
+
+
+def _cotar_em_todos(quantidades, nomes):
+    """``MatrizPrecos.cotar`` com os preços de todos os shards, por nome normalizado."""
+    somas = {}
+    for linhas in shards.em_todos(_precos_por_nome, list(quantidades)):
+        for produto, supermercado, nome, soma, ocorrencias in linhas:
+            total = somas.setdefault((produto, supermercado), [nome, 0.0, 0])
+            total[1] += soma
+            total[2] += ocorrencias
+
+    matriz = MatrizPrecos()
+    matriz._aplicar(
+        (produto, supermercado, nome, soma, ocorrencias)
+        for (produto, supermercado), (nome, soma, ocorrencias) in somas.items()
+    )
+    return matriz._cotar(quantidades, nomes, [])
+
+
+def cotar_lista(lista_id):
+    """Cotação dos itens da lista; ``None`` se a lista não existe."""
+    indice = shards.da_lista(lista_id)
+    if indice is None:
+        return None
+    with shards.usar(indice):
+        linhas = db.session.execute(
+            select(Item.produto_id, Produto.nome, func.sum(Item.quantidade))
+            .join(Produto, Produto.id == Item.produto_id)
+            .join(Lista, Lista.id == Item.lista_id)
+            .where(Item.lista_id == lista_id, Lista.excluida_em.is_(None))
+            .group_by(Item.produto_id)
+        ).all()
+    if not linhas:
+        return None
+
+    if shards.ativo():
+        quantidades, exibicao = Counter(), {}
+        for _, nome, quantidade in linhas:
+            chave = catalogo.normalizar(nome)
+            quantidades[chave] += quantidade
+            exibicao.setdefault(chave, nome)
+        return _cotar_em_todos(quantidades, exibicao)
+
+    return _matriz.cotar(
+        {produto_id: quantidade for produto_id, _, quantidade in linhas},
+        {produto_id: nome for produto_id, nome, _ in linhas},
+    )
+
+
+def cotar_produtos(nomes):
+    """
+    Cotação de produtos pelo nome, uma unidade por ocorrência em ``nomes``.
+    Produtos fora do catálogo entram em ``semPreco``.
+    """
+    if shards.ativo():
+        # Sem um catálogo comum: todo nome é cotado, e quem não tem preço
+        # em shard nenhum entra em ``semPreco``
+        quantidades, exibicao = Counter(), {}
+        for nome in nomes:
+            chave = catalogo.normalizar(nome)
+            quantidades[chave] += 1
+            exibicao.setdefault(chave, nome)
+        return _cotar_em_todos(quantidades, exibicao)
+
+    ids = catalogo.ids_produtos_existentes(nomes)
+    quantidades, exibicao = Counter(), {}
+    desconhecidos = []
+    for nome in nomes:
+        produto_id = ids[nome]
+        if produto_id is None:
+            desconhecidos.append(nome)
+            continue
+        quantidades[produto_id] += 1
+        exibicao.setdefault(produto_id, nome)
+
+    return _matriz.cotar(quantidades, exibicao, desconhecidos)
+
+
+def _nova_matriz_no_filho():
+    # O lock pode ter sido copiado travado: cada worker monta a sua matriz
+    global _matriz
+    _matriz = MatrizPrecos()
+
+
+os.register_at_fork(after_in_child=_nova_matriz_no_filho)
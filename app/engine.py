@@ -0,0 +1,176 @@
+import threading
+from contextvars import ContextVar
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+# Chave do bind com o pool de conexões somente leitura
+BIND_LEITURA = "leitura"
+
+METODOS_LEITURA = ("GET", "HEAD", "OPTIONS")
+
+# Bind do shard das listas em uso (ver app/shards.py); ``None`` é o banco
+# principal
+shard_atual = ContextVar("shard_atual", default=None)
+
+# Tabelas que ficam só no banco principal, qualquer que seja o shard
+TABELAS_GLOBAIS = ("user", "shard_usuario")
+
+
+def chave_leitura(chave):
+    """Chave do bind somente leitura do bind de escrita ``chave``."""
+    return BIND_LEITURA if chave is None else f"{chave}-{BIND_LEITURA}"
+
+
+class SessaoRoteada(Session):
+    """
+    Sessão que envia as consultas de requisições GET para o pool de leitura
+    e as consultas de listas para o shard em uso (``shard_atual``).
+
+    Flushes e qualquer consulta fora de uma requisição de leitura continuam
+    na conexão de escrita. Tabelas de ``TABELAS_GLOBAIS`` vão sempre para o
+    banco principal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            chave = None if _eh_global(mapper) else shard_atual.get()
+            if self._pode_usar_leitura():
+                engine = self._db.engines.get(chave_leitura(chave))
+                if engine is not None:
+                    return engine
+            if chave is not None:
+                return self._db.engines[chave]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _pode_usar_leitura(self):
+        return (
+            not self._flushing
+            and has_request_context()
+            and request.method in METODOS_LEITURA
+        )
+
+
+def _eh_global(mapper):
+    # Consultas sem mapper (ex.: SQL textual da busca) são de tabelas de shard
+    return mapper is not None and mapper.local_table.name in TABELAS_GLOBAIS
+
+
+def _eh_sqlite_em_arquivo(url):
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def configurar_bind_leitura(app):
+    """
+    Registra um bind de leitura (mesmo arquivo, aberto com ``mode=ro``) para
+    o banco principal e para cada shard.
+
+    Deve ser chamado antes de ``db.init_app``. Só se aplica a SQLite em arquivo
+    e quando ``ROTEAR_LEITURAS`` está ligado.
+    """
+    if not app.config.get("ROTEAR_LEITURAS"):
+        return
+
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    escrita = {None: app.config["SQLALCHEMY_DATABASE_URI"]}
+    escrita.update(
+        (chave, valor) for chave, valor in binds.items() if isinstance(valor, str)
+    )
+
+    for chave, uri in escrita.items():
+        url = make_url(uri)
+        if not _eh_sqlite_em_arquivo(url):
+            continue
+        binds[chave_leitura(chave)] = {
+            "url": url.set(
+                database=f"file:{url.database}", query={"mode": "ro", "uri": "true"}
+            ),
+            "pool_size": app.config["POOL_LEITURA_TAMANHO"],
+            "max_overflow": app.config["POOL_LEITURA_EXTRA"],
+            "pool_timeout": app.config["SQLALCHEMY_ENGINE_OPTIONS"].get(
+                "pool_timeout", 30
+            ),
+        }
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def configurar_engines(app, db):
+    """
+    Aplica os PRAGMAs a cada nova conexão SQLite e assume o controle do BEGIN.
+
+    O driver pysqlite abre transações por conta própria e não lida bem com
+    SAVEPOINT; desligamos esse comportamento e emitimos o BEGIN no evento
+    ``begin``. Com leituras roteadas, a conexão de escrita usa
+    ``BEGIN IMMEDIATE``: o lock de escrita é obtido no início da transação e
+    o ``busy_timeout`` consegue esperar por ele, em vez de a transação falhar
+    com "database is locked" ao tentar promover uma leitura para escrita.
+    """
+    pragmas = app.config.get("SQLITE_PRAGMAS", {})
+
+    with app.app_context():
+        engines = dict(db.engines)
+
+    for chave, engine in engines.items():
+        if engine.dialect.name != "sqlite":
+            continue
+
+        somente_leitura = chave is not None and chave.endswith(BIND_LEITURA)
+        roteado = chave_leitura(chave) in engines
+        pragmas_conexao = {
+            nome: valor
+            for nome, valor in pragmas.items()
+            if not (somente_leitura and nome == "journal_mode")
+        }
+        comando_begin = "BEGIN IMMEDIATE" if roteado else "BEGIN"
+        _registrar_eventos(engine, pragmas_conexao, comando_begin)
+
+    # Nada é aberto aqui: comandos que não usam o banco (ex.: flask routes)
+    # não tocam no arquivo
+    for chave, engine in engines.items():
+        leitura = engines.get(chave_leitura(chave))
+        if leitura is not None:
+            _preparar_antes_da_leitura(engine, leitura, pragmas.get("journal_mode"))
+
+
+def _preparar_antes_da_leitura(escrita, leitura, journal_mode):
+    # Uma conexão somente leitura não cria o arquivo nem ativa o WAL. Antes
+    # da primeira, uma conexão de escrita avulsa faz isso: fora do pool, que
+    # tem uma conexão só e pode estar com esta mesma thread
+    lock = threading.Lock()
+    pronto = False
+
+    @event.listens_for(leitura, "do_connect")
+    def antes_de_conectar(dialect, connection_record, cargs, cparams):
+        nonlocal pronto
+        with lock:
+            if pronto:
+                return
+            cargs_escrita, cparams_escrita = escrita.dialect.create_connect_args(escrita.url)
+            conexao = escrita.dialect.connect(*cargs_escrita, **cparams_escrita)
+            try:
+                if journal_mode:
+                    conexao.execute(f"PRAGMA journal_mode={journal_mode}")
+            finally:
+                conexao.close()
+            pronto = True
+
+
+def _registrar_eventos(engine, pragmas, comando_begin):
+    @event.listens_for(engine, "connect")
+    def ao_conectar(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def ao_iniciar(connection):
+        # Em AUTOCOMMIT (ex.: autocommit_block do Alembic) cada comando é
+        # a própria transação
+        if connection.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+            return
+        connection.exec_driver_sql(comando_begin)
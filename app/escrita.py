@@ -0,0 +1,166 @@
+"""
+Escritas de listas, com commit em grupo opcional.
+
+``executar(funcao, *args)`` roda uma função de serviço (``listas.criar``,
+``listas.atualizar_por_id``, ...) e faz o commit. É o único caminho das
+rotas de escrita de listas.
+
+Com ``ESCRITA_AGRUPADA`` desligado (padrão), a função roda na própria
+requisição, em uma transação só dela. Ligado, a requisição entrega a
+operação a uma única thread escritora por processo. A thread junta o que
+chegar em ``ESCRITA_JANELA_MS`` (até ``ESCRITA_MAXIMO_LOTE`` operações) e
+grava tudo em uma transação. Cada operação roda em um SAVEPOINT: uma que
+falha é desfeita sozinha e a exceção volta só para a requisição dela. As
+requisições só recebem o resultado depois do commit.
+
+No modo agrupado, a requisição não pode usar a conexão de escrita antes de
+``executar`` (o pool de escrita tem uma conexão só): as funções recebem ids
+e dados simples e carregam o que precisam, e devolvem valores simples. Com
+shards (app/shards.py), cada shard tem a sua thread escritora, e a operação
+vai para a do shard em uso.
+
+Os comandos SQL de cada operação, mais o commit do lote, são medidos na
+thread escritora e voltam no ``Future`` (``medicao_sql``) para as métricas
+da requisição (app/metrics.py).
+"""
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from flask import current_app
+
+from . import db, metrics
+from .engine import shard_atual
+
+
+class EscritaIndisponivel(RuntimeError):
+    """
+    A thread escritora não respondeu no prazo. A operação continua na fila
+    e ainda pode ser gravada.
+    """
+
+
+Operacao = namedtuple("Operacao", "funcao args futuro")
+
+
+def executar(funcao, *args):
+    """Executa ``funcao(*args)`` e faz o commit. Retorna o resultado dela."""
+    if not current_app.config.get("ESCRITA_AGRUPADA"):
+        try:
+            resultado = funcao(*args)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        return resultado
+
+    futuro = _obter_escritor(shard_atual.get()).enviar(funcao, args)
+    try:
+        return futuro.result(timeout=current_app.config.get("ESCRITA_TIMEOUT", 30))
+    except TimeoutError:
+        raise EscritaIndisponivel("Tempo esgotado aguardando a gravação.")
+    finally:
+        metrics.acumular_na_requisicao(getattr(futuro, "medicao_sql", None))
+
+
+class Escritor:
+    """Thread única (por shard) que grava as operações em lotes."""
+
+    def __init__(self, app, chave=None):
+        self._app = app
+        self._chave = chave
+        self._fila = queue.Queue()
+        self._janela = app.config.get("ESCRITA_JANELA_MS", 2) / 1000
+        self._maximo = app.config.get("ESCRITA_MAXIMO_LOTE", 64)
+        self._thread = threading.Thread(
+            target=self._rodar, name=f"escritor-{chave or 'principal'}", daemon=True
+        )
+        self._thread.start()
+
+    def enviar(self, funcao, args):
+        futuro = Future()
+        self._fila.put(Operacao(funcao, args, futuro))
+        return futuro
+
+    def _proximo_lote(self):
+        lote = [self._fila.get()]
+        prazo = time.monotonic() + self._janela
+        while len(lote) < self._maximo:
+            restante = prazo - time.monotonic()
+            try:
+                lote.append(
+                    self._fila.get(timeout=restante) if restante > 0
+                    else self._fila.get_nowait()
+                )
+            except queue.Empty:
+                break
+        return lote
+
+    def _rodar(self):
+        # O contexto da thread é só dela: o shard vale para todos os lotes
+        shard_atual.set(self._chave)
+        while True:
+            lote = self._proximo_lote()
+            with self._app.app_context():
+                self._gravar(lote)
+
+    def _gravar(self, lote):
+        resultados = []
+        medicoes = []
+        try:
+            for operacao in lote:
+                if not operacao.futuro.set_running_or_notify_cancel():
+                    continue
+                # Lida pela requisição depois do set_result/set_exception
+                with metrics.medindo_sql() as medicao:
+                    operacao.futuro.medicao_sql = medicao
+                    medicoes.append(medicao)
+                    try:
+                        with db.session.begin_nested():
+                            resultado = operacao.funcao(*operacao.args)
+                    except Exception as e:
+                        # Só esta operação é desfeita; o lote segue
+                        operacao.futuro.set_exception(e)
+                    else:
+                        resultados.append((operacao.futuro, resultado))
+            # Todas as operações esperaram pelo commit: o tempo vai para cada uma
+            with metrics.medindo_sql() as commit:
+                db.session.commit()
+        except Exception as e:
+            # Falha no commit (ou fora dos savepoints): o lote inteiro falha
+            db.session.rollback()
+            for futuro, _ in resultados:
+                futuro.set_exception(e)
+            for operacao in lote:
+                if not operacao.futuro.done():
+                    operacao.futuro.set_exception(e)
+            return
+
+        for medicao in medicoes:
+            medicao.somar(commit)
+        for futuro, resultado in resultados:
+            futuro.set_result(resultado)
+
+
+_escritores = {}
+_lock = threading.Lock()
+
+
+def _obter_escritor(chave):
+    with _lock:
+        if chave not in _escritores:
+            _escritores[chave] = Escritor(current_app._get_current_object(), chave)
+        return _escritores[chave]
+
+
+def _esquecer_escritor_no_filho():
+    # As threads não sobrevivem ao fork: cada worker cria as suas
+    global _escritores, _lock
+    _escritores = {}
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_esquecer_escritor_no_filho)
@@ -0,0 +1,117 @@
+"""
+Exportação do histórico de compras em CSV ou NDJSON.
+
+Uma linha por item (listas sem itens saem com as colunas de item vazias),
+na ordem de lista e item. A consulta é lida com ``yield_per``: as linhas
+vão do cursor para a resposta em pedaços, sem materializar o resultado, e o
+primeiro pedaço sai antes de a consulta terminar. A exportação de todos os
+usuários percorre os shards em sequência (app/shards.py).
+"""
+import csv
+import io
+import json
+
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from . import db, shards
+from .models import Item, Lista, Produto, Supermercado
+
+
+FORMATOS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+COLUNAS = (
+    "listaId",
+    "userId",
+    "data",
+    "itemId",
+    "produto",
+    "valor",
+    "quantidade",
+    "supermercado",
+)
+
+# Linhas buscadas do cursor e escritas na resposta por vez
+TAMANHO_LOTE = 1000
+
+
+class FormatoInvalido(ValueError):
+    """Formato de exportação desconhecido; a mensagem vai para o cliente."""
+
+
+def validar_formato(formato):
+    if formato not in FORMATOS:
+        raise FormatoInvalido(
+            f"Formato inválido. Use um destes: {', '.join(FORMATOS)}."
+        )
+    return formato
+
+
+def _consulta(filtro):
+    return (
+        select(
+            Lista.id,
+            Lista.user_id,
+            Lista.data,
+            Item.id,
+            Produto.nome,
+            Item.valor,
+            Item.quantidade,
+            Supermercado.nome,
+        )
+        .outerjoin(Item, Item.lista_id == Lista.id)
+        .outerjoin(Produto, Produto.id == Item.produto_id)
+        .outerjoin(Supermercado, Supermercado.id == Item.supermercado_id)
+        .where(Lista.excluida_em.is_(None), *filtro)
+        .order_by(Lista.id, Item.id)
+        .execution_options(yield_per=TAMANHO_LOTE)
+    )
+
+
+def _lotes(filtro):
+    resultado = db.session.execute(_consulta(filtro))
+    try:
+        for lote in resultado.partitions():
+            yield [(linha[0], linha[1], linha[2].isoformat(), *linha[3:]) for linha in lote]
+    finally:
+        resultado.close()
+
+
+def _gerar_csv(lotes):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUNAS)
+    yield buffer.getvalue()
+
+    for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(lote)
+        yield buffer.getvalue()
+
+
+def _gerar_ndjson(lotes):
+    # As linhas só têm textos, números e nulos: o codificador C do json basta
+    codificar = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for lote in lotes:
+        yield "".join(codificar(dict(zip(COLUNAS, linha))) + "\n" for linha in lote)
+
+
+def resposta(filtro, formato, nome_arquivo, todos_os_shards=False):
+    """
+    Resposta em stream com as linhas das listas que satisfazem ``filtro``,
+    do shard em uso ou, com ``todos_os_shards``, de todos.
+    """
+    # O stream roda depois de a rota retornar: o shard é fixado aqui
+    if todos_os_shards:
+        lotes = shards.encadear(_lotes, filtro)
+    else:
+        lotes = shards.fixar(_lotes(filtro))
+    gerar = _gerar_csv if formato == "csv" else _gerar_ndjson
+    response = Response(
+        stream_with_context(gerar(lotes)), mimetype=FORMATOS[formato]
+    )
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="{nome_arquivo}.{formato}"'
+    )
+    return response
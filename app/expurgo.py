@@ -0,0 +1,164 @@
+"""
+Expurgo das listas excluídas em massa.
+
+``POST /api/listas/excluir`` só marca as listas (``excluida_em``): apagá-las
+na requisição seguraria o lock de escrita do SQLite enquanto o banco remove
+todos os itens delas. O expurgo apaga as listas marcadas em transações de
+até ``EXPURGO_LOTE`` listas, com uma pausa de ``EXPURGO_PAUSA_MS`` entre
+elas para as outras escritas passarem. Cada transação tira as listas dos
+resumos e as apaga com um único DELETE; os itens vão junto, pela chave
+estrangeira com ON DELETE CASCADE.
+
+Com ``EXPURGO_EM_SEGUNDO_PLANO``, ``agendar`` acorda uma thread do processo
+e retorna na hora; desligado, o expurgo roda inteiro dentro de ``agendar``.
+Cada expurgo apaga todas as listas marcadas, inclusive as que sobraram de
+um processo encerrado antes de terminar (``flask listas expurgar`` também
+faz isso). Até lá, gasto mensal e preços ainda contam as listas marcadas.
+Com shards (app/shards.py), o expurgo percorre um shard de cada vez.
+
+``expurgar_marcas`` apaga, também em lotes, as marcas de exclusão da
+sincronização incremental mais antigas que ``EXCLUSOES_RETENCAO_DIAS``
+(``flask listas expurgar-marcas``, para rodar periodicamente). Cada usuário
+guarda a maior revisão apagada (``versao_listas.exclusoes_ate``): quem
+sincroniza a partir de antes dela recebe as listas todas de novo.
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, select, update
+
+from . import db, escrita, resumos, shards
+from .models import Exclusao, Lista, VersaoListas, agora
+
+
+def expurgar_lote(limite):
+    """Apaga até ``limite`` listas marcadas, sem commit. Retorna quantas."""
+    ids = db.session.execute(
+        select(Lista.id).where(Lista.excluida_em.is_not(None)).limit(limite)
+    ).scalars().all()
+    if ids:
+        resumos.registrar_exclusoes(ids)
+        db.session.execute(
+            delete(Lista).where(Lista.id.in_(ids)),
+            execution_options={"synchronize_session": False},
+        )
+    return len(ids)
+
+
+def expurgar_marcas_lote(corte, limite):
+    """
+    Apaga até ``limite`` marcas de exclusão anteriores a ``corte``, sem
+    commit, e avança ``exclusoes_ate`` dos donos delas. Retorna quantas.
+    """
+    marcas = db.session.execute(
+        select(Exclusao.id, Exclusao.user_id, Exclusao.revisao)
+        .where(Exclusao.excluido_em < corte)
+        .limit(limite)
+    ).all()
+    if marcas:
+        ate = {}
+        for _, user_id, revisao in marcas:
+            ate[user_id] = max(revisao, ate.get(user_id, 0))
+        tabela = VersaoListas.__table__
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.user_id == bindparam("dono"))
+            .values(exclusoes_ate=func.max(tabela.c.exclusoes_ate, bindparam("ate"))),
+            [{"dono": user_id, "ate": revisao} for user_id, revisao in ate.items()],
+        )
+        db.session.execute(
+            delete(Exclusao).where(Exclusao.id.in_([marca.id for marca in marcas])),
+            execution_options={"synchronize_session": False},
+        )
+    return len(marcas)
+
+
+def _em_lotes(funcao, *args):
+    limite = current_app.config.get("EXPURGO_LOTE", 200)
+    pausa = current_app.config.get("EXPURGO_PAUSA_MS", 20) / 1000
+
+    total = 0
+    for indice in shards.indices():
+        with shards.usar(indice):
+            while True:
+                apagadas = escrita.executar(funcao, *args, limite)
+                total += apagadas
+                if apagadas < limite:
+                    break
+                time.sleep(pausa)
+    return total
+
+
+def expurgar():
+    """Apaga todas as listas marcadas, um lote por transação. Retorna quantas."""
+    return _em_lotes(expurgar_lote)
+
+
+def expurgar_marcas(dias=None):
+    """
+    Apaga as marcas de exclusão com mais de ``dias`` (padrão:
+    ``EXCLUSOES_RETENCAO_DIAS``), um lote por transação. Retorna quantas.
+    """
+    if dias is None:
+        dias = current_app.config.get("EXCLUSOES_RETENCAO_DIAS", 90)
+    return _em_lotes(expurgar_marcas_lote, agora() - timedelta(days=dias))
+
+
+def agendar():
+    """Expurga as listas marcadas, em segundo plano ou na hora (ver o módulo)."""
+    if not current_app.config.get("EXPURGO_EM_SEGUNDO_PLANO"):
+        expurgar()
+        return
+    _obter_expurgador().acordar()
+
+
+class Expurgador:
+    """Thread que roda ``expurgar`` sempre que é acordada."""
+
+    def __init__(self, app):
+        self._app = app
+        self._pendente = threading.Event()
+        self._thread = threading.Thread(
+            target=self._rodar, name="expurgo", daemon=True
+        )
+        self._thread.start()
+
+    def acordar(self):
+        # Pedidos que chegam durante um expurgo viram uma única rodada extra
+        self._pendente.set()
+
+    def _rodar(self):
+        while True:
+            self._pendente.wait()
+            self._pendente.clear()
+            try:
+                with self._app.app_context():
+                    expurgar()
+            except Exception:
+                # As listas continuam marcadas: o próximo pedido tenta de novo
+                self._app.logger.exception("Falha no expurgo de listas excluídas")
+
+
+_expurgador = None
+_lock = threading.Lock()
+
+
+def _obter_expurgador():
+    global _expurgador
+    with _lock:
+        if _expurgador is None:
+            _expurgador = Expurgador(current_app._get_current_object())
+        return _expurgador
+
+
+def _esquecer_expurgador_no_filho():
+    # A thread não sobrevive ao fork: cada worker cria a sua
+    global _expurgador, _lock
+    _expurgador = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_esquecer_expurgador_no_filho)
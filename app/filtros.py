@@ -0,0 +1,163 @@
+"""
+Filtro combinado de listas com contagens por faceta.
+
+``GET /api/listas/filtro`` aceita ``supermercado``, ``userId``, ``de`` e
+``ate`` (sobre a data da lista) e ``precoMin`` e ``precoMax`` (sobre o valor
+do item). Uma lista entra no resultado se satisfaz os filtros de lista e tem
+ao menos um item que satisfaz, ao mesmo tempo, todos os filtros de item;
+só esses itens vêm na resposta. As facetas contam as listas do resultado
+por supermercado e por mês, com agregações no banco.
+
+É exigido ao menos um filtro: cada um tem um índice que delimita a
+consulta, e sem nenhum ela percorreria todas as listas. O supermercado é
+resolvido à parte, por ``resolver``, no catálogo de cada shard.
+"""
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+from flask import request
+from sqlalchemy import distinct, func, select
+
+from . import catalogo, db
+from .models import Item, Lista, Supermercado
+
+
+class FiltroInvalido(ValueError):
+    """Parâmetro de filtro inválido; a mensagem vai para o cliente."""
+
+
+PARAMETROS = ("supermercado", "userId", "de", "ate", "precoMin", "precoMax")
+
+# Tamanho da página quando limit não é enviado
+LIMITE_PADRAO = 50
+
+# Condições sobre Lista, condições sobre Item, se o resultado é vazio de
+# antemão (supermercado fora do catálogo) e o supermercado ainda não
+# resolvido no catálogo
+Filtros = namedtuple("Filtros", "lista itens vazio supermercado")
+
+
+def _numero(nome, tipo):
+    try:
+        return tipo(request.args[nome])
+    except ValueError:
+        raise FiltroInvalido(f"O parâmetro {nome} deve ser um número válido.")
+
+
+def _data(nome):
+    texto = request.args[nome]
+    try:
+        valor = datetime.fromisoformat(texto)
+    except ValueError:
+        raise FiltroInvalido(f"O parâmetro {nome} deve ser uma data ISO 8601.")
+    # Só a data: ``ate`` inclui o dia inteiro
+    return valor, len(texto) == 10
+
+
+def ler_filtros():
+    """
+    Lê os filtros da query string; levanta ``FiltroInvalido``. O resultado
+    passa por ``resolver`` antes de ir para as consultas.
+    """
+    enviados = [nome for nome in PARAMETROS if request.args.get(nome)]
+    if not enviados:
+        raise FiltroInvalido(f"Informe ao menos um filtro: {', '.join(PARAMETROS)}.")
+
+    lista, itens = [], []
+    if "userId" in enviados:
+        lista.append(Lista.user_id == _numero("userId", int))
+    if "de" in enviados:
+        lista.append(Lista.data >= _data("de")[0])
+    if "ate" in enviados:
+        ate, dia_inteiro = _data("ate")
+        lista.append(
+            Lista.data < ate + timedelta(days=1) if dia_inteiro else Lista.data <= ate
+        )
+
+    if "precoMin" in enviados:
+        itens.append(Item.valor >= _numero("precoMin", float))
+    if "precoMax" in enviados:
+        itens.append(Item.valor <= _numero("precoMax", float))
+
+    return Filtros(lista, itens, False, request.args.get("supermercado") or None)
+
+
+def resolver(filtros):
+    """Troca o nome do supermercado pelo id no catálogo do shard em uso."""
+    if filtros.supermercado is None:
+        return filtros
+    supermercado_id = catalogo.id_supermercado_existente(filtros.supermercado)
+    return Filtros(
+        filtros.lista,
+        [*filtros.itens, Item.supermercado_id == supermercado_id],
+        supermercado_id is None,
+        None,
+    )
+
+
+def juntar_facetas(facetas_por_shard):
+    """Soma as facetas calculadas em cada shard."""
+    if len(facetas_por_shard) == 1:
+        return facetas_por_shard[0]
+
+    supermercados, meses = Counter(), Counter()
+    for facetas_shard in facetas_por_shard:
+        for faceta in facetas_shard["supermercados"]:
+            supermercados[faceta["supermercado"]] += faceta["listas"]
+        for faceta in facetas_shard["meses"]:
+            meses[faceta["mes"]] += faceta["listas"]
+    return {
+        "supermercados": [
+            {"supermercado": nome, "listas": listas}
+            for nome, listas in sorted(supermercados.items(), key=lambda f: (-f[1], f[0]))
+        ],
+        "meses": [{"mes": mes, "listas": listas} for mes, listas in sorted(meses.items())],
+    }
+
+
+def condicoes_das_listas(filtros):
+    """Condições sobre Lista equivalentes a ``filtros`` (listas distintas)."""
+    condicoes = [Lista.excluida_em.is_(None), *filtros.lista]
+    if filtros.itens:
+        # Subconsulta em vez de join: cada lista aparece uma única vez
+        condicoes.append(Lista.id.in_(select(Item.lista_id).where(*filtros.itens)))
+    return condicoes
+
+
+def facetas(filtros):
+    """Quantidade de listas do resultado por supermercado e por mês."""
+    if filtros.vazio:
+        return {"supermercados": [], "meses": []}
+
+    # Agrupar por uma expressão (e não pela coluna) impede o SQLite de
+    # percorrer o índice de supermercado inteiro só para obter a ordem do
+    # GROUP BY; a busca segue pelo índice dos filtros
+    supermercado_id = (Item.supermercado_id + 0).label("supermercado_id")
+    por_supermercado = (
+        select(supermercado_id, func.count(distinct(Item.lista_id)).label("listas"))
+        .join(Lista, Lista.id == Item.lista_id)
+        .where(Lista.excluida_em.is_(None), *filtros.lista, *filtros.itens)
+        .group_by(supermercado_id)
+        .subquery()
+    )
+
+    supermercados = db.session.execute(
+        select(Supermercado.nome, por_supermercado.c.listas)
+        .join(por_supermercado, por_supermercado.c.supermercado_id == Supermercado.id)
+        .order_by(por_supermercado.c.listas.desc(), Supermercado.nome)
+    )
+
+    mes = func.strftime("%Y-%m", Lista.data).label("mes")
+    meses = db.session.execute(
+        select(mes, func.count().label("listas"))
+        .where(*condicoes_das_listas(filtros))
+        .group_by(mes)
+        .order_by(mes)
+    )
+
+    return {
+        "supermercados": [
+            {"supermercado": nome, "listas": listas} for nome, listas in supermercados
+        ],
+        "meses": [{"mes": mes, "listas": listas} for mes, listas in meses],
+    }
@@ -0,0 +1,672 @@
+import json
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from . import cache, catalogo, db, resumos, shards, sincronizacao
+from .models import Item, Lista, User, agora
+
+
+CAMPOS_ITEM = ("produto", "valor", "quantidade", "supermercado")
+
+# Colunas gravadas em item: produto e supermercado viram ids dos catálogos
+COLUNAS_ITEM = ("produto_id", "valor", "quantidade", "supermercado_id")
+
+# Listas gravadas por commit na importação em massa
+TAMANHO_LOTE_IMPORTACAO = 500
+
+# Operações aceitas por requisição em POST /api/listas/lote
+MAXIMO_OPERACOES_LOTE = 500
+
+# Prefixo que marca, em listaId, uma lista criada antes no mesmo lote
+PREFIXO_REFERENCIA = "$"
+
+# Ids aceitos por requisição em POST /api/listas/excluir
+MAXIMO_IDS_EXCLUSAO = 10000
+
+
+class DadosInvalidos(ValueError):
+    """Payload de lista inválido; a mensagem vai para o cliente."""
+
+
+class ListaNaoEncontrada(LookupError):
+    """Lista inexistente (404)."""
+
+
+class OperacaoDoLoteFalhou(Exception):
+    """Operação de um lote atômico falhou; o lote inteiro é desfeito."""
+
+    def __init__(self, indice, erro):
+        super().__init__(f"Operação {indice} falhou: {erro}")
+        self.indice = indice
+        self.erro = erro
+
+
+def validar_lista(data):
+    """
+    Valida o payload de criação de uma lista.
+
+    Retorna ``(user_id, data_criacao, itens)`` ou levanta ``DadosInvalidos``.
+    """
+    if not isinstance(data, dict):
+        raise DadosInvalidos("O corpo da lista deve ser um objeto JSON.")
+
+    user_id = data.get("userId")
+    itens_data = data.get("itens", [])
+
+    # Validação de campos obrigatórios
+    if not user_id or not itens_data:
+        raise DadosInvalidos("Campos obrigatórios estão faltando: userId ou itens")
+
+    try:
+        data_criacao = datetime.fromisoformat(data.get("data"))
+    except (TypeError, ValueError):
+        raise DadosInvalidos("Formato de data inválido. Use ISO 8601.")
+
+    if not isinstance(itens_data, list):
+        raise DadosInvalidos("itens deve ser uma lista.")
+    for item in itens_data:
+        validar_item(item)
+
+    return user_id, data_criacao, itens_data
+
+
+def _eh_numero(valor):
+    # bool é subclasse de int, mas true/false não são valores de item
+    return (
+        isinstance(valor, (int, float))
+        and not isinstance(valor, bool)
+        and math.isfinite(valor)
+    )
+
+
+def validar_item(item):
+    if not isinstance(item, dict) or not all(k in item for k in CAMPOS_ITEM):
+        raise DadosInvalidos("Dados do item incompletos.")
+    if not isinstance(item["produto"], str) or not isinstance(item["supermercado"], str):
+        raise DadosInvalidos("Produto e supermercado devem ser textos.")
+    if not _eh_numero(item["valor"]):
+        raise DadosInvalidos("O valor do item deve ser um número.")
+    if not _eh_numero(item["quantidade"]) or item["quantidade"] <= 0:
+        raise DadosInvalidos("A quantidade do item deve ser um número maior que zero.")
+
+
+def codificar_itens(itens_data):
+    """
+    Converte itens do payload em valores de colunas de ``item``.
+
+    Produtos e supermercados de todos os itens são resolvidos de uma vez
+    nos catálogos. Toda escrita de itens passa por aqui antes dos resumos:
+    os itens são validados (``validar_item``) mesmo que já tenham sido antes.
+    """
+    if not isinstance(itens_data, list):
+        raise DadosInvalidos("itens deve ser uma lista.")
+    for item in itens_data:
+        validar_item(item)
+    produtos = catalogo.ids_produtos({item["produto"] for item in itens_data})
+    supermercados = catalogo.ids_supermercados(
+        {item["supermercado"] for item in itens_data}
+    )
+    return [
+        {
+            "produto_id": produtos[item["produto"]],
+            "valor": item["valor"],
+            "quantidade": item["quantidade"],
+            "supermercado_id": supermercados[item["supermercado"]],
+        }
+        for item in itens_data
+    ]
+
+
+def criar(user_id, data_criacao, itens_data):
+    """
+    Cria a lista e os itens na transação corrente, sem commit.
+
+    Os dados já devem ter passado por ``validar_lista``. Retorna o id da lista.
+    """
+    revisao = _incrementar_versao(user_id)
+    lista_id = db.session.execute(
+        insert(Lista)
+        .values(user_id=user_id, data=data_criacao, revisao=revisao)
+        .returning(Lista.id)
+    ).scalar_one()
+    linhas = codificar_itens(itens_data)
+    db.session.execute(
+        insert(Item),
+        [dict(linha, lista_id=lista_id, revisao=revisao) for linha in linhas],
+    )
+
+    resumos.registrar_listas([(lista_id, user_id, data_criacao, linhas)])
+    return lista_id
+
+
+def atualizar(lista, data):
+    """
+    Aplica o payload de ``PUT /api/listas/<id>`` à lista, sem commit.
+
+    Quando ``itens`` é enviado, ele passa a ser o conteúdo completo da lista
+    (ver ``sincronizar_itens``).
+    """
+    if not isinstance(data, dict):
+        raise DadosInvalidos("O corpo da lista deve ser um objeto JSON.")
+
+    nova_data = lista.data
+    if "data" in data:
+        try:
+            nova_data = datetime.fromisoformat(data["data"])
+        except (TypeError, ValueError):
+            raise DadosInvalidos("Formato de data inválido. Use ISO 8601.")
+
+    # A lista pode mudar de dono: invalida o cache dos dois usuários, e para
+    # o dono anterior ela passa a constar como excluída
+    dono_anterior = lista.user_id
+    dono = data.get("userId", dono_anterior)
+    if dono != dono_anterior and shards.do_usuario(dono) != shards.atual():
+        raise DadosInvalidos(
+            f"O usuário {dono} está em outro shard: a lista não pode passar para ele."
+        )
+    revisao = _incrementar_versao(dono)
+    if dono != dono_anterior:
+        sincronizacao.registrar_exclusao_lista(
+            dono_anterior, cache.incrementar_versao(dono_anterior), lista.id
+        )
+    # Atribuídos juntos, depois das consultas acima: um único UPDATE na lista
+    lista.user_id = dono
+    lista.data = nova_data
+    lista.revisao = revisao
+
+    resumos.registrar_movimentacao(lista.id, lista.user_id, lista.data)
+
+    if "itens" in data:
+        sincronizar_itens(lista.id, data["itens"], dono, revisao)
+    if dono != dono_anterior:
+        # O novo dono ainda não tem nenhum item da lista
+        db.session.execute(
+            update(Item)
+            .where(Item.lista_id == lista.id)
+            .values(revisao=revisao, atualizado_em=agora()),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def _incrementar_versao(user_id):
+    # Primeira escrita que referencia o usuário: com as chaves estrangeiras
+    # ligadas, é aqui que um userId inexistente falha
+    try:
+        revisao = cache.incrementar_versao(user_id)
+    except IntegrityError:
+        raise DadosInvalidos(f"Usuário {user_id} não encontrado.")
+    # Já com o lock de escrita do shard: se o usuário não mudou de shard até
+    # aqui, não muda mais antes do commit
+    shards.conferir([user_id])
+    return revisao
+
+
+def excluir(lista):
+    """
+    Exclui a lista, sem commit. Os itens não são carregados: o banco os
+    apaga junto, pela chave estrangeira com ON DELETE CASCADE.
+    """
+    resumos.registrar_exclusao(lista.id)
+    revisao = cache.incrementar_versao(lista.user_id)
+    sincronizacao.registrar_exclusao_lista(lista.user_id, revisao, lista.id)
+    db.session.delete(lista)
+
+
+def _obter(lista_id):
+    lista = db.session.get(Lista, lista_id)
+    # Listas excluídas em massa esperam o expurgo, mas já não existem
+    if lista is None or lista.excluida_em is not None:
+        raise ListaNaoEncontrada(f"Lista {lista_id} não encontrada.")
+    return lista
+
+
+def atualizar_por_id(lista_id, data):
+    """``atualizar`` a partir do id; levanta ``ListaNaoEncontrada``."""
+    atualizar(_obter(lista_id), data)
+
+
+def excluir_por_id(lista_id):
+    """``excluir`` a partir do id; levanta ``ListaNaoEncontrada``."""
+    excluir(_obter(lista_id))
+
+
+def validar_exclusao_em_massa(data):
+    """
+    Valida o payload de ``POST /api/listas/excluir``: ``ids`` (lista de
+    ids), ``userId`` e ``antesDe`` (data ISO 8601; listas com data anterior
+    a ela). Os critérios enviados se somam; ao menos um é obrigatório.
+
+    Retorna os critérios para ``marcar_exclusao`` ou levanta
+    ``DadosInvalidos``.
+    """
+    if not isinstance(data, dict):
+        raise DadosInvalidos("O corpo deve ser um objeto JSON.")
+
+    criterios = {}
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids
+        ):
+            raise DadosInvalidos("ids deve ser uma lista de ids.")
+        if len(ids) > MAXIMO_IDS_EXCLUSAO:
+            raise DadosInvalidos(f"No máximo {MAXIMO_IDS_EXCLUSAO} ids por requisição.")
+        criterios["ids"] = ids
+    if "userId" in data:
+        if not isinstance(data["userId"], int) or isinstance(data["userId"], bool):
+            raise DadosInvalidos("userId deve ser um id.")
+        criterios["user_id"] = data["userId"]
+    if "antesDe" in data:
+        try:
+            criterios["antes_de"] = datetime.fromisoformat(data["antesDe"])
+        except (TypeError, ValueError):
+            raise DadosInvalidos("Formato de data inválido em antesDe. Use ISO 8601.")
+
+    if not criterios:
+        raise DadosInvalidos("Informe ao menos um critério: ids, userId ou antesDe.")
+    return criterios
+
+
+def shards_da_exclusao(criterios):
+    """Shards onde ``marcar_exclusao`` pode encontrar listas."""
+    if "ids" in criterios:
+        return sorted(
+            {indice for indice in map(shards.da_lista, criterios["ids"]) if indice is not None}
+        )
+    if "user_id" in criterios:
+        return [shards.do_usuario(criterios["user_id"])]
+    return list(shards.indices())
+
+
+def marcar_exclusao(criterios):
+    """
+    Marca como excluídas as listas que satisfazem ``criterios`` (de
+    ``validar_exclusao_em_massa``), sem commit.
+
+    As listas somem das leituras e da sincronização na hora (com marcas de
+    exclusão para os donos), mas continuam no banco, com itens e resumos,
+    até o expurgo (app/expurgo.py). Retorna quantas listas foram marcadas.
+    """
+    condicoes = [Lista.excluida_em.is_(None)]
+    if "ids" in criterios:
+        condicoes.append(Lista.id.in_(criterios["ids"]))
+    if "user_id" in criterios:
+        condicoes.append(Lista.user_id == criterios["user_id"])
+    if "antes_de" in criterios:
+        condicoes.append(Lista.data < criterios["antes_de"])
+
+    # Com shards, só as listas do shard em uso (ver ``shards_da_exclusao``)
+    marcadas = db.session.execute(
+        update(Lista)
+        .where(*condicoes)
+        .values(excluida_em=agora())
+        .returning(Lista.id, Lista.user_id),
+        execution_options={"synchronize_session": False},
+    ).all()
+    if not marcadas:
+        return 0
+
+    revisoes = {
+        user_id: cache.incrementar_versao(user_id)
+        for user_id in {user_id for _, user_id in marcadas}
+    }
+    sincronizacao.registrar_exclusao_listas(
+        [(user_id, revisoes[user_id], lista_id) for lista_id, user_id in marcadas]
+    )
+    return len(marcadas)
+
+
+def sincronizar_itens(lista_id, itens_data, user_id, revisao):
+    """
+    Faz a lista ``lista_id`` passar a conter exatamente ``itens_data``.
+
+    Os itens atuais são lidos em uma única consulta e comparados com o
+    payload: itens sem ``id`` são inseridos, itens com ``id`` são atualizados
+    apenas se algum campo mudou e itens ausentes do payload são removidos.
+    Cada grupo é aplicado com um único comando em lote. Itens inseridos e
+    atualizados recebem ``revisao``; os removidos ganham marcas de exclusão
+    para ``user_id``, o dono da lista. Retorna as quantidades de itens
+    inseridos, atualizados e removidos.
+    """
+    # Validados antes da leitura dos itens atuais
+    valores_novos = codificar_itens(itens_data)
+
+    atuais = {
+        linha.id: linha._asdict()
+        for linha in db.session.execute(
+            db.select(Item.id, *(getattr(Item, coluna) for coluna in COLUNAS_ITEM)).where(
+                Item.lista_id == lista_id
+            )
+        )
+    }
+
+    novos, alterados, mantidos = [], [], set()
+    for item, valores in zip(itens_data, valores_novos):
+        item_id = item.get("id")
+
+        if item_id is None:
+            novos.append({"lista_id": lista_id, "revisao": revisao, **valores})
+            continue
+
+        atual = atuais.get(item_id)
+        if atual is None:
+            raise DadosInvalidos(f"Item {item_id} não pertence à lista {lista_id}.")
+        if item_id in mantidos:
+            raise DadosInvalidos(f"Item {item_id} repetido no payload.")
+        mantidos.add(item_id)
+
+        if any(atual[coluna] != valor for coluna, valor in valores.items()):
+            alterados.append(
+                {"id": item_id, "revisao": revisao, "atualizado_em": agora(), **valores}
+            )
+
+    removidos = [item_id for item_id in atuais if item_id not in mantidos]
+
+    resumos.registrar_alteracao_itens(
+        lista_id,
+        adicionados=novos + alterados,
+        removidos=[atuais[linha["id"]] for linha in alterados]
+        + [atuais[item_id] for item_id in removidos],
+    )
+
+    if novos:
+        db.session.execute(insert(Item), novos)
+    if alterados:
+        db.session.execute(update(Item), alterados)
+    if removidos:
+        db.session.execute(
+            delete(Item).where(Item.id.in_(removidos)),
+            execution_options={"synchronize_session": False},
+        )
+        sincronizacao.registrar_exclusao_itens(user_id, revisao, lista_id, removidos)
+
+    return {
+        "inseridos": len(novos),
+        "atualizados": len(alterados),
+        "removidos": len(removidos),
+    }
+
+
+def importar_ndjson(linhas, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    """
+    Importa listas a partir de um iterável de linhas NDJSON (uma lista por linha).
+
+    As linhas são validadas conforme chegam e gravadas em lotes com INSERTs
+    de várias linhas, com um commit a cada ``tamanho_lote`` listas. Linhas
+    inválidas não interrompem a importação: voltam em ``erros`` com o número
+    da linha.
+    """
+    resultado = {"listas": 0, "itens": 0, "erros": []}
+    lote = []
+
+    for numero, linha in enumerate(linhas, start=1):
+        if isinstance(linha, bytes):
+            linha = linha.decode("utf-8", errors="replace")
+        linha = linha.strip()
+        if not linha:
+            continue
+
+        try:
+            lote.append((numero, *validar_lista(json.loads(linha))))
+        except ValueError as e:  # json.JSONDecodeError e DadosInvalidos
+            mensagem = str(e) if isinstance(e, DadosInvalidos) else "JSON inválido."
+            resultado["erros"].append({"linha": numero, "error": mensagem})
+            continue
+
+        if len(lote) >= tamanho_lote:
+            _gravar_por_shard(lote, resultado)
+            lote = []
+
+    if lote:
+        _gravar_por_shard(lote, resultado)
+
+    return resultado
+
+
+def inserir_listas(listas_data, revisoes):
+    """
+    Insere listas já validadas, ``(user_id, data, itens)``, e os resumos
+    delas com INSERTs de várias linhas, sem commit. ``revisoes`` mapeia
+    cada user_id para a revisão gravada. Retorna ``(ids, quantidade_itens)``.
+    """
+    ids = db.session.execute(
+        insert(Lista).returning(Lista.id, sort_by_parameter_order=True),
+        [
+            {"user_id": user_id, "data": data, "revisao": revisoes[user_id]}
+            for user_id, data, _ in listas_data
+        ],
+    ).scalars().all()
+
+    # Catálogos resolvidos uma vez para o lote inteiro
+    linhas = iter(codificar_itens([item for *_, itens in listas_data for item in itens]))
+    linhas_por_lista = [
+        [
+            dict(next(linhas), lista_id=lista_id, revisao=revisoes[user_id])
+            for _ in itens_data
+        ]
+        for lista_id, (user_id, _, itens_data) in zip(ids, listas_data)
+    ]
+    itens = [linha for linhas_lista in linhas_por_lista for linha in linhas_lista]
+    if itens:
+        db.session.execute(insert(Item), itens)
+
+    resumos.registrar_listas(
+        [
+            (lista_id, user_id, data, linhas_lista)
+            for lista_id, (user_id, data, _), linhas_lista in zip(
+                ids, listas_data, linhas_por_lista
+            )
+        ]
+    )
+    return ids, len(itens)
+
+
+def _gravar_por_shard(lote, resultado):
+    # Usuários inexistentes derrubariam o INSERT do lote inteiro (chave
+    # estrangeira): as linhas deles são separadas antes, uma a uma
+    user_ids = {user_id for _, user_id, _, _ in lote}
+    existentes = {
+        user_id
+        for user_id, in shards.ler_principal(
+            db.select(User.id).where(User.id.in_(user_ids))
+        )
+    }
+    validas = []
+    for linha in lote:
+        if linha[1] in existentes:
+            validas.append(linha)
+        else:
+            resultado["erros"].append(
+                {"linha": linha[0], "error": f"Usuário {linha[1]} não encontrado."}
+            )
+    if not validas:
+        return
+
+    # Um commit por shard; sem shards, o lote inteiro vai para o principal
+    destinos = shards.dos_usuarios(user_id for _, user_id, _, _ in validas)
+    por_shard = defaultdict(list)
+    for linha in validas:
+        por_shard[destinos[linha[1]]].append(linha)
+    for indice, linhas in por_shard.items():
+        with shards.usar(indice):
+            _gravar_lote(linhas, resultado)
+
+
+def _gravar_lote(lote, resultado):
+    try:
+        revisoes = {
+            user_id: cache.incrementar_versao(user_id)
+            for user_id in {user_id for _, user_id, _, _ in lote}
+        }
+        shards.conferir(revisoes)
+        _, quantidade_itens = inserir_listas(
+            [(user_id, data, itens_data) for _, user_id, data, itens_data in lote],
+            revisoes,
+        )
+        db.session.commit()
+    except (SQLAlchemyError, shards.UsuarioMovido) as e:
+        # Sem como isolar a linha culpada dentro do INSERT em lote: o lote
+        # inteiro é descartado e cada linha dele é reportada. O erro do
+        # driver (com o SQL) fica só no log
+        db.session.rollback()
+        if isinstance(e, shards.UsuarioMovido):
+            mensagem = "Usuário mudando de shard. Tente novamente."
+        else:
+            current_app.logger.exception("Falha ao gravar lote da importação")
+            mensagem = "Erro no banco de dados ao gravar o lote."
+        resultado["erros"].extend(
+            {"linha": numero, "error": mensagem} for numero, *_ in lote
+        )
+        return
+
+    resultado["listas"] += len(lote)
+    resultado["itens"] += quantidade_itens
+
+
+def validar_lote(data):
+    """
+    Valida o payload de ``POST /api/listas/lote``.
+
+    ``{"atomico": true, "operacoes": [...]}``, onde cada operação é
+    ``{"op": "criar", "ref": "a", "lista": {...}}``,
+    ``{"op": "atualizar", "listaId": 12, "lista": {...}}`` ou
+    ``{"op": "excluir", "listaId": "$a"}``. ``listaId`` começando com ``$``
+    aponta para a lista criada com aquela ``ref`` antes, no mesmo lote.
+
+    Retorna ``(operacoes, atomico)`` ou levanta ``DadosInvalidos``.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("operacoes"), list):
+        raise DadosInvalidos("O corpo deve ter a lista de operacoes.")
+
+    operacoes = data["operacoes"]
+    if not operacoes:
+        raise DadosInvalidos("Nenhuma operação enviada.")
+    if len(operacoes) > MAXIMO_OPERACOES_LOTE:
+        raise DadosInvalidos(
+            f"No máximo {MAXIMO_OPERACOES_LOTE} operações por lote."
+        )
+
+    refs = set()
+    normalizadas = []
+    for indice, operacao in enumerate(operacoes):
+        try:
+            normalizadas.append(_validar_operacao(operacao, refs))
+        except DadosInvalidos as e:
+            raise DadosInvalidos(f"Operação {indice}: {e}")
+    return normalizadas, bool(data.get("atomico", True))
+
+
+def _validar_operacao(operacao, refs):
+    if not isinstance(operacao, dict):
+        raise DadosInvalidos("A operação deve ser um objeto JSON.")
+
+    tipo = operacao.get("op")
+    if tipo == "criar":
+        ref = operacao.get("ref")
+        if ref is not None:
+            if not isinstance(ref, str) or not ref:
+                raise DadosInvalidos("ref deve ser um texto.")
+            if ref in refs:
+                raise DadosInvalidos(f"ref {ref} repetida no lote.")
+            refs.add(ref)
+        return {"op": tipo, "ref": ref, "dados": validar_lista(operacao.get("lista"))}
+
+    if tipo not in ("atualizar", "excluir"):
+        raise DadosInvalidos("op deve ser criar, atualizar ou excluir.")
+
+    alvo = operacao.get("listaId")
+    if isinstance(alvo, str) and alvo.startswith(PREFIXO_REFERENCIA):
+        if alvo[len(PREFIXO_REFERENCIA):] not in refs:
+            raise DadosInvalidos(f"Referência {alvo} não foi criada antes no lote.")
+    elif not isinstance(alvo, int) or isinstance(alvo, bool):
+        raise DadosInvalidos("listaId deve ser um id ou uma referência $ref.")
+
+    dados = operacao.get("lista")
+    if tipo == "atualizar" and not isinstance(dados, dict):
+        raise DadosInvalidos("A operação atualizar exige o objeto lista.")
+    return {"op": tipo, "alvo": alvo, "dados": dados}
+
+
+def shard_do_lote(operacoes):
+    """
+    Índice do shard onde o lote roda: o lote é uma transação só, então
+    todas as listas e donos das operações devem estar no mesmo shard.
+    Levanta ``DadosInvalidos`` caso contrário.
+    """
+    usuarios = {
+        operacao["dados"][0] for operacao in operacoes if operacao["op"] == "criar"
+    }
+    destinos = set(shards.dos_usuarios(usuarios).values())
+    destinos.update(
+        shards.da_lista(operacao["alvo"])
+        for operacao in operacoes
+        if operacao["op"] != "criar" and isinstance(operacao["alvo"], int)
+    )
+    # Ids fora das faixas não existem em shard nenhum: a operação dá 404
+    destinos.discard(None)
+    if len(destinos) > 1:
+        raise DadosInvalidos("As operações do lote envolvem shards diferentes.")
+    return destinos.pop() if destinos else 0
+
+
+def executar_lote(operacoes, atomico):
+    """
+    Executa as operações de ``validar_lote`` em ordem, sem commit.
+
+    Atômico: a primeira falha levanta ``OperacaoDoLoteFalhou`` e nada é
+    gravado. Caso contrário, cada operação roda em um SAVEPOINT e as falhas
+    entram nos resultados sem afetar as demais. Retorna um resultado por
+    operação.
+    """
+    refs = {}
+    resultados = []
+    for indice, operacao in enumerate(operacoes):
+        try:
+            if atomico:
+                resultado = _executar_operacao(operacao, refs)
+            else:
+                with db.session.begin_nested():
+                    resultado = _executar_operacao(operacao, refs)
+        except (DadosInvalidos, ListaNaoEncontrada, SQLAlchemyError) as e:
+            if atomico:
+                raise OperacaoDoLoteFalhou(indice, e) from e
+            resultados.append({"indice": indice, "status": status_do_erro(e), "error": str(e)})
+            continue
+        resultados.append({"indice": indice, **resultado})
+    return resultados
+
+
+def _executar_operacao(operacao, refs):
+    if operacao["op"] == "criar":
+        lista_id = criar(*operacao["dados"])
+        if operacao["ref"] is not None:
+            refs[operacao["ref"]] = lista_id
+        return {"status": 201, "listaId": lista_id}
+
+    alvo = operacao["alvo"]
+    if isinstance(alvo, str):
+        ref = alvo[len(PREFIXO_REFERENCIA):]
+        if ref not in refs:
+            # Só acontece fora do modo atômico, se a criação falhou
+            raise DadosInvalidos(f"A lista {alvo} não foi criada.")
+        alvo = refs[ref]
+
+    if operacao["op"] == "atualizar":
+        atualizar_por_id(alvo, operacao["dados"])
+    else:
+        excluir_por_id(alvo)
+    return {"status": 200, "listaId": alvo}
+
+
+def status_do_erro(erro):
+    """Status HTTP correspondente à falha de uma operação do lote."""
+    if isinstance(erro, ListaNaoEncontrada):
+        return 404
+    if isinstance(erro, DadosInvalidos):
+        return 400
+    return 500
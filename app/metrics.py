@@ -0,0 +1,260 @@
+"""
+Instrumentação das requisições.
+
+Para cada requisição conta os comandos SQL e mede o tempo gasto no banco
+(hooks ``before/after_cursor_execute`` em todos os engines). Os números vão
+no cabeçalho ``Server-Timing`` da resposta e alimentam histogramas por rota,
+expostos em ``GET /metrics`` no formato texto do Prometheus. Comandos acima
+de ``LIMITE_CONSULTA_LENTA_MS`` são registrados no logger ``app.sql`` com o
+SQL normalizado.
+
+Os histogramas são por processo. Em respostas em stream, o corpo é gerado
+depois do ``after_request``: só entra o que foi executado até ali.
+
+Comandos que a requisição manda rodar em outras threads (a escritora do
+commit em grupo, as do ``shards.em_todos``) são contados nelas com
+``medindo_sql`` e devolvidos à requisição, que os soma com
+``acumular_na_requisicao``.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Blueprint, Response, g, has_request_context, request
+from sqlalchemy import event
+
+
+logger_sql = logging.getLogger("app.sql")
+
+# Limites superiores dos buckets (o +Inf é implícito)
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Comandos de controle de transação: entram no tempo de banco, mas não na
+# contagem de consultas
+COMANDOS_DE_CONTROLE = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_DE_PARAMETROS = re.compile(r"\?(?:\s*,\s*\?)+")
+_GRUPOS_REPETIDOS = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+
+
+def normalizar_sql(sql):
+    """
+    SQL com espaços colapsados, literais trocados por ``?`` e listas de
+    parâmetros (``IN``, ``VALUES`` de várias linhas) reduzidas a uma só, para
+    que comandos iguais com tamanhos de lote diferentes se agrupem.
+    """
+    sql = " ".join(sql.split())
+    sql = _LITERAIS.sub("?", sql)
+    sql = _LISTAS_DE_PARAMETROS.sub("?...", sql)
+    return _GRUPOS_REPETIDOS.sub(r"\1, ...", sql)
+
+
+class Histograma:
+    """Histograma cumulativo por conjunto de rótulos, seguro entre threads."""
+
+    def __init__(self, nome, ajuda, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, rotulos, valor):
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * len(self.buckets), 0, 0.0]
+            contagens = serie[0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            serie[1] += 1
+            serie[2] += valor
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = [(r, list(c), n, s) for r, (c, n, s) in self._series.items()]
+        for rotulos, contagens, total, soma in sorted(series):
+            base = ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos)
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{base},le="{limite}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{base},le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{base}}} {soma}")
+            linhas.append(f"{self.nome}_count{{{base}}} {total}")
+        return linhas
+
+
+class Contador:
+    """Contador simples, sem rótulos."""
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self):
+        with self._lock:
+            self.valor += 1
+
+    def exportar(self):
+        return [
+            f"# HELP {self.nome} {self.ajuda}",
+            f"# TYPE {self.nome} counter",
+            f"{self.nome} {self.valor}",
+        ]
+
+
+class MedicaoSql:
+    """Comandos SQL e tempo de banco de um trecho rodado fora da requisição."""
+
+    __slots__ = ("consultas", "tempo")
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo = 0.0
+
+    def somar(self, outra):
+        self.consultas += outra.consultas
+        self.tempo += outra.tempo
+
+
+# Medição em andamento na thread; tem precedência sobre a da requisição
+_medicao_atual = ContextVar("medicao_sql", default=None)
+
+
+@contextmanager
+def medindo_sql():
+    """Conta em um ``MedicaoSql`` os comandos executados no bloco, nesta thread."""
+    medicao = MedicaoSql()
+    token = _medicao_atual.set(medicao)
+    try:
+        yield medicao
+    finally:
+        _medicao_atual.reset(token)
+
+
+def acumular_na_requisicao(medicao):
+    """Soma à requisição em andamento os comandos medidos em outra thread."""
+    if medicao is not None and has_request_context() and "consultas_sql" in g:
+        g.consultas_sql += medicao.consultas
+        g.tempo_sql += medicao.tempo
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+duracao_requisicao = Histograma(
+    "http_request_duration_seconds",
+    "Tempo de resposta por rota (até o fim do handler).",
+    BUCKETS_DURACAO,
+)
+duracao_sql = Histograma(
+    "http_request_sql_duration_seconds",
+    "Tempo gasto no banco por requisição.",
+    BUCKETS_DURACAO,
+)
+consultas_por_requisicao = Histograma(
+    "http_request_sql_queries",
+    "Comandos SQL executados por requisição.",
+    BUCKETS_CONSULTAS,
+)
+consultas_lentas = Contador(
+    "sql_slow_queries_total", "Comandos SQL acima do limite de consulta lenta."
+)
+
+METRICAS = (duracao_requisicao, duracao_sql, consultas_por_requisicao, consultas_lentas)
+
+
+metricas = Blueprint("metricas", __name__)
+
+
+@metricas.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    linhas = []
+    for metrica in METRICAS:
+        linhas.extend(metrica.exportar())
+    return Response("\n".join(linhas) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def configurar_instrumentacao(app, db):
+    """Registra os hooks de SQL e de requisição. Chamar depois de ``db.init_app``."""
+    limite_lenta = app.config.get("LIMITE_CONSULTA_LENTA_MS", 200) / 1000
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        _registrar_hooks_sql(engine, limite_lenta)
+
+    @app.before_request
+    def iniciar_medicao():
+        g.inicio_requisicao = time.perf_counter()
+        g.consultas_sql = 0
+        g.tempo_sql = 0.0
+
+    @app.after_request
+    def registrar_medicao(response):
+        inicio = g.get("inicio_requisicao")
+        if inicio is None:
+            return response
+
+        duracao = time.perf_counter() - inicio
+        consultas = g.consultas_sql
+        tempo_sql = g.tempo_sql
+
+        response.headers["Server-Timing"] = (
+            f'db;dur={tempo_sql * 1000:.2f};desc="{consultas} consultas", '
+            f"app;dur={duracao * 1000:.2f}"
+        )
+
+        # A regra (não o caminho) mantém a cardinalidade dos rótulos fixa
+        rota = request.url_rule.rule if request.url_rule else "sem_rota"
+        rotulos = (("method", request.method), ("route", rota))
+        if rota != "/metrics":
+            duracao_requisicao.observar(rotulos, duracao)
+            duracao_sql.observar(rotulos, tempo_sql)
+            consultas_por_requisicao.observar(rotulos, consultas)
+        return response
+
+
+def _registrar_hooks_sql(engine, limite_lenta):
+    @event.listens_for(engine, "before_cursor_execute")
+    def antes(conn, cursor, sql, parametros, context, executemany):
+        conn.info.setdefault("inicio_comando", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "handle_error")
+    def erro(contexto):
+        # Comando que falhou não passa pelo after_cursor_execute
+        pilha = contexto.connection.info.get("inicio_comando") if contexto.connection else None
+        if pilha:
+            pilha.pop()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def depois(conn, cursor, sql, parametros, context, executemany):
+        duracao = time.perf_counter() - conn.info["inicio_comando"].pop()
+
+        consulta = not sql.lstrip().upper().startswith(COMANDOS_DE_CONTROLE)
+        medicao = _medicao_atual.get()
+        if medicao is not None:
+            medicao.tempo += duracao
+            medicao.consultas += consulta
+        elif has_request_context() and "consultas_sql" in g:
+            g.tempo_sql += duracao
+            g.consultas_sql += consulta
+
+        if duracao >= limite_lenta:
+            consultas_lentas.incrementar()
+            logger_sql.warning(
+                "Consulta lenta (%.1f ms)%s: %s",
+                duracao * 1000,
+                f" em {request.method} {request.path}" if has_request_context() else "",
+                normalizar_sql(sql),
+            )
@@ -1,8 +1,17 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from . import db
+from datetime import datetime, timezone
+
+from . import db, senhas
+
+
+def agora():
+    """Momento atual em UTC, sem fuso (o SQLite guarda datas como texto)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 class User(db.Model):
+    # Índice usado pelo login, que busca por nome e telefone
+    __table_args__ = (db.Index("ix_user_nome_telefone", "nome", "telefone"),)
+
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     telefone = db.Column(db.String(15), nullable=False)
@@ -13,11 +22,11 @@ class User(db.Model):
 
     def set_senha(self, senha):
         """Define a senha do usuário com hashing."""
-        self.senha_hash = generate_password_hash(senha)
+        self.senha_hash = senhas.gerar_hash(senha)
 
     def verificar_senha(self, senha):
         """Verifica a senha do usuário."""
-        return check_password_hash(self.senha_hash, senha)
+        return senhas.verificar(self.senha_hash, senha)
 
     def __repr__(self):
         return f"<User {self.nome}>"
@@ -25,23 +34,206 @@ class User(db.Model):
 
 class Lista(db.Model):
     __tablename__ = "listas"
+    __table_args__ = (
+        # (user_id, revisao) atende a sincronização incremental por usuário
+        db.Index("ix_listas_user_id_revisao", "user_id", "revisao"),
+        # Filtros por período, com ou sem usuário
+        db.Index("ix_listas_data", "data"),
+        db.Index("ix_listas_user_id_data", "user_id", "data"),
+        # Parcial: só as listas excluídas em massa que aguardam o expurgo
+        db.Index(
+            "ix_listas_excluida_em",
+            "excluida_em",
+            sqlite_where=db.text("excluida_em IS NOT NULL"),
+        ),
+        # Ids nunca reaproveitados e, com shards, numerados a partir da
+        # faixa de cada shard (ver app/shards.py)
+        {"sqlite_autoincrement": True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # Sem índice próprio: os índices compostos começam por user_id
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     data = db.Column(db.DateTime, nullable=False)
+    # Versão das listas do dono (versao_listas) na última escrita da lista
+    revisao = db.Column(db.Integer, nullable=False, default=0)
+    atualizada_em = db.Column(db.DateTime, nullable=False, default=agora, onupdate=agora)
+    # Preenchida pela exclusão em massa: a lista some das leituras na hora e
+    # é apagada depois, pelo expurgo (app/expurgo.py)
+    excluida_em = db.Column(db.DateTime, nullable=True)
     
-    # Relacionamento com Item, com cascata para excluir itens associados
-    itens = db.relationship("Item", backref="lista", lazy=True, cascade="all, delete-orphan")
+    # Relacionamento com Item. Os itens são apagados pelo banco (ON DELETE
+    # CASCADE): excluir a lista não os carrega na sessão
+    itens = db.relationship(
+        "Item",
+        backref="lista",
+        lazy=True,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
     
     # Relação com o modelo User
     user = db.relationship("User", backref="listas")  
 
 
 
+class Produto(db.Model):
+    """Catálogo de produtos: cada nome normalizado aparece uma única vez."""
+
+    __tablename__ = "produto"
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(120), nullable=False)
+    nome_normalizado = db.Column(db.String(120), unique=True, nullable=False)
+
+
+class Supermercado(db.Model):
+    """Catálogo de supermercados: cada nome normalizado aparece uma única vez."""
+
+    __tablename__ = "supermercado"
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(120), nullable=False)
+    nome_normalizado = db.Column(db.String(120), unique=True, nullable=False)
+
+
 class Item(db.Model):
+    # Cobrem as subconsultas de listas por supermercado e/ou faixa de preço
+    __table_args__ = (
+        db.Index(
+            "ix_item_supermercado_id_valor_lista_id",
+            "supermercado_id",
+            "valor",
+            "lista_id",
+        ),
+        db.Index("ix_item_valor_lista_id", "valor", "lista_id"),
+        {"sqlite_autoincrement": True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    produto = db.Column(db.String(120), nullable=False)
+    produto_id = db.Column(
+        db.Integer, db.ForeignKey("produto.id"), nullable=False, index=True
+    )
     valor = db.Column(db.Float, nullable=False)
     quantidade = db.Column(db.Integer, nullable=False)
-    supermercado = db.Column(db.String(120), nullable=False)
-    lista_id = db.Column(db.Integer, db.ForeignKey("listas.id"), nullable=False)
+    supermercado_id = db.Column(
+        db.Integer, db.ForeignKey("supermercado.id"), nullable=False
+    )
+    lista_id = db.Column(
+        db.Integer,
+        db.ForeignKey("listas.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # Revisão da lista na última escrita do item
+    revisao = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=agora, onupdate=agora)
+
+    # Nomes vêm dos catálogos, sempre carregados junto com o item
+    produto_catalogo = db.relationship("Produto", lazy="joined", innerjoin=True)
+    supermercado_catalogo = db.relationship(
+        "Supermercado", lazy="joined", innerjoin=True
+    )
+
+    @property
+    def produto(self):
+        return self.produto_catalogo.nome
+
+    @property
+    def supermercado(self):
+        return self.supermercado_catalogo.nome
+
+
+class VersaoListas(db.Model):
+    """Contador por usuário, incrementado a cada escrita nas listas dele."""
+
+    __tablename__ = "versao_listas"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+    # Marcas de exclusão com revisão até esta podem já ter sido expurgadas
+    # (app/expurgo.py): quem sincroniza de antes dela recebe tudo de novo
+    exclusoes_ate = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShardUsuario(db.Model):
+    """Diretório de shards: o banco das listas de cada usuário (app/shards.py)."""
+
+    __tablename__ = "shard_usuario"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False, index=True)
+
+
+class Exclusao(db.Model):
+    """
+    Marca de uma lista ou item excluído (ou de uma lista que mudou de dono),
+    para a sincronização incremental. ``item_id`` nulo indica a lista toda.
+    """
+
+    __tablename__ = "exclusao"
+    __table_args__ = (db.Index("ix_exclusao_user_id_revisao", "user_id", "revisao"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    revisao = db.Column(db.Integer, nullable=False)
+    lista_id = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer, nullable=True)
+    excluido_em = db.Column(db.DateTime, nullable=False, default=agora)
+
+
+class ResumoLista(db.Model):
+    """Total de cada lista, mantido incrementalmente pelas rotas de escrita."""
+
+    __tablename__ = "resumo_lista"
+
+    lista_id = db.Column(db.Integer, db.ForeignKey("listas.id"), primary_key=True)
+    # Dono e mês da lista, copiados para atualizar gasto_mensal sem ler listas
+    user_id = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.String(7), nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0)
+    quantidade_itens = db.Column(db.Integer, nullable=False, default=0)
+
+
+class GastoMensal(db.Model):
+    """Gasto de cada usuário por mês (``AAAA-MM``)."""
+
+    __tablename__ = "gasto_mensal"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    mes = db.Column(db.String(7), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    listas = db.Column(db.Integer, nullable=False, default=0)
+
+
+class PrecoProduto(db.Model):
+    """Estatísticas de preço de cada produto em cada supermercado."""
+
+    __tablename__ = "preco_produto"
+    __table_args__ = (
+        db.Index("ix_preco_produto_supermercado_id", "supermercado_id"),
+    )
+
+    produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), primary_key=True)
+    supermercado_id = db.Column(
+        db.Integer, db.ForeignKey("supermercado.id"), primary_key=True
+    )
+    soma_valor = db.Column(db.Float, nullable=False, default=0)
+    ocorrencias = db.Column(db.Integer, nullable=False, default=0)
+    # Versão de preços (versao_precos) da última escrita da linha
+    revisao = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class VersaoPrecos(db.Model):
+    """
+    Contador global das escritas em preco_produto, em uma única linha
+    (id 1). ``versao_remocao`` é a versão da última escrita que removeu
+    linhas (``resumos.recalcular``): quem leu os preços antes dela precisa
+    reler tudo.
+    """
+
+    __tablename__ = "versao_precos"
+
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+    versao_remocao = db.Column(db.Integer, nullable=False, default=0)
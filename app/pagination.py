@@ -0,0 +1,97 @@
+import itertools
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+
+
+LIMITE_MAXIMO = 500
+
+# Quantidade de linhas buscadas por vez no modo streaming
+TAMANHO_LOTE_STREAM = 500
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de paginação inválido; a mensagem vai para o cliente."""
+
+
+def _inteiro_positivo(nome, valor, minimo):
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise ParametroInvalido(f"O parâmetro {nome} deve ser um número válido.")
+    if valor < minimo:
+        raise ParametroInvalido(f"O parâmetro {nome} deve ser maior ou igual a {minimo}.")
+    return valor
+
+
+def parametros_pagina():
+    """
+    Lê ``limit`` e ``after`` da query string.
+
+    Retorna ``None`` quando nenhum dos dois foi enviado (resposta completa,
+    como antes) ou uma tupla ``(limite, apos)``.
+    """
+    limite = request.args.get("limit")
+    apos = request.args.get("after")
+    if limite is None and apos is None:
+        return None
+
+    limite = (
+        _inteiro_positivo("limit", limite, 1) if limite is not None else LIMITE_MAXIMO
+    )
+    apos = _inteiro_positivo("after", apos, 0) if apos is not None else 0
+    return min(limite, LIMITE_MAXIMO), apos
+
+
+def modo_stream():
+    return request.args.get("stream", "").lower() in ("1", "true", "sim")
+
+
+def paginar(query, coluna_id, limite, apos):
+    """
+    Aplica paginação por chave (keyset) sobre ``coluna_id``.
+
+    Retorna ``(registros, proximo)``, onde ``proximo`` é o valor a ser enviado
+    em ``after`` para a página seguinte, ou ``None`` na última página.
+    """
+    registros = query.filter(coluna_id > apos).order_by(coluna_id).limit(limite + 1).all()
+    if len(registros) > limite:
+        registros = registros[:limite]
+        return registros, registros[-1].id
+    return registros, None
+
+
+def resposta_paginada(dados, proximo):
+    response = jsonify(dados)
+    if proximo is not None:
+        response.headers["X-Next-Cursor"] = str(proximo)
+    return response
+
+
+def iterar_em_lotes(query, coluna_id, tamanho=TAMANHO_LOTE_STREAM):
+    """
+    Percorre a query com ``yield_per``, sem materializar todos os registros.
+
+    Retorna ``None`` se a query não tiver resultados, para que a rota ainda
+    possa responder 404 antes de começar o stream.
+    """
+    registros = iter(query.order_by(coluna_id).yield_per(tamanho))
+    try:
+        primeiro = next(registros)
+    except StopIteration:
+        return None
+    return itertools.chain([primeiro], registros)
+
+
+def resposta_em_stream(registros, serializar):
+    """Gera um array JSON em pedaços a partir de um iterador de registros."""
+    dumps = current_app.json.dumps
+
+    def gerar():
+        yield "["
+        for indice, registro in enumerate(registros):
+            if indice:
+                yield ","
+            yield dumps(serializar(registro))
+        yield "]"
+
+    return Response(stream_with_context(gerar()), mimetype="application/json")
@@ -0,0 +1,192 @@
+"""
+Verificação dos planos de consulta das rotas.
+
+Cria um banco SQLite temporário com as migrações do projeto, exercita cada
+rota pelo test client do Flask, captura o SQL executado e roda
+``EXPLAIN QUERY PLAN`` em cada comando. Qualquer varredura completa de
+tabela (``SCAN <tabela>``) fora das permitidas para a rota é reportada.
+"""
+import json
+import os
+import re
+import tempfile
+
+from flask_migrate import upgrade
+from sqlalchemy import event
+
+from . import create_app, db
+
+
+DIRETORIO_MIGRACOES = os.path.join(os.path.dirname(__file__), "..", "migrations")
+
+PADRAO_SCAN = re.compile(r"^SCAN (\w+)")
+
+# Comandos sem plano de consulta relevante
+PREFIXOS_IGNORADOS = ("INSERT", "PRAGMA", "SAVEPOINT", "RELEASE", "ROLLBACK", "BEGIN")
+
+
+def _cenarios():
+    """
+    Requisições exercitadas, na ordem: (método, caminho, kwargs, tabelas que
+    a rota pode varrer por completo).
+    """
+    lista = {
+        "userId": 1,
+        "data": "2024-01-01T10:00:00",
+        "itens": [
+            {"produto": "Arroz", "valor": 10.5, "quantidade": 1, "supermercado": "Extra"},
+            {"produto": "Feijão", "valor": 8.0, "quantidade": 2, "supermercado": "Dia"},
+        ],
+    }
+    usuario = {"nome": "Ana", "telefone": "11 90000-0000", "email": "ana@x.com", "senha": "s"}
+
+    return [
+        ("POST", "/api/users", {"json": usuario}, ()),
+        ("POST", "/api/login", {"json": usuario}, ()),
+        # Listar todos os usuários é, por definição, ler a tabela inteira
+        ("GET", "/api/users", {}, ("user",)),
+        ("GET", "/api/users?limit=10&after=0", {}, ()),
+        ("GET", "/api/users?stream=1", {}, ("user",)),
+        ("POST", "/api/listas", {"json": lista}, ()),
+        ("POST", "/api/listas/importar", {"data": json.dumps(lista) + "\n"}, ()),
+        (
+            "POST",
+            "/api/listas/lote",
+            {
+                "json": {
+                    "operacoes": [
+                        {"op": "criar", "ref": "a", "lista": lista},
+                        {"op": "atualizar", "listaId": "$a", "lista": {"data": "2024-02-01T00:00:00"}},
+                        {"op": "excluir", "listaId": "$a"},
+                    ]
+                }
+            },
+            (),
+        ),
+        ("GET", "/api/listas?userId=1", {}, ()),
+        ("GET", "/api/listas?userId=1&limit=1&after=0", {}, ()),
+        ("GET", "/api/listas?userId=1&stream=1", {}, ()),
+        ("GET", "/api/listas/changes?userId=1&since=0", {}, ()),
+        ("GET", "/api/listas/changes?userId=1&since=1", {}, ()),
+        ("GET", "/api/listas/usuario/1", {}, ()),
+        ("GET", "/api/listas/usuario/1?limit=1&after=0", {}, ()),
+        ("GET", "/api/listas/usuario/1?fields=id,itens.produto", {}, ()),
+        ("GET", "/api/listas/supermercado/Extra", {}, ()),
+        ("GET", "/api/listas/supermercado/Extra?limit=1&after=0", {}, ()),
+        ("GET", "/api/listas/filtro?supermercado=Extra", {}, ()),
+        ("GET", "/api/listas/filtro?supermercado=Extra&precoMin=1&precoMax=50", {}, ()),
+        ("GET", "/api/listas/filtro?precoMin=1&precoMax=50", {}, ()),
+        ("GET", "/api/listas/filtro?precoMax=5", {}, ()),
+        ("GET", "/api/listas/filtro?de=2024-01-01&ate=2024-12-31", {}, ()),
+        ("GET", "/api/listas/filtro?userId=1", {}, ()),
+        ("GET", "/api/listas/filtro?userId=1&de=2024-01-01", {}, ()),
+        ("GET", "/api/listas/filtro?userId=1&supermercado=Extra&limit=1&after=0", {}, ()),
+        ("GET", "/api/listas/filtro?de=2024-01-01&precoMin=1", {}, ()),
+        ("GET", "/api/listas/filtro?ate=2024-06-30&supermercado=Extra&precoMax=100", {}, ()),
+        ("GET", "/api/itens/Arroz", {}, ()),
+        ("GET", "/api/itens/Arroz?limit=1", {}, ()),
+        ("GET", "/api/exportar/usuarios/1", {}, ()),
+        ("GET", "/api/exportar/usuarios/1?formato=ndjson", {}, ()),
+        # Exportar tudo é, por definição, ler todas as listas
+        ("GET", "/api/exportar", {}, ("listas",)),
+        # A primeira cotação do processo lê a matriz de preços inteira
+        ("GET", "/api/cotacao?listaId=1", {}, ("preco_produto",)),
+        ("GET", "/api/cotacao?produto=Arroz&produto=Sal", {}, ()),
+        ("GET", "/api/analytics/listas/1", {}, ()),
+        ("GET", "/api/analytics/usuarios/1/gastos?de=2024-01", {}, ()),
+        ("GET", "/api/analytics/precos?produto=Arroz", {}, ()),
+        ("GET", "/api/analytics/precos?supermercado=Extra", {}, ()),
+        (
+            "PUT",
+            "/api/listas/1",
+            {"json": {"itens": [dict(lista["itens"][0], id=1), lista["itens"][1]]}},
+            (),
+        ),
+        ("DELETE", "/api/listas/2", {}, ()),
+        # Com o expurgo na requisição, o plano dele também é verificado
+        ("POST", "/api/listas/excluir", {"json": {"ids": [1]}}, ()),
+        (
+            "POST",
+            "/api/listas/excluir",
+            {"json": {"userId": 1, "antesDe": "2025-01-01"}},
+            (),
+        ),
+    ]
+
+
+def _tabelas_varridas(conexao, sql, parametros):
+    # Só conta varreduras de tabelas reais (não de subconsultas, VALUES ou FTS)
+    existentes = set(
+        conexao.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).scalars()
+    )
+    plano = conexao.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", parametros).all()
+    tabelas = set()
+    for linha in plano:
+        encontrado = PADRAO_SCAN.match(linha.detail)
+        if (
+            encontrado
+            and encontrado.group(1) in existentes
+            and "VIRTUAL TABLE" not in linha.detail
+        ):
+            tabelas.add(encontrado.group(1))
+    return tabelas
+
+
+def verificar_planos():
+    """
+    Executa os cenários e retorna uma lista de falhas
+    ``(método, caminho, tabela, sql)``; lista vazia significa sucesso.
+    """
+    falhas = []
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        app = create_app(
+            {
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///"
+                + os.path.join(diretorio, "planos.db"),
+                "CACHE_LISTAS_TAMANHO": 0,
+                "EXPURGO_EM_SEGUNDO_PLANO": False,
+                "SHARDS": (),
+                "CAPTURA_ARQUIVO": None,
+            }
+        )
+
+        # As requisições rodam fora deste contexto, cada uma com a sua sessão
+        with app.app_context():
+            upgrade(directory=DIRETORIO_MIGRACOES)
+            # Com leituras roteadas, as rotas GET usam outro engine
+            engines = list(db.engines.values())
+            escritor = db.engine
+
+        capturados = []
+
+        def capturar(conn, cursor, sql, parametros, context, executemany):
+            if executemany:
+                parametros = parametros[0] if parametros else ()
+            capturados.append((sql, parametros))
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", capturar)
+        try:
+            cliente = app.test_client()
+            for metodo, caminho, kwargs, permitidas in _cenarios():
+                capturados.clear()
+                resposta = cliente.open(caminho, method=metodo, **kwargs)
+                resposta.get_data()  # respostas em stream só consultam ao serem lidas
+                resposta.close()
+
+                with escritor.connect() as conexao:
+                    for sql, parametros in list(capturados):
+                        if sql.lstrip().upper().startswith(PREFIXOS_IGNORADOS):
+                            continue
+                        for tabela in _tabelas_varridas(conexao, sql, parametros):
+                            if tabela not in permitidas:
+                                falhas.append((metodo, caminho, tabela, sql))
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", capturar)
+                engine.dispose()
+
+    return falhas
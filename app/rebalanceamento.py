@@ -0,0 +1,195 @@
+"""
+Mudança de usuários entre shards (ver app/shards.py).
+
+``mover`` copia as listas, os itens e as marcas de exclusão do usuário para
+o shard de destino, aponta o diretório para ele e só então apaga os dados
+da origem. A mudança fica com o lock de escrita da origem do começo ao fim
+(a primeira coisa que ela faz lá é incrementar a versão do usuário): as
+escritas desse usuário esperam por ela e, quando conseguem o lock, já
+encontram o diretório trocado (``shards.conferir``) e são refeitas no
+destino.
+
+No destino, as listas ganham ids novos, da faixa dele, na revisão seguinte
+à da origem, e os ids antigos viram marcas de exclusão nessa revisão: um
+cliente da sincronização incremental troca as listas antigas pelas novas.
+Listas excluídas em massa que ainda esperavam o expurgo não são copiadas.
+"""
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.sqlite import insert as upsert
+
+from . import cache, db, listas, resumos, shards
+from .models import (
+    Exclusao,
+    Item,
+    Lista,
+    Produto,
+    ShardUsuario,
+    Supermercado,
+    User,
+    VersaoListas,
+)
+
+
+def _ler(user_id):
+    listas_usuario = db.session.execute(
+        select(Lista.id, Lista.data)
+        .where(Lista.user_id == user_id, Lista.excluida_em.is_(None))
+        .order_by(Lista.id)
+    ).all()
+
+    # Itens pelos nomes: os ids de catálogo mudam de um shard para outro
+    itens = defaultdict(list)
+    for lista_id, produto, valor, quantidade, supermercado in db.session.execute(
+        select(Item.lista_id, Produto.nome, Item.valor, Item.quantidade, Supermercado.nome)
+        .join(Lista, Lista.id == Item.lista_id)
+        .join(Produto, Produto.id == Item.produto_id)
+        .join(Supermercado, Supermercado.id == Item.supermercado_id)
+        .where(Lista.user_id == user_id, Lista.excluida_em.is_(None))
+        .order_by(Item.id)
+    ):
+        itens[lista_id].append(
+            {
+                "produto": produto,
+                "valor": valor,
+                "quantidade": quantidade,
+                "supermercado": supermercado,
+            }
+        )
+
+    marcas = db.session.execute(
+        select(Exclusao.revisao, Exclusao.lista_id, Exclusao.item_id, Exclusao.excluido_em)
+        .where(Exclusao.user_id == user_id)
+    ).all()
+    # As marcas já expurgadas continuam expurgadas no destino
+    exclusoes_ate = db.session.execute(
+        select(VersaoListas.exclusoes_ate).where(VersaoListas.user_id == user_id)
+    ).scalar()
+    return listas_usuario, itens, marcas, exclusoes_ate or 0
+
+
+def _apagar(user_id):
+    # Inclui as listas que esperam o expurgo: os resumos delas também saem
+    lista_ids = db.session.execute(
+        select(Lista.id).where(Lista.user_id == user_id)
+    ).scalars().all()
+    if lista_ids:
+        resumos.registrar_exclusoes(lista_ids)
+    # Os itens vão junto, pela chave estrangeira com ON DELETE CASCADE
+    for modelo in (Lista, Exclusao, VersaoListas):
+        db.session.execute(
+            delete(modelo).where(modelo.user_id == user_id),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def _gravar(user_id, destino, revisao, listas_usuario, itens, marcas, exclusoes_ate):
+    shards.espelhar_usuario(user_id, destino)
+    # Restos de uma mudança anterior interrompida
+    _apagar(user_id)
+
+    db.session.execute(
+        insert(VersaoListas).values(
+            user_id=user_id, versao=revisao, exclusoes_ate=exclusoes_ate
+        )
+    )
+    if listas_usuario:
+        listas.inserir_listas(
+            [(user_id, data, itens[lista_id]) for lista_id, data in listas_usuario],
+            {user_id: revisao},
+        )
+
+    novas_marcas = [
+        {
+            "user_id": user_id,
+            "revisao": marca.revisao,
+            "lista_id": marca.lista_id,
+            "item_id": marca.item_id,
+            "excluido_em": marca.excluido_em,
+        }
+        for marca in marcas
+    ]
+    novas_marcas.extend(
+        {"user_id": user_id, "revisao": revisao, "lista_id": lista_id, "item_id": None}
+        for lista_id, _ in listas_usuario
+    )
+    if novas_marcas:
+        db.session.execute(insert(Exclusao), novas_marcas)
+
+
+def _apontar_diretorio(user_id, destino):
+    db.session.execute(
+        upsert(ShardUsuario)
+        .values(user_id=user_id, shard=destino)
+        .on_conflict_do_update(
+            index_elements=[ShardUsuario.user_id], set_={"shard": destino}
+        )
+    )
+
+
+def mover(user_id, destino):
+    """
+    Muda as listas do usuário para o shard ``destino``, com um commit no
+    destino, um no diretório e um na origem, nessa ordem. Retorna quantas
+    listas foram copiadas. Levanta ``ValueError`` para usuário ou shard
+    inexistente.
+    """
+    if destino not in shards.indices():
+        raise ValueError(f"Shard {destino} inexistente.")
+    if not shards.ler_principal(select(User.id).where(User.id == user_id)):
+        raise ValueError(f"Usuário {user_id} não encontrado.")
+
+    origem = shards.do_usuario(user_id)
+    if origem == destino:
+        return 0
+
+    try:
+        with shards.usar(origem):
+            versao = cache.incrementar_versao(user_id)
+            listas_usuario, itens, marcas, exclusoes_ate = _ler(user_id)
+
+        # Cada contexto de app tem a sua sessão: o destino é gravado sem
+        # soltar o lock da origem
+        with current_app.app_context(), shards.usar(destino):
+            _gravar(
+                user_id, destino, versao + 1, listas_usuario, itens, marcas, exclusoes_ate
+            )
+            db.session.commit()
+
+        if origem:
+            with current_app.app_context():
+                _apontar_diretorio(user_id, destino)
+                db.session.commit()
+        else:
+            # A origem é o banco principal, cuja única conexão de escrita já
+            # é desta sessão: o diretório vai no mesmo commit da limpeza
+            _apontar_diretorio(user_id, destino)
+
+        with shards.usar(origem):
+            _apagar(user_id)
+            db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+
+    return len(listas_usuario)
+
+
+def distribuir():
+    """
+    Move para o shard calculado (``shards.escolher``) os usuários que estão
+    no banco principal. Retorna ``{user_id: listas copiadas}``.
+    """
+    if not shards.ativo():
+        return {}
+    no_principal = shards.ler_principal(
+        select(User.id)
+        .outerjoin(ShardUsuario, ShardUsuario.user_id == User.id)
+        .where((ShardUsuario.shard == 0) | ShardUsuario.user_id.is_(None))
+        .order_by(User.id)
+    )
+    return {
+        user_id: mover(user_id, shards.escolher(user_id)) for user_id, in no_principal
+    }
@@ -0,0 +1,362 @@
+"""
+Reprodução de uma captura de tráfego (ver app/captura.py) como teste de carga.
+
+As requisições saem na ordem da captura, nos mesmos intervalos divididos
+por ``velocidade`` (0: sem esperar), por um pool de ``concorrencia``
+threads, contra um servidor HTTP (``url``) ou contra a própria aplicação,
+pelo cliente de teste do Flask.
+
+Os ids criados durante a captura não existem no banco da reprodução: as
+listas e os usuários que as respostas da reprodução revelam
+(``captura.ids_criados``) ficam mapeados aos da captura, e os ids nos
+argumentos da rota, na query (``userId``, ``listaId``) e no corpo
+(``userId``, ``listaId``, ``ids``) são trocados antes do envio. Ids que
+não foram revelados na captura seguem como estão.
+
+Com concorrência, uma requisição espera as anteriores de que depende
+(``MapaDeIds``): a que revelou cada id que ela usa (criação da lista,
+login do usuário), a última escrita em cada um deles e, para um login, o
+cadastro com o mesmo nome e telefone. Uma escrita não espera as leituras
+anteriores dos mesmos ids, e dependências fora dos ids (ex.: nomes de
+produto) não são vistas: só a concorrência 1 reproduz a ordem exata da
+captura.
+
+O relatório traz a vazão total e, por rota, a vazão, os percentis de
+latência e os status, além do atraso em relação ao horário previsto de
+envio (pool saturado).
+"""
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from .captura import ids_criados
+
+
+# Tempo máximo de espera pelas requisições de que outra depende
+ESPERA_DEPENDENCIA = 30
+
+METODOS_LEITURA = ("GET", "HEAD", "OPTIONS")
+
+_ARGUMENTO_DA_ROTA = re.compile(r"<(?:[^:<>]+:)?(\w+)>")
+
+
+def ler_captura(caminho):
+    """Registros da captura em ordem de chegada."""
+    registros = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for numero, linha in enumerate(arquivo, start=1):
+            if not linha.strip():
+                continue
+            try:
+                registros.append(json.loads(linha))
+            except ValueError:
+                raise ValueError(f"Linha {numero} da captura não é JSON válido.")
+    registros.sort(key=lambda r: r["t"])
+    return registros
+
+
+def _chave_cadastro(registro):
+    # Login e cadastro se encontram por nome e telefone, como na rota de login
+    try:
+        dados = json.loads(registro.get("corpo") or "")
+        return (str(dados["nome"]).strip(), str(dados["telefone"]).strip())
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class MapaDeIds:
+    """
+    Ids da captura para ids da reprodução, seguro entre threads, e as
+    dependências entre os registros (pela posição na captura).
+
+    Cada registro depende da última escrita anterior (ou da resposta que
+    revelou o id) em cada lista e usuário que ele usa, e um login, do
+    cadastro anterior com o mesmo nome e telefone. Leituras não viram
+    dependência: leituras do mesmo usuário continuam concorrentes. Como o
+    pool atende na ordem de envio, as dependências já começaram.
+    """
+
+    def __init__(self, registros):
+        self._ids = {"listas": {}, "usuarios": {}}
+        self._dependencias = {}
+        ultima_escrita = {}
+        cadastros = {}
+        for posicao, registro in enumerate(registros):
+            coletor = _Coletor()
+            preparar_requisicao(registro, coletor)
+            dependencias = {
+                ultima_escrita[ref] for ref in coletor.usados if ref in ultima_escrita
+            }
+
+            chave = _chave_cadastro(registro) if registro.get("metodo") == "POST" else None
+            if registro.get("rota") == "/api/users" and registro.get("status") == 201:
+                if chave is not None:
+                    cadastros[chave] = posicao
+            elif registro.get("rota") == "/api/login" and chave in cadastros:
+                dependencias.add(cadastros[chave])
+
+            if dependencias:
+                self._dependencias[posicao] = dependencias
+            if registro.get("metodo") not in METODOS_LEITURA:
+                for ref in coletor.usados:
+                    ultima_escrita[ref] = posicao
+            for tipo, ids in (registro.get("criados") or {}).items():
+                for original in ids:
+                    ultima_escrita[(tipo, original)] = posicao
+        self._concluidos = set()
+        self._condicao = threading.Condition()
+
+    def esperar(self, posicao):
+        """Espera os registros de que o registro ``posicao`` depende."""
+        dependencias = self._dependencias.get(posicao)
+        if not dependencias:
+            return
+        with self._condicao:
+            self._condicao.wait_for(
+                lambda: dependencias <= self._concluidos, timeout=ESPERA_DEPENDENCIA
+            )
+
+    def concluir(self, posicao, originais, novos):
+        """Registra o fim do registro ``posicao`` e os ids que ele revelou."""
+        with self._condicao:
+            for tipo, de in originais.items():
+                para = novos.get(tipo, ())
+                # Uma criação que falhou na reprodução mantém o id original
+                for indice, original in enumerate(de):
+                    self._ids[tipo][original] = para[indice] if indice < len(para) else None
+            self._concluidos.add(posicao)
+            self._condicao.notify_all()
+
+    def _traduzir(self, tipo, original):
+        with self._condicao:
+            novo = self._ids[tipo].get(original)
+        return original if novo is None else novo
+
+    def lista(self, lista_id):
+        return self._traduzir("listas", lista_id)
+
+    def usuario(self, user_id):
+        return self._traduzir("usuarios", user_id)
+
+
+class _Coletor:
+    """Passa por ``preparar_requisicao`` anotando os ids usados, sem trocá-los."""
+
+    def __init__(self):
+        self.usados = set()
+
+    def lista(self, lista_id):
+        self.usados.add(("listas", lista_id))
+        return lista_id
+
+    def usuario(self, user_id):
+        self.usados.add(("usuarios", user_id))
+        return user_id
+
+
+def _eh_id(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def _trocar_no_json(valor, mapa):
+    if isinstance(valor, list):
+        return [_trocar_no_json(v, mapa) for v in valor]
+    if not isinstance(valor, dict):
+        return valor
+    trocado = {}
+    for chave, v in valor.items():
+        if chave == "userId" and _eh_id(v):
+            v = mapa.usuario(v)
+        elif chave == "listaId" and _eh_id(v):
+            v = mapa.lista(v)
+        elif chave == "ids" and isinstance(v, list):
+            v = [mapa.lista(i) if _eh_id(i) else i for i in v]
+        else:
+            v = _trocar_no_json(v, mapa)
+        trocado[chave] = v
+    return trocado
+
+
+def _trocar_no_corpo(corpo, mapa):
+    if not corpo:
+        return corpo
+    try:
+        return json.dumps(_trocar_no_json(json.loads(corpo), mapa), ensure_ascii=False)
+    except ValueError:
+        pass
+    # NDJSON: linha a linha
+    linhas = []
+    for linha in corpo.splitlines():
+        try:
+            linhas.append(json.dumps(_trocar_no_json(json.loads(linha), mapa), ensure_ascii=False))
+        except ValueError:
+            linhas.append(linha)
+    return "\n".join(linhas)
+
+
+def _trocar_na_query(query, mapa):
+    if not query:
+        return query
+    pares = []
+    for chave, valor in parse_qsl(query, keep_blank_values=True):
+        if chave in ("userId", "listaId") and valor.isdigit():
+            trocar = mapa.usuario if chave == "userId" else mapa.lista
+            valor = str(trocar(int(valor)))
+        pares.append((chave, valor))
+    return urlencode(pares)
+
+
+def _trocar_no_caminho(registro, mapa):
+    rota, argumentos = registro.get("rota"), registro.get("argumentos") or {}
+    if not rota or not argumentos:
+        return registro["caminho"]
+    trocados = dict(argumentos)
+    if _eh_id(trocados.get("lista_id")):
+        trocados["lista_id"] = mapa.lista(trocados["lista_id"])
+    if _eh_id(trocados.get("user_id")):
+        trocados["user_id"] = mapa.usuario(trocados["user_id"])
+    if trocados == argumentos:
+        return registro["caminho"]
+    return _ARGUMENTO_DA_ROTA.sub(lambda m: str(trocados[m.group(1)]), rota)
+
+
+def preparar_requisicao(registro, mapa):
+    """``(metodo, caminho com query, corpo)`` do registro com os ids trocados."""
+    caminho = _trocar_no_caminho(registro, mapa)
+    query = _trocar_na_query(registro.get("query"), mapa)
+    corpo = _trocar_no_corpo(registro.get("corpo"), mapa)
+    return registro["metodo"], f"{caminho}?{query}" if query else caminho, corpo
+
+
+class ClienteHttp:
+    """Envia as requisições para um servidor em ``url``."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def enviar(self, metodo, caminho, corpo, tipo):
+        requisicao = urllib.request.Request(
+            self.url + caminho,
+            data=corpo.encode("utf-8") if corpo else None,
+            method=metodo,
+            headers={"Content-Type": tipo} if tipo else {},
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                return resposta.status, resposta.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class ClienteLocal:
+    """Envia as requisições para a aplicação, no mesmo processo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def enviar(self, metodo, caminho, corpo, tipo):
+        # Um cliente por requisição: o de teste guarda estado entre elas
+        with self.app.test_client() as cliente:
+            resposta = cliente.open(
+                caminho, method=metodo, data=corpo or None, content_type=tipo
+            )
+            return resposta.status_code, resposta.get_data()
+
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    posicao = max(0, min(len(ordenadas) - 1, round(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[posicao]
+
+
+def _enviar(cliente, posicao, registro, mapa, previsto):
+    originais = registro.get("criados") or {}
+    novos = {}
+    try:
+        # A espera pelas dependências conta como atraso, não como latência
+        mapa.esperar(posicao)
+        metodo, caminho, corpo = preparar_requisicao(registro, mapa)
+        inicio = time.perf_counter()
+        atraso = inicio - previsto
+        try:
+            status, conteudo = cliente.enviar(
+                metodo, caminho, corpo, registro.get("tipoConteudo")
+            )
+        except OSError:
+            status, conteudo = None, b""
+        duracao = time.perf_counter() - inicio
+
+        if originais:
+            try:
+                dados = json.loads(conteudo) if conteudo else None
+            except ValueError:
+                dados = None
+            novos = ids_criados(registro.get("rota"), status, dados)
+    finally:
+        # Mesmo com erro: quem depende deste registro não fica esperando
+        mapa.concluir(posicao, originais, novos)
+    return status, duracao, atraso
+
+
+def reproduzir(registros, cliente, concorrencia=8, velocidade=1.0):
+    """
+    Reproduz os ``registros`` (``ler_captura``) pelo ``cliente``
+    (``ClienteHttp`` ou ``ClienteLocal``) e devolve o relatório.
+    """
+    if concorrencia < 1:
+        raise ValueError("A concorrência deve ser pelo menos 1.")
+    if velocidade < 0:
+        raise ValueError("A velocidade não pode ser negativa.")
+
+    validos = [r for r in registros if not r.get("corpoTruncado")]
+    mapa = MapaDeIds(validos)
+    resultados = []
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=concorrencia, thread_name_prefix="reproducao"
+    ) as executor:
+        t0 = validos[0]["t"] if validos else 0
+        for posicao, registro in enumerate(validos):
+            previsto = inicio + ((registro["t"] - t0) / velocidade if velocidade else 0)
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            futuro = executor.submit(_enviar, cliente, posicao, registro, mapa, previsto)
+            resultados.append((f"{registro['metodo']} {registro.get('rota')}", futuro))
+    duracao_total = time.perf_counter() - inicio
+
+    por_rota = defaultdict(list)
+    for nome, futuro in resultados:
+        por_rota[nome].append(futuro.result())
+
+    rotas = {}
+    for nome, medidas in sorted(por_rota.items()):
+        tempos = [duracao * 1000 for _, duracao, _ in medidas]
+        rotas[nome] = {
+            "requisicoes": len(medidas),
+            "vazao_rps": round(len(medidas) / duracao_total, 2) if duracao_total else None,
+            "p50_ms": round(_percentil(tempos, 50), 2),
+            "p95_ms": round(_percentil(tempos, 95), 2),
+            "p99_ms": round(_percentil(tempos, 99), 2),
+            "status": dict(Counter(str(status) for status, _, _ in medidas)),
+        }
+
+    atrasos = [max(0.0, atraso) * 1000 for _, m in por_rota.items() for _, _, atraso in m]
+    return {
+        "requisicoes": len(resultados),
+        "ignoradas": len(registros) - len(validos),
+        "duracao_s": round(duracao_total, 3),
+        "vazao_rps": round(len(resultados) / duracao_total, 2) if duracao_total else None,
+        "concorrencia": concorrencia,
+        "velocidade": velocidade,
+        "atraso_p99_ms": round(_percentil(atrasos, 99), 2) if atrasos else 0.0,
+        "rotas": rotas,
+    }
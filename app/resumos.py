@@ -0,0 +1,296 @@
+"""
+Tabelas de resumo (totais por lista, gasto mensal por usuário e preço médio
+por produto e supermercado).
+
+São mantidas incrementalmente, na mesma transação das escritas em listas e
+itens: cada função aqui aplica apenas a diferença causada pela escrita.
+``recalcular`` refaz tudo a partir de listas e itens, para reparo.
+"""
+from collections import defaultdict
+
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as upsert
+
+from . import db
+from .models import GastoMensal, Item, Lista, PrecoProduto, ResumoLista, VersaoPrecos
+
+
+def mes_de(data):
+    return data.strftime("%Y-%m")
+
+
+def _total(itens):
+    return sum(item["valor"] * item["quantidade"] for item in itens)
+
+
+def registrar_listas(listas):
+    """
+    Registra listas recém-criadas.
+
+    ``listas`` é uma sequência de ``(lista_id, user_id, data, itens)``, onde
+    ``itens`` são dicts com produto_id, valor, quantidade e supermercado_id.
+    """
+    if not listas:
+        return
+
+    db.session.execute(
+        insert(ResumoLista),
+        [
+            {
+                "lista_id": lista_id,
+                "user_id": user_id,
+                "mes": mes_de(data),
+                "total": _total(itens),
+                "quantidade_itens": len(itens),
+            }
+            for lista_id, user_id, data, itens in listas
+        ],
+    )
+
+    gastos = defaultdict(lambda: [0.0, 0])
+    for _, user_id, data, itens in listas:
+        gasto = gastos[(user_id, mes_de(data))]
+        gasto[0] += _total(itens)
+        gasto[1] += 1
+    _somar_gastos(
+        [(user_id, mes, total, n) for (user_id, mes), (total, n) in gastos.items()]
+    )
+
+    _somar_precos([item for *_, itens in listas for item in itens], sinal=1)
+
+
+def registrar_alteracao_itens(lista_id, adicionados, removidos):
+    """
+    Aplica a diferença de itens de uma lista existente.
+
+    Itens atualizados entram duas vezes: o valor antigo em ``removidos`` e o
+    novo em ``adicionados``.
+    """
+    if not adicionados and not removidos:
+        return
+
+    delta = _total(adicionados) - _total(removidos)
+    delta_itens = len(adicionados) - len(removidos)
+
+    resumo = db.session.execute(
+        update(ResumoLista)
+        .where(ResumoLista.lista_id == lista_id)
+        .values(
+            total=ResumoLista.total + delta,
+            quantidade_itens=ResumoLista.quantidade_itens + delta_itens,
+        )
+        .returning(ResumoLista.user_id, ResumoLista.mes)
+    ).one_or_none()
+
+    if resumo is not None:
+        _somar_gastos([(resumo.user_id, resumo.mes, delta, 0)])
+
+    _somar_precos(adicionados, sinal=1)
+    _somar_precos(removidos, sinal=-1)
+
+
+def registrar_movimentacao(lista_id, user_id, data):
+    """Transfere o total da lista quando o dono ou o mês dela mudam."""
+    mes = mes_de(data)
+    resumo = db.session.get(ResumoLista, lista_id)
+    if resumo is None or (resumo.user_id, resumo.mes) == (user_id, mes):
+        return
+
+    _somar_gastos(
+        [
+            (resumo.user_id, resumo.mes, -resumo.total, -1),
+            (user_id, mes, resumo.total, 1),
+        ]
+    )
+    resumo.user_id = user_id
+    resumo.mes = mes
+
+
+def registrar_exclusao(lista_id):
+    """Remove a contribuição da lista. Deve ser chamada antes de excluí-la."""
+    registrar_exclusoes([lista_id])
+
+
+def registrar_exclusoes(lista_ids):
+    """
+    Remove a contribuição de várias listas, com o mesmo número de comandos
+    para uma ou para muitas. Deve ser chamada antes de excluí-las.
+    """
+    resumos = db.session.execute(
+        delete(ResumoLista)
+        .where(ResumoLista.lista_id.in_(lista_ids))
+        .returning(
+            ResumoLista.lista_id, ResumoLista.user_id, ResumoLista.mes, ResumoLista.total
+        )
+    ).all()
+    if not resumos:
+        return
+
+    gastos = defaultdict(lambda: [0.0, 0])
+    for resumo in resumos:
+        gasto = gastos[resumo.user_id, resumo.mes]
+        gasto[0] -= resumo.total
+        gasto[1] -= 1
+    _somar_gastos([(user_id, mes, total, n) for (user_id, mes), (total, n) in gastos.items()])
+
+    # Os itens são agregados no banco: não é preciso carregá-los
+    precos = db.session.execute(
+        select(
+            Item.produto_id,
+            Item.supermercado_id,
+            func.sum(Item.valor).label("soma"),
+            func.count().label("n"),
+        )
+        .where(Item.lista_id.in_([resumo.lista_id for resumo in resumos]))
+        .group_by(Item.produto_id, Item.supermercado_id)
+    ).all()
+    _aplicar_precos(
+        [(p.produto_id, p.supermercado_id, -p.soma, -p.n) for p in precos]
+    )
+
+
+def _somar_gastos(deltas):
+    """``deltas``: sequência de ``(user_id, mes, total, listas)``."""
+    stmt = upsert(GastoMensal)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[GastoMensal.user_id, GastoMensal.mes],
+            set_={
+                "total": GastoMensal.total + stmt.excluded.total,
+                "listas": GastoMensal.listas + stmt.excluded.listas,
+            },
+        ),
+        [
+            {"user_id": user_id, "mes": mes, "total": total, "listas": listas}
+            for user_id, mes, total, listas in deltas
+        ],
+    )
+
+    # Meses que ficaram sem listas saem da tabela
+    esvaziados = [(user_id, mes) for user_id, mes, _, listas in deltas if listas < 0]
+    if esvaziados:
+        db.session.execute(
+            delete(GastoMensal).where(
+                or_(
+                    *(
+                        and_(GastoMensal.user_id == user_id, GastoMensal.mes == mes)
+                        for user_id, mes in esvaziados
+                    )
+                ),
+                GastoMensal.listas <= 0,
+            )
+        )
+
+
+def _somar_precos(itens, sinal):
+    agregados = defaultdict(lambda: [0.0, 0])
+    for item in itens:
+        agregado = agregados[(item["produto_id"], item["supermercado_id"])]
+        agregado[0] += item["valor"]
+        agregado[1] += 1
+    _aplicar_precos(
+        [
+            (produto_id, supermercado_id, sinal * soma, sinal * n)
+            for (produto_id, supermercado_id), (soma, n) in agregados.items()
+        ]
+    )
+
+
+def _aplicar_precos(deltas):
+    """
+    ``deltas``: sequência de ``(produto_id, supermercado_id, soma_valor,
+    ocorrencias)``.
+
+    Pares que ficam sem ocorrências continuam na tabela, zerados: a remoção
+    chega às matrizes de preço (app/cotacao.py) como qualquer alteração.
+    """
+    if not deltas:
+        return
+
+    versao = _incrementar_versao_precos()
+    stmt = upsert(PrecoProduto)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PrecoProduto.produto_id, PrecoProduto.supermercado_id],
+            set_={
+                "soma_valor": PrecoProduto.soma_valor + stmt.excluded.soma_valor,
+                "ocorrencias": PrecoProduto.ocorrencias + stmt.excluded.ocorrencias,
+                "revisao": stmt.excluded.revisao,
+            },
+        ),
+        [
+            {
+                "produto_id": produto_id,
+                "supermercado_id": supermercado_id,
+                "soma_valor": soma,
+                "ocorrencias": n,
+                "revisao": versao,
+            }
+            for produto_id, supermercado_id, soma, n in deltas
+        ],
+    )
+
+
+def _incrementar_versao_precos():
+    stmt = upsert(VersaoPrecos).values(id=1, versao=1, versao_remocao=0)
+    return db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[VersaoPrecos.id],
+            set_={"versao": VersaoPrecos.versao + 1},
+        ).returning(VersaoPrecos.versao)
+    ).scalar_one()
+
+
+def _marcar_remocao_precos(versao):
+    db.session.execute(
+        update(VersaoPrecos).where(VersaoPrecos.id == 1).values(versao_remocao=versao)
+    )
+
+
+def recalcular():
+    """Reconstrói todas as tabelas de resumo a partir de listas e itens."""
+    for modelo in (ResumoLista, GastoMensal, PrecoProduto):
+        db.session.execute(delete(modelo))
+
+    mes = func.strftime("%Y-%m", Lista.data)
+    db.session.execute(
+        insert(ResumoLista).from_select(
+            ["lista_id", "user_id", "mes", "total", "quantidade_itens"],
+            select(
+                Lista.id,
+                Lista.user_id,
+                mes,
+                func.coalesce(func.sum(Item.valor * Item.quantidade), 0),
+                func.count(Item.id),
+            )
+            .outerjoin(Item, Item.lista_id == Lista.id)
+            .group_by(Lista.id),
+        )
+    )
+    db.session.execute(
+        insert(GastoMensal).from_select(
+            ["user_id", "mes", "total", "listas"],
+            select(
+                ResumoLista.user_id,
+                ResumoLista.mes,
+                func.sum(ResumoLista.total),
+                func.count(),
+            ).group_by(ResumoLista.user_id, ResumoLista.mes),
+        )
+    )
+    versao = _incrementar_versao_precos()
+    db.session.execute(
+        insert(PrecoProduto).from_select(
+            ["produto_id", "supermercado_id", "soma_valor", "ocorrencias", "revisao"],
+            select(
+                Item.produto_id,
+                Item.supermercado_id,
+                func.sum(Item.valor),
+                func.count(),
+                literal(versao),
+            ).group_by(Item.produto_id, Item.supermercado_id),
+        )
+    )
+    # Tudo foi reescrito: as matrizes de preço em memória são relidas
+    _marcar_remocao_precos(versao)
+    db.session.commit()
@@ -1,9 +1,33 @@
-from flask import Blueprint, request, jsonify
-from .models import User, Lista, Item
-from . import db
-from datetime import datetime
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import joinedload
+from flask import Blueprint, current_app, request, jsonify
+from .models import (
+    GastoMensal,
+    Item,
+    Lista,
+    PrecoProduto,
+    Produto,
+    ResumoLista,
+    Supermercado,
+    User,
+)
+from . import (
+    cache,
+    catalogo,
+    cotacao,
+    db,
+    escrita,
+    exportacao,
+    expurgo,
+    filtros,
+    listas,
+    pagination,
+    search,
+    senhas,
+    serializacao,
+    shards,
+    sincronizacao,
+)
+import itertools
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 
 main = Blueprint("main", __name__)
@@ -19,34 +43,59 @@ def register_user():
     email = data.get("email", "").strip()
     senha = data.get("senha", "").strip()
 
-    if User.query.filter_by(email=email).first():
-        return jsonify({"error": "Email já registrado"}), 400
-
     user = User(nome=nome, telefone=telefone, email=email)
-    user.set_senha(senha)  # Define o hash da senha
+    try:
+        user.set_senha(senha)  # Define o hash da senha (pool de processos)
+    except senhas.SenhasOcupadas as e:
+        resposta = jsonify({"error": str(e)})
+        resposta.headers["Retry-After"] = str(current_app.config["SENHAS_RETRY_AFTER"])
+        return resposta, 503
+
+    # Email duplicado é detectado pela restrição UNIQUE no próprio INSERT
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "user.email" not in str(e.orig):
+            raise
+        return jsonify({"error": "Email já registrado"}), 400
+
+    # Com shards, o usuário ganha o seu shard e uma cópia dele nesse shard
+    # (ler user.id depois do commit recarrega o usuário: só quando preciso)
+    if shards.ativo():
+        shards.registrar_usuario(user.id)
 
     return jsonify({"message": "Usuário registrado com sucesso!"}), 201
 
 
 @main.route("/api/users", methods=["GET"])
 def get_users():
-    users = User.query.all()
-    return (
-        jsonify(
-            [
-                {
-                    "id": user.id,
-                    "nome": user.nome,
-                    "telefone": user.telefone,
-                    "email": user.email,
-                }
-                for user in users
-            ]
-        ),
-        200,
-    )
+    """
+    Lista os usuários. Aceita paginação por ``limit``/``after`` e ``stream=1``.
+    """
+    try:
+        pagina = pagination.parametros_pagina()
+    except pagination.ParametroInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = User.query
+
+    if pagination.modo_stream():
+        users = pagination.iterar_em_lotes(query, User.id)
+        return pagination.resposta_em_stream(users or [], _serializar_usuario), 200
+
+    if pagina:
+        users, proximo = pagination.paginar(query, User.id, *pagina)
+        return (
+            pagination.resposta_paginada(
+                [_serializar_usuario(user) for user in users], proximo
+            ),
+            200,
+        )
+
+    users = query.all()
+    return jsonify([_serializar_usuario(user) for user in users]), 200
 
 
 @main.route("/api/login", methods=["POST"])
@@ -73,62 +122,137 @@ def login_user():
         return jsonify({"error": "Usuário não encontrado ou dados incorretos"}), 404
 
 
+def _user_id_do_corpo(**kwargs):
+    data = request.get_json(silent=True)
+    user_id = data.get("userId") if isinstance(data, dict) else None
+    return user_id if isinstance(user_id, int) and not isinstance(user_id, bool) else None
+
+
 @main.route("/api/listas", methods=["POST"])
 @cross_origin()
+@shards.por_usuario(_user_id_do_corpo)
 def criar_lista():
     """
     Cria uma nova lista de compras associada a um usuário.
     """
-    data = request.json
-    user_id = data.get("userId")
-    data_criacao = data.get("data")
-    itens_data = data.get("itens", [])
+    try:
+        user_id, data_criacao, itens_data = listas.validar_lista(request.json)
+    except listas.DadosInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Criação da lista, dos itens e dos resumos, em uma única transação
+        lista_id = escrita.executar(listas.criar, user_id, data_criacao, itens_data)
 
-    # Validação de campos obrigatórios
-    if not user_id or not itens_data:
         return (
-            jsonify({"error": "Campos obrigatórios estão faltando: userId ou itens"}),
-            400,
+            jsonify({"message": "Lista criada com sucesso!", "listaId": lista_id}),
+            201,
         )
 
+    except listas.DadosInvalidos as e:
+        # userId inexistente, descoberto na gravação
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Erro no banco de dados: {str(e)}"}), 500
+    except escrita.EscritaIndisponivel as e:
+        return jsonify({"error": str(e)}), 503
+
+
+@main.route("/api/listas/importar", methods=["POST"])
+def importar_listas():
+    """
+    Importa listas em massa a partir de um corpo NDJSON (uma lista por linha).
+
+    O corpo é lido em stream; o parâmetro ``lote`` define quantas listas são
+    gravadas por commit. Erros são reportados por linha sem abortar o restante.
+    """
     try:
-        # Criação da lista
-        nova_lista = Lista(user_id=user_id, data=datetime.fromisoformat(data_criacao))
-
-        for item in itens_data:
-            # Validação de cada item
-            if not all(
-                k in item for k in ("produto", "valor", "quantidade", "supermercado")
-            ):
-                return jsonify({"error": "Dados do item incompletos."}), 400
-
-            novo_item = Item(
-                produto=item["produto"],
-                valor=item["valor"],
-                quantidade=item["quantidade"],
-                supermercado=item["supermercado"],
-                lista=nova_lista,
-            )
-            db.session.add(novo_item)
+        tamanho_lote = int(request.args.get("lote", listas.TAMANHO_LOTE_IMPORTACAO))
+        if tamanho_lote < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "O parâmetro lote deve ser um número positivo."}), 400
 
-        # Salva a lista e os itens
-        db.session.add(nova_lista)
-        db.session.commit()
+    resultado = listas.importar_ndjson(request.stream, tamanho_lote)
+    return jsonify(resultado), 200
+
+
+@main.route("/api/listas/lote", methods=["POST"])
+@cross_origin()
+def executar_lote():
+    """
+    Executa várias operações de criar, atualizar e excluir listas em uma
+    requisição e um commit, na ordem enviada (ver ``listas.validar_lote``).
 
+    Com ``atomico`` (padrão), a primeira falha desfaz tudo e a resposta traz
+    o erro e o índice da operação. Sem ele, cada operação é independente e
+    a resposta traz um resultado por operação.
+    """
+    try:
+        operacoes, atomico = listas.validar_lote(request.json)
+        indice = listas.shard_do_lote(operacoes)
+    except listas.DadosInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with shards.usar(indice):
+            resultados = escrita.executar(listas.executar_lote, operacoes, atomico)
+    except listas.OperacaoDoLoteFalhou as e:
         return (
-            jsonify({"message": "Lista criada com sucesso!", "listaId": nova_lista.id}),
-            201,
+            jsonify({"error": str(e), "indice": e.indice}),
+            listas.status_do_erro(e.erro),
         )
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Erro no banco de dados: {str(e)}"}), 500
+    except (escrita.EscritaIndisponivel, shards.UsuarioMovido) as e:
+        return jsonify({"error": str(e)}), 503
 
-    except ValueError:
-        return jsonify({"error": "Formato de data inválido. Use ISO 8601."}), 400
+    return jsonify({"resultados": resultados}), 200
+
+
+@main.route("/api/listas/excluir", methods=["POST"])
+@cross_origin()
+def excluir_listas():
+    """
+    Exclui listas em massa por ``ids``, ``userId`` e/ou ``antesDe`` (ver
+    ``listas.validar_exclusao_em_massa``).
+
+    As listas são marcadas e somem das leituras na hora; o banco é limpo
+    depois, em lotes, pelo expurgo (app/expurgo.py). Responde 202 com a
+    quantidade de listas marcadas. Com shards, cada shard tem a sua
+    transação.
+    """
+    try:
+        criterios = listas.validar_exclusao_em_massa(request.json)
+    except listas.DadosInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    marcadas = 0
+    try:
+        for indice in listas.shards_da_exclusao(criterios):
+            with shards.usar(indice):
+                marcadas += escrita.executar(listas.marcar_exclusao, criterios)
     except SQLAlchemyError as e:
-        db.session.rollback()  # Reverte qualquer alteração em caso de erro
         return jsonify({"error": f"Erro no banco de dados: {str(e)}"}), 500
+    except escrita.EscritaIndisponivel as e:
+        return jsonify({"error": str(e)}), 503
+
+    if marcadas:
+        expurgo.agendar()
+    return jsonify({"marcadas": marcadas}), 202
+
+
+def _user_id_da_query(**kwargs):
+    try:
+        return int(request.args["userId"])
+    except (KeyError, ValueError):
+        return None
 
 
 @main.route("/api/listas", methods=["GET"])
 @cross_origin()
+@shards.por_usuario(_user_id_da_query)
+@cache.condicional_por_usuario(_user_id_da_query)
 def listar_listas():
     """
     Retorna as listas de compras de um usuário específico, incluindo o nome do usuário.
@@ -143,183 +267,467 @@ def listar_listas():
     except ValueError:
         return jsonify({"error": "O parâmetro userId deve ser um número válido."}), 400
 
-    # Busca as listas associadas ao userId com as relações necessárias
-    listas = (
-        Lista.query.options(joinedload(Lista.itens), joinedload(Lista.user))
-        .filter_by(user_id=user_id)
-        .all()
+    return _responder_listas(
+        [Lista.user_id == user_id],
+        "Nenhuma lista encontrada para este usuário.",
+        campos_padrao=serializacao.CAMPOS_LISTA_PADRAO + ("userNome",),
     )
 
-    if not listas:
-        return jsonify({"message": "Nenhuma lista encontrada para este usuário."}), 404
-
-    # Monta a resposta com as listas do usuário
-    response = [
-        {
-            "id": lista.id,
-            "userId": lista.user_id,
-            "userNome": lista.user.nome if lista.user else None,
-            "data": lista.data.isoformat(),
-            "itens": [
-                {
-                    "id": item.id,
-                    "produto": item.produto,
-                    "valor": item.valor,
-                    "quantidade": item.quantidade,
-                    "supermercado": item.supermercado,
-                }
-                for item in lista.itens
-            ],
-        }
-        for lista in listas
-    ]
 
-    return jsonify(response), 200
+@main.route("/api/listas/changes", methods=["GET"])
+@cross_origin()
+@shards.por_usuario(_user_id_da_query)
+@cache.condicional_por_usuario(_user_id_da_query)
+def alteracoes_das_listas():
+    """
+    Sincronização incremental: o que mudou nas listas do usuário depois da
+    revisão ``since`` (0 traz tudo). A resposta traz a ``revisao`` a enviar
+    na próxima chamada, as listas alteradas (só com os itens alterados) e os
+    ids de listas e itens excluídos. ``completa`` indica que vieram todas as
+    listas (``since`` anterior às marcas de exclusão ainda guardadas) e que
+    o cliente deve descartar as que tem.
+    """
+    try:
+        user_id = int(request.args["userId"])
+    except KeyError:
+        return jsonify({"error": "O parâmetro userId é obrigatório."}), 400
+    except ValueError:
+        return jsonify({"error": "O parâmetro userId deve ser um número válido."}), 400
+
+    try:
+        desde = int(request.args.get("since", 0))
+        if desde < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "O parâmetro since deve ser uma revisão válida."}), 400
+
+    return jsonify(sincronizacao.alteracoes(user_id, desde)), 200
 
 
 @main.route("/api/listas/<int:lista_id>", methods=["PUT"])
+@shards.por_lista
 def atualizar_lista(lista_id):
     """
-    Atualiza uma lista existente com novos itens ou modifica os existentes.
+    Atualiza uma lista existente.
+
+    Quando ``itens`` é enviado, ele passa a ser o conteúdo completo da lista:
+    itens com ``id`` são atualizados, itens sem ``id`` são criados e itens
+    que não aparecem no payload são removidos.
     """
     data = request.json
-    lista = Lista.query.get_or_404(lista_id)
-
-    lista.user_id = data.get("userId", lista.user_id)
-    lista.data = datetime.fromisoformat(data.get("data", lista.data.isoformat()))
-
-    # Atualizar ou adicionar itens
-    itens_data = data.get("itens", [])
-    for item_data in itens_data:
-        if "id" in item_data:  # Item existente
-            item = Item.query.get(item_data["id"])
-            if item:
-                item.produto = item_data["produto"]
-                item.valor = item_data["valor"]
-                item.quantidade = item_data["quantidade"]
-                item.supermercado = item_data["supermercado"]
-        else:  # Novo item
-            novo_item = Item(
-                produto=item_data["produto"],
-                valor=item_data["valor"],
-                quantidade=item_data["quantidade"],
-                supermercado=item_data["supermercado"],
-                lista=lista,
-            )
-            db.session.add(novo_item)
 
-    db.session.commit()
+    try:
+        escrita.executar(listas.atualizar_por_id, lista_id, data)
+    except listas.ListaNaoEncontrada:
+        return jsonify({"error": "Lista não encontrada"}), 404
+    except listas.DadosInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"error": f"Erro no banco de dados: {str(e)}"}), 500
+    except escrita.EscritaIndisponivel as e:
+        return jsonify({"error": str(e)}), 503
+
     return jsonify({"message": "Lista atualizada com sucesso!"}), 200
 
 
 @main.route("/api/listas/<int:lista_id>", methods=["DELETE"])
+@shards.por_lista
 def excluir_lista(lista_id):
-    print(f"Recebendo requisição DELETE para excluir lista com ID: {lista_id}")
+    current_app.logger.debug("Excluindo lista %s", lista_id)
 
-    lista = Lista.query.get(lista_id)
-
-    if not lista:
+    try:
+        escrita.executar(listas.excluir_por_id, lista_id)
+    except listas.ListaNaoEncontrada:
         return jsonify({"error": "Lista não encontrada"}), 404
-
-    db.session.delete(lista)
-    db.session.commit()
+    except escrita.EscritaIndisponivel as e:
+        return jsonify({"error": str(e)}), 503
 
     return jsonify({"message": "Lista excluída com sucesso!"}), 200
 
 
 @main.route("/api/listas/usuario/<int:user_id>", methods=["GET"])
+@shards.por_usuario(lambda user_id: user_id)
+@cache.condicional_por_usuario(lambda user_id: user_id)
 def listar_listas_usuario(user_id):
     """
     Retorna todas as listas criadas por um usuário específico.
     """
-    listas = Lista.query.filter_by(user_id=user_id).all()
-    if not listas:
-        return jsonify({"message": "Nenhuma lista encontrada para este usuário."}), 404
+    return _responder_listas(
+        [Lista.user_id == user_id], "Nenhuma lista encontrada para este usuário."
+    )
+
+
+@main.route("/api/listas/supermercado/<string:supermercado>", methods=["GET"])
+def listar_listas_supermercado(supermercado):
+    """
+    Retorna todas as listas contendo itens de um supermercado específico,
+    de todos os shards.
+    """
+
+    def filtros_no_shard():
+        # Cada shard tem o seu catálogo, com o seu id para o supermercado
+        supermercado_id = catalogo.id_supermercado_existente(supermercado)
+        if supermercado_id is None:
+            return None
+        # Subconsulta em vez de join: cada lista aparece uma única vez e
+        # apenas os itens do supermercado entram na resposta
+        return (
+            [
+                Lista.id.in_(
+                    db.select(Item.lista_id).where(Item.supermercado_id == supermercado_id)
+                )
+            ],
+            [Item.supermercado_id == supermercado_id],
+        )
+
+    return _responder_listas_em_todos(
+        filtros_no_shard, "Nenhuma lista encontrada para este supermercado."
+    )
+
+
+@main.route("/api/listas/filtro", methods=["GET"])
+def filtrar_listas():
+    """
+    Retorna as listas que satisfazem os filtros combinados (ver
+    ``app/filtros.py``), sem repetição, paginadas por ``limit``/``after``.
+    A primeira página traz também as facetas por supermercado e por mês.
+    Com shards, filtra em todos e junta as páginas e as facetas.
+    """
+    try:
+        selecao = filtros.ler_filtros()
+        limite, apos = pagination.parametros_pagina() or (filtros.LIMITE_PADRAO, 0)
+        projecao = serializacao.ler_campos()
+    except (
+        filtros.FiltroInvalido,
+        pagination.ParametroInvalido,
+        serializacao.CamposInvalidos,
+    ) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def filtrar_no_shard():
+        resolvida = filtros.resolver(selecao)
+        pagina = [], [], None
+        if not resolvida.vazio:
+            pagina = serializacao.serializar_com_ids(
+                projecao,
+                filtros.condicoes_das_listas(resolvida),
+                resolvida.itens,
+                limite,
+                apos,
+            )
+        return pagina, None if apos else filtros.facetas(resolvida)
+
+    resultados = shards.em_todos(filtrar_no_shard)
+    dados, proximo = serializacao.juntar_paginas(
+        [pagina for pagina, _ in resultados], limite
+    )
+
+    resposta = {"listas": dados, "proximo": proximo}
+    if not apos:
+        resposta["facetas"] = filtros.juntar_facetas([f for _, f in resultados])
+    return jsonify(resposta), 200
+
+
+def _responder_listas(filtro, mensagem_vazia, filtro_itens=(),
+                      campos_padrao=serializacao.CAMPOS_LISTA_PADRAO):
+    """
+    Responde as listas que satisfazem ``filtro``: completas, paginadas ou em
+    stream, com os campos pedidos em ``fields``.
+    """
+    try:
+        pagina = pagination.parametros_pagina()
+        projecao = serializacao.ler_campos(campos_padrao)
+    except (pagination.ParametroInvalido, serializacao.CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if pagination.modo_stream():
+        registros = serializacao.serializar_em_lotes(projecao, filtro, filtro_itens)
+        if registros is None:
+            return jsonify({"message": mensagem_vazia}), 404
+        return pagination.resposta_em_stream(registros, lambda lista: lista), 200
+
+    dados, proximo = serializacao.serializar_listas(
+        projecao, filtro, filtro_itens, *(pagina or ())
+    )
+    if not dados:
+        return jsonify({"message": mensagem_vazia}), 404
+
+    return pagination.resposta_paginada(dados, proximo), 200
+
+
+def _responder_listas_em_todos(filtros_no_shard, mensagem_vazia,
+                               campos_padrao=serializacao.CAMPOS_LISTA_PADRAO):
+    """
+    ``_responder_listas`` sobre todos os shards. ``filtros_no_shard()`` roda
+    em cada shard e devolve ``(filtro, filtro_itens)``, ou ``None`` se nada
+    ali pode satisfazê-los.
+    """
+    try:
+        pagina = pagination.parametros_pagina()
+        projecao = serializacao.ler_campos(campos_padrao)
+    except (pagination.ParametroInvalido, serializacao.CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if pagination.modo_stream():
+
+        def em_lotes():
+            filtros_shard = filtros_no_shard()
+            if filtros_shard is None:
+                return ()
+            return serializacao.serializar_em_lotes(projecao, *filtros_shard) or ()
+
+        registros = shards.encadear(em_lotes)
+        primeiro = next(registros, None)
+        if primeiro is None:
+            return jsonify({"message": mensagem_vazia}), 404
+        return (
+            pagination.resposta_em_stream(
+                itertools.chain([primeiro], registros), lambda lista: lista
+            ),
+            200,
+        )
+
+    def pagina_no_shard():
+        filtros_shard = filtros_no_shard()
+        if filtros_shard is None:
+            return [], [], None
+        return serializacao.serializar_com_ids(projecao, *filtros_shard, *(pagina or ()))
+
+    dados, proximo = serializacao.juntar_paginas(
+        shards.em_todos(pagina_no_shard), pagina[0] if pagina else None
+    )
+    if not dados:
+        return jsonify({"message": mensagem_vazia}), 404
+
+    return pagination.resposta_paginada(dados, proximo), 200
+
+
+def _serializar_usuario(user):
+    return {
+        "id": user.id,
+        "nome": user.nome,
+        "telefone": user.telefone,
+        "email": user.email,
+    }
+
+
+@main.route("/api/itens/<string:produto>", methods=["GET"])
+def listar_itens_por_produto(produto):
+    """
+    Retorna os itens que contêm um determinado produto, ordenados por relevância.
+
+    Paginado por ``limit`` e ``cursor``; o cursor da próxima página vem no
+    cabeçalho ``X-Next-Cursor``.
+    """
+    try:
+        limite = min(
+            int(request.args.get("limit", search.LIMITE_PADRAO)), search.LIMITE_MAXIMO
+        )
+        if limite < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "O parâmetro limit deve ser um número positivo."}), 400
+
+    try:
+        itens, proximo_cursor = search.buscar_itens(
+            produto, limite, request.args.get("cursor")
+        )
+    except search.CursorInvalido:
+        return jsonify({"error": "Cursor inválido."}), 400
+
+    if not itens:
+        return jsonify({"message": "Nenhum item encontrado para este produto."}), 404
+
+    response = jsonify(
+        [
+            {
+                "listaId": item.lista_id,
+                "produto": item.produto,
+                "valor": item.valor,
+                "quantidade": item.quantidade,
+                "supermercado": item.supermercado,
+            }
+            for item in itens
+        ]
+    )
+    if proximo_cursor:
+        response.headers["X-Next-Cursor"] = proximo_cursor
+    return response, 200
+
+
+@main.route("/api/analytics/listas/<int:lista_id>", methods=["GET"])
+@shards.por_lista
+def resumo_da_lista(lista_id):
+    """
+    Retorna o total de uma lista (soma de valor * quantidade dos itens).
+    """
+    # O resumo de uma lista excluída em massa só sai no expurgo
+    resumo = db.session.execute(
+        db.select(ResumoLista)
+        .join(Lista, Lista.id == ResumoLista.lista_id)
+        .where(ResumoLista.lista_id == lista_id, Lista.excluida_em.is_(None))
+    ).scalar()
+    if not resumo:
+        return jsonify({"error": "Lista não encontrada"}), 404
 
     return (
         jsonify(
-            [
-                {
-                    "id": lista.id,
-                    "userId": lista.user_id,
-                    "data": lista.data.isoformat(),
-                    "itens": [
-                        {
-                            "id": item.id,
-                            "produto": item.produto,
-                            "valor": item.valor,
-                            "quantidade": item.quantidade,
-                            "supermercado": item.supermercado,
-                        }
-                        for item in lista.itens
-                    ],
-                }
-                for lista in listas
-            ]
+            {
+                "listaId": resumo.lista_id,
+                "userId": resumo.user_id,
+                "mes": resumo.mes,
+                "total": resumo.total,
+                "quantidadeItens": resumo.quantidade_itens,
+            }
         ),
         200,
     )
 
 
-@main.route("/api/listas/supermercado/<string:supermercado>", methods=["GET"])
-def listar_listas_supermercado(supermercado):
+@main.route("/api/analytics/usuarios/<int:user_id>/gastos", methods=["GET"])
+@shards.por_usuario(lambda user_id: user_id)
+def gastos_do_usuario(user_id):
     """
-    Retorna todas as listas contendo itens de um supermercado específico.
+    Retorna o gasto mensal de um usuário. Aceita ``de`` e ``ate`` (AAAA-MM).
     """
-    listas = Lista.query.join(Item).filter(Item.supermercado == supermercado).all()
-    if not listas:
-        return (
-            jsonify({"message": "Nenhuma lista encontrada para este supermercado."}),
-            404,
-        )
+    query = GastoMensal.query.filter_by(user_id=user_id)
+    if request.args.get("de"):
+        query = query.filter(GastoMensal.mes >= request.args["de"])
+    if request.args.get("ate"):
+        query = query.filter(GastoMensal.mes <= request.args["ate"])
 
     return (
         jsonify(
             [
-                {
-                    "id": lista.id,
-                    "userId": lista.user_id,
-                    "data": lista.data.isoformat(),
-                    "itens": [
-                        {
-                            "id": item.id,
-                            "produto": item.produto,
-                            "valor": item.valor,
-                            "quantidade": item.quantidade,
-                            "supermercado": item.supermercado,
-                        }
-                        for item in lista.itens
-                        if item.supermercado == supermercado
-                    ],
-                }
-                for lista in listas
+                {"mes": gasto.mes, "total": gasto.total, "listas": gasto.listas}
+                for gasto in query.order_by(GastoMensal.mes)
             ]
         ),
         200,
     )
 
 
-@main.route("/api/itens/<string:produto>", methods=["GET"])
-def listar_itens_por_produto(produto):
+@main.route("/api/analytics/precos", methods=["GET"])
+def precos_por_supermercado():
     """
-    Retorna todas as listas que contêm um determinado produto.
+    Retorna o preço médio de um produto por supermercado (ou de todos os
+    produtos de um supermercado). Exige ``produto`` e/ou ``supermercado``.
+    Com shards, soma os preços de todos eles.
     """
-    itens = Item.query.filter(Item.produto.ilike(f"%{produto}%")).all()
-    if not itens:
-        return jsonify({"message": "Nenhum item encontrado para este produto."}), 404
+    produto = request.args.get("produto")
+    supermercado = request.args.get("supermercado")
+    if not produto and not supermercado:
+        return (
+            jsonify({"error": "Informe o parâmetro produto e/ou supermercado."}),
+            400,
+        )
+
+    # Nome normalizado do par -> [produto, supermercado, soma, ocorrências]
+    precos = {}
+    for linhas in shards.em_todos(_precos_no_shard, produto, supermercado):
+        for nome_produto, nome_supermercado, soma, ocorrencias in linhas:
+            chave = (catalogo.normalizar(nome_produto), catalogo.normalizar(nome_supermercado))
+            preco = precos.setdefault(chave, [nome_produto, nome_supermercado, 0.0, 0])
+            preco[2] += soma
+            preco[3] += ocorrencias
 
     return (
         jsonify(
             [
                 {
-                    "listaId": item.lista_id,
-                    "produto": item.produto,
-                    "valor": item.valor,
-                    "quantidade": item.quantidade,
-                    "supermercado": item.supermercado,
+                    "produto": nome_produto,
+                    "supermercado": nome_supermercado,
+                    "precoMedio": soma / ocorrencias,
+                    "ocorrencias": ocorrencias,
                 }
-                for item in itens
+                for nome_produto, nome_supermercado, soma, ocorrencias in precos.values()
             ]
         ),
         200,
     )
+
+
+def _precos_no_shard(produto, supermercado):
+    query = (
+        db.select(
+            Produto.nome.label("produto"),
+            Supermercado.nome.label("supermercado"),
+            PrecoProduto.soma_valor,
+            PrecoProduto.ocorrencias,
+        )
+        .join(Produto, Produto.id == PrecoProduto.produto_id)
+        .join(Supermercado, Supermercado.id == PrecoProduto.supermercado_id)
+        .where(PrecoProduto.ocorrencias > 0)
+    )
+    for nome, coluna, buscar_id in (
+        (produto, PrecoProduto.produto_id, catalogo.id_produto_existente),
+        (supermercado, PrecoProduto.supermercado_id, catalogo.id_supermercado_existente),
+    ):
+        if nome:
+            catalogo_id = buscar_id(nome)
+            if catalogo_id is None:
+                # Nome fora do catálogo: nenhum preço, sem ir ao banco de novo
+                return []
+            query = query.where(coluna == catalogo_id)
+    return db.session.execute(query).all()
+
+
+@main.route("/api/cotacao", methods=["GET"])
+def cotar():
+    """
+    Cota uma lista (``listaId``) ou produtos avulsos (``produto``, repetido
+    uma vez por unidade) em todos os supermercados, pelo preço médio de cada
+    produto. Retorna o total em cada supermercado (``null`` se falta o preço
+    de algum produto) e a divisão mais barata entre supermercados.
+    """
+    lista_id = request.args.get("listaId")
+    produtos = [nome for nome in request.args.getlist("produto") if nome.strip()]
+
+    if lista_id is not None:
+        try:
+            lista_id = int(lista_id)
+        except ValueError:
+            return jsonify({"error": "O parâmetro listaId deve ser um número válido."}), 400
+        resultado = cotacao.cotar_lista(lista_id)
+        if resultado is None:
+            return jsonify({"error": "Lista não encontrada"}), 404
+        return jsonify(resultado), 200
+
+    if not produtos:
+        return jsonify({"error": "Informe o parâmetro listaId ou produto."}), 400
+    return jsonify(cotacao.cotar_produtos(produtos)), 200
+
+
+@main.route("/api/exportar/usuarios/<int:user_id>", methods=["GET"])
+@shards.por_usuario(lambda user_id: user_id)
+def exportar_listas_usuario(user_id):
+    """
+    Exporta o histórico de compras de um usuário em stream, uma linha por
+    item. ``formato``: ``csv`` (padrão) ou ``ndjson``.
+    """
+    try:
+        formato = exportacao.validar_formato(request.args.get("formato", "csv"))
+    except exportacao.FormatoInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    if db.session.get(User, user_id) is None:
+        return jsonify({"error": "Usuário não encontrado"}), 404
+
+    return (
+        exportacao.resposta([Lista.user_id == user_id], formato, f"listas-usuario-{user_id}"),
+        200,
+    )
+
+
+@main.route("/api/exportar", methods=["GET"])
+def exportar_listas():
+    """
+    Exporta o histórico de compras de todos os usuários em stream.
+    ``formato``: ``csv`` (padrão) ou ``ndjson``.
+    """
+    try:
+        formato = exportacao.validar_formato(request.args.get("formato", "csv"))
+    except exportacao.FormatoInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    return exportacao.resposta([], formato, "listas", todos_os_shards=True), 200
@@ -0,0 +1,135 @@
+import base64
+import binascii
+from itertools import chain
+
+from sqlalchemy import text
+
+from . import db, shards
+from .models import Item, Lista, Produto, Supermercado
+
+
+# Tamanho mínimo de termo atendido pelo índice trigram do FTS5
+TAMANHO_MINIMO_TRIGRAM = 3
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginação malformado."""
+
+
+def codificar_cursor(rank, item_id):
+    bruto = f"{rank!r}:{item_id}".encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    try:
+        preenchido = cursor + "=" * (-len(cursor) % 4)
+        rank, item_id = base64.urlsafe_b64decode(preenchido).decode().split(":")
+        return float(rank), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido(str(e)) from e
+
+
+def _termo_fts(termo):
+    """Transforma o termo em uma frase FTS5, escapando aspas."""
+    return '"' + termo.replace('"', '""') + '"'
+
+
+def buscar_itens(termo, limite=LIMITE_PADRAO, cursor=None):
+    """
+    Busca itens cujo produto contém o termo, ordenados por relevância (bm25).
+
+    O índice FTS cobre apenas o catálogo de produtos; os itens dos produtos
+    encontrados vêm pelo índice de ``item.produto_id``. Retorna uma tupla
+    (itens, proximo_cursor). Termos curtos demais para o índice trigram caem
+    no filtro ``ilike`` sobre o catálogo, ordenado só pelo id.
+
+    Com shards, cada um devolve a sua página a partir do mesmo cursor (os
+    ids não se repetem entre shards) e as páginas são intercaladas pela
+    mesma ordem. O bm25 de cada shard usa as estatísticas do próprio índice.
+    """
+    curto = len(termo) < TAMANHO_MINIMO_TRIGRAM
+    buscar = _buscar_itens_sem_indice if curto else _buscar_itens_fts
+    paginas = shards.em_todos(buscar, termo, limite, cursor)
+
+    if len(paginas) == 1:
+        linhas = paginas[0]
+    else:
+        ordem = (lambda linha: linha.id) if curto else (lambda linha: (linha.rank, linha.id))
+        linhas = sorted(chain.from_iterable(paginas), key=ordem)
+
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = codificar_cursor(0.0 if curto else linhas[-1].rank, linhas[-1].id)
+    return linhas, proximo
+
+
+def _buscar_itens_fts(termo, limite, cursor):
+    # Até limite + 1 linhas: a última só indica que há próxima página
+    rank_apos, id_apos = decodificar_cursor(cursor) if cursor else (None, None)
+
+    sql = """
+        SELECT item.id, item.lista_id, produto.nome AS produto, item.valor,
+               item.quantidade, supermercado.nome AS supermercado,
+               produto_fts.rank AS rank
+        FROM produto_fts
+        JOIN produto ON produto.id = produto_fts.rowid
+        JOIN item ON item.produto_id = produto.id
+        JOIN listas ON listas.id = item.lista_id
+        JOIN supermercado ON supermercado.id = item.supermercado_id
+        WHERE produto_fts MATCH :termo AND listas.excluida_em IS NULL
+    """
+    if cursor:
+        sql += """
+          AND (produto_fts.rank > :rank_apos
+               OR (produto_fts.rank = :rank_apos AND item.id > :id_apos))
+        """
+    sql += " ORDER BY produto_fts.rank, item.id LIMIT :limite"
+
+    return db.session.execute(
+        text(sql),
+        {
+            "termo": _termo_fts(termo),
+            "rank_apos": rank_apos,
+            "id_apos": id_apos,
+            "limite": limite + 1,
+        },
+    ).all()
+
+
+def _buscar_itens_sem_indice(termo, limite, cursor):
+    # Sem relevância para ordenar: pagina apenas pelo id
+    _, id_apos = decodificar_cursor(cursor) if cursor else (None, 0)
+
+    # O ilike varre só o catálogo de produtos, bem menor que a tabela item
+    produtos = db.select(Produto.id).where(Produto.nome.ilike(f"%{termo}%"))
+    return db.session.execute(
+        db.select(
+            Item.id,
+            Item.lista_id,
+            Produto.nome.label("produto"),
+            Item.valor,
+            Item.quantidade,
+            Supermercado.nome.label("supermercado"),
+        )
+        .join(Produto, Produto.id == Item.produto_id)
+        .join(Supermercado, Supermercado.id == Item.supermercado_id)
+        .join(Lista, Lista.id == Item.lista_id)
+        .where(
+            Item.produto_id.in_(produtos),
+            Item.id > id_apos,
+            Lista.excluida_em.is_(None),
+        )
+        .order_by(Item.id)
+        .limit(limite + 1)
+    ).all()
+
+
+def reconstruir_indice():
+    """Reconstrói o índice FTS do shard em uso a partir do catálogo de produtos."""
+    db.session.execute(text("INSERT INTO produto_fts(produto_fts) VALUES('rebuild')"))
+    db.session.commit()
@@ -0,0 +1,103 @@
+"""
+Hash e verificação de senhas fora das threads de requisição.
+
+O hash de senha é caro de propósito. Feito na thread da requisição, uma
+rajada de cadastros ocupa todas as threads e atrasa até as leituras
+baratas. Aqui ele roda em um pool de processos de tamanho fixo, com um
+limite de tarefas em andamento (``SENHAS_PROCESSOS`` + ``SENHAS_FILA``).
+Quando o limite é atingido, ``SenhasOcupadas`` é levantada na hora: a rota
+responde 503 com ``Retry-After`` em vez de enfileirar.
+
+Com ``SENHAS_PROCESSOS = 0`` (ou fora de uma aplicação) o hash é feito na
+própria thread.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class SenhasOcupadas(RuntimeError):
+    """Pool de hash sem vaga; o cliente deve tentar de novo mais tarde."""
+
+
+class _PoolSenhas:
+    def __init__(self, processos, fila):
+        # fork: os workers só executam funções do werkzeug, sem reimportar a app
+        self._executor = ProcessPoolExecutor(
+            max_workers=processos, mp_context=multiprocessing.get_context("fork")
+        )
+        self._vagas = threading.BoundedSemaphore(processos + fila)
+
+    def executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            raise SenhasOcupadas("Muitas operações de senha em andamento.")
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro.result()
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    if not has_app_context() or not current_app.config.get("SENHAS_PROCESSOS"):
+        return None
+    with _lock:
+        if _pool is None:
+            _pool = _PoolSenhas(
+                current_app.config["SENHAS_PROCESSOS"],
+                current_app.config.get("SENHAS_FILA", 0),
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.encerrar()
+
+
+def _executar(funcao, *args):
+    pool = _obter_pool()
+    if pool is None:
+        return funcao(*args)
+    try:
+        return pool.executar(funcao, *args)
+    except BrokenProcessPool:
+        # Um worker morreu: o próximo pedido cria um pool novo
+        _descartar_pool(pool)
+        raise SenhasOcupadas("Pool de senhas reiniciando.")
+
+
+def gerar_hash(senha):
+    return _executar(generate_password_hash, senha)
+
+
+def verificar(senha_hash, senha):
+    return _executar(check_password_hash, senha_hash, senha)
+
+
+def _esquecer_pool_no_filho():
+    # Processos filhos (workers do servidor) criam o próprio pool
+    global _pool, _lock
+    _pool = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_esquecer_pool_no_filho)
@@ -0,0 +1,208 @@
+"""
+Serialização de listas com itens por projeção de colunas.
+
+As rotas de listas não carregam objetos ORM: uma consulta Core busca só as
+colunas pedidas das listas, outra busca os itens dessas listas, e os itens
+são agrupados nas listas em uma passada. O parâmetro ``fields`` (ex.:
+``id,data,itens.produto``) reduz ao mesmo tempo a projeção SQL e o payload.
+"""
+from collections import namedtuple
+
+from flask import request
+from sqlalchemy import select
+
+from . import db, shards
+from .models import Item, Lista, Produto, Supermercado, User
+
+
+class CamposInvalidos(ValueError):
+    """Parâmetro ``fields`` inválido; a mensagem vai para o cliente."""
+
+
+CAMPOS_LISTA = {
+    "id": Lista.id,
+    "userId": Lista.user_id,
+    "data": Lista.data,
+    "userNome": User.nome,
+    "revisao": Lista.revisao,
+    "atualizadaEm": Lista.atualizada_em,
+    "itens": None,
+}
+CAMPOS_ITEM = {
+    "id": Item.id,
+    "produto": Produto.nome,
+    "valor": Item.valor,
+    "quantidade": Item.quantidade,
+    "supermercado": Supermercado.nome,
+    "revisao": Item.revisao,
+    "atualizadoEm": Item.atualizado_em,
+}
+
+CAMPOS_LISTA_PADRAO = ("id", "userId", "data", "itens")
+CAMPOS_ITEM_PADRAO = ("id", "produto", "valor", "quantidade", "supermercado")
+
+# Conversões de valores do banco para JSON
+_FORMATOS = {
+    "data": lambda valor: valor.isoformat(),
+    "atualizadaEm": lambda valor: valor.isoformat(),
+    "atualizadoEm": lambda valor: valor.isoformat(),
+}
+
+Projecao = namedtuple("Projecao", "lista itens")
+
+
+def ler_campos(padrao=CAMPOS_LISTA_PADRAO):
+    """
+    Lê ``fields`` da query string e retorna a ``Projecao`` pedida.
+
+    Sem ``fields``, vale ``padrao`` com os campos padrão dos itens. Campos
+    ``itens.<campo>`` escolhem os campos dos itens; ``itens`` sozinho traz
+    os padrão.
+    """
+    pedido = request.args.get("fields")
+    nomes = padrao if pedido is None else [c.strip() for c in pedido.split(",") if c.strip()]
+    if not nomes:
+        raise CamposInvalidos("O parâmetro fields não pode ser vazio.")
+
+    lista, itens = [], []
+    for nome in nomes:
+        prefixo, _, campo_item = nome.partition(".")
+        if campo_item:
+            if prefixo != "itens" or campo_item not in CAMPOS_ITEM:
+                raise CamposInvalidos(f"Campo desconhecido: {nome}")
+            if campo_item not in itens:
+                itens.append(campo_item)
+        elif nome not in CAMPOS_LISTA:
+            raise CamposInvalidos(f"Campo desconhecido: {nome}")
+        elif nome not in lista:
+            lista.append(nome)
+
+    if "itens" in lista:
+        lista.remove("itens")
+        if not itens:
+            itens = list(CAMPOS_ITEM_PADRAO)
+    return Projecao(tuple(lista), tuple(itens))
+
+
+def _select_listas(projecao, filtro):
+    # id sempre vem primeiro: é a chave de paginação e de agrupamento
+    colunas = [Lista.id] + [CAMPOS_LISTA[campo] for campo in projecao.lista]
+    # Listas excluídas em massa ficam fora de todas as leituras até o expurgo
+    stmt = select(*colunas).where(Lista.excluida_em.is_(None), *filtro)
+    if "userNome" in projecao.lista:
+        stmt = stmt.outerjoin(User, User.id == Lista.user_id)
+    return stmt
+
+
+def _itens_por_lista(projecao, lista_ids, filtro_itens):
+    if not projecao.itens or not lista_ids:
+        return {}
+
+    colunas = [Item.lista_id] + [CAMPOS_ITEM[campo] for campo in projecao.itens]
+    stmt = select(*colunas).where(Item.lista_id.in_(lista_ids), *filtro_itens)
+    if "produto" in projecao.itens:
+        stmt = stmt.join(Produto, Produto.id == Item.produto_id)
+    if "supermercado" in projecao.itens:
+        stmt = stmt.join(Supermercado, Supermercado.id == Item.supermercado_id)
+
+    campos = projecao.itens
+    formatos = _formatos(campos)
+    agrupados = {}
+    for linha in db.session.execute(stmt.order_by(Item.lista_id, Item.id)):
+        item = dict(zip(campos, linha[1:]))
+        for campo, formatar in formatos:
+            item[campo] = formatar(item[campo])
+        agrupados.setdefault(linha[0], []).append(item)
+    return agrupados
+
+
+def _formatos(campos):
+    return [(campo, _FORMATOS[campo]) for campo in campos if campo in _FORMATOS]
+
+
+def _montar(projecao, linhas, filtro_itens):
+    itens = _itens_por_lista(projecao, [linha[0] for linha in linhas], filtro_itens)
+    campos = projecao.lista
+    formatos = _formatos(campos)
+
+    dados = []
+    for linha in linhas:
+        lista = dict(zip(campos, linha[1:]))
+        for campo, formatar in formatos:
+            if lista[campo] is not None:
+                lista[campo] = formatar(lista[campo])
+        if projecao.itens:
+            lista["itens"] = itens.get(linha[0], [])
+        dados.append(lista)
+    return dados
+
+
+def serializar_listas(projecao, filtro, filtro_itens=(), limite=None, apos=0):
+    """
+    Listas que satisfazem ``filtro`` (sequência de condições sobre Lista),
+    ordenadas por id. Com ``limite``, pagina por chave após ``apos``.
+
+    Retorna ``(dados, proximo)``, com ``proximo`` ``None`` na última página.
+    """
+    _, dados, proximo = serializar_com_ids(projecao, filtro, filtro_itens, limite, apos)
+    return dados, proximo
+
+
+def serializar_com_ids(projecao, filtro, filtro_itens=(), limite=None, apos=0):
+    """
+    ``serializar_listas`` com os ids das listas, na ordem de ``dados``
+    (mesmo sem ``id`` na projeção): ``(ids, dados, proximo)``.
+    """
+    stmt = _select_listas(projecao, filtro).where(Lista.id > apos).order_by(Lista.id)
+    if limite is not None:
+        stmt = stmt.limit(limite + 1)
+
+    linhas = db.session.execute(stmt).all()
+    proximo = None
+    if limite is not None and len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = linhas[-1][0]
+    ids = [linha[0] for linha in linhas]
+    return ids, _montar(projecao, linhas, filtro_itens), proximo
+
+
+def juntar_paginas(paginas, limite=None):
+    """
+    Junta as páginas de ``serializar_com_ids`` de cada shard, na ordem dos
+    shards (que é a ordem dos ids), em uma só de até ``limite`` listas.
+    Retorna ``(dados, proximo)``.
+    """
+    if len(paginas) == 1:
+        _, dados, proximo = paginas[0]
+        return dados, proximo
+
+    ids = [lista_id for ids_shard, _, _ in paginas for lista_id in ids_shard]
+    dados = [lista for _, dados_shard, _ in paginas for lista in dados_shard]
+    # Um shard com próxima página trouxe ``limite`` listas sozinho
+    if limite is None or (len(dados) <= limite and not any(p for *_, p in paginas)):
+        return dados, None
+    return dados[:limite], ids[limite - 1]
+
+
+def serializar_em_lotes(projecao, filtro, filtro_itens=(), tamanho=500):
+    """
+    Percorre as listas em páginas de ``tamanho``, sem materializar todas.
+
+    Retorna ``None`` se não houver listas (para a rota ainda responder 404)
+    ou um gerador de dicts prontos para o JSON.
+    """
+    primeira, proximo = serializar_listas(projecao, filtro, filtro_itens, tamanho)
+    if not primeira:
+        return None
+
+    def gerar(pagina, proximo):
+        while True:
+            yield from pagina
+            if proximo is None:
+                return
+            pagina, proximo = serializar_listas(
+                projecao, filtro, filtro_itens, tamanho, proximo
+            )
+
+    # As páginas seguintes são lidas durante o stream, no mesmo shard
+    return shards.fixar(gerar(primeira, proximo))
@@ -0,0 +1,388 @@
+"""
+Shards das listas por usuário.
+
+Com ``SHARDS`` configurado, as listas de cada usuário ficam em um de N
+bancos SQLite além do principal, cada um com o próprio lock de escrita.
+Cada shard tem o esquema completo (as mesmas migrações, aplicadas por
+``flask shards preparar``): listas, itens, catálogos, resumos, versões e
+marcas de exclusão dos seus usuários, e uma cópia das linhas de ``user``
+deles, para as chaves estrangeiras e o ``userNome``.
+
+O banco principal é o shard 0: guarda a tabela ``user`` de verdade e o
+diretório ``shard_usuario``. Usuário sem linha no diretório está no shard
+0 (é o caso de todos quando ``SHARDS`` é vazio). Usuários novos vão para o
+shard ``1 + jump_hash(user_id, N)``; depois disso vale só o diretório, e
+``app/rebalanceamento.py`` muda o usuário de shard.
+
+O shard em uso fica em ``engine.shard_atual``: a sessão manda para ele
+todas as consultas fora de ``TABELAS_GLOBAIS``. As rotas de um usuário o
+escolhem com ``por_usuario``; as de uma lista, com ``por_lista``, pelo id:
+o shard k numera listas e itens a partir de ``k * FAIXA_IDS``. As poucas
+consultas globais rodam em todos os shards com ``em_todos``, em um pool de
+threads, e juntam os resultados na ordem dos shards (que é a ordem dos ids).
+Os comandos SQL dessas threads entram nas métricas da requisição.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from flask import (
+    copy_current_request_context,
+    current_app,
+    has_request_context,
+    jsonify,
+)
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert as upsert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db, metrics
+from .engine import BIND_LEITURA, shard_atual
+from .models import ShardUsuario, User
+
+
+# Ids de listas e itens reservados a cada shard
+FAIXA_IDS = 10**12
+
+# Tabelas com ids numerados a partir da faixa do shard
+TABELAS_COM_FAIXA = ("listas", "item")
+
+
+class UsuarioMovido(RuntimeError):
+    """O usuário mudou de shard durante a escrita; ela é desfeita."""
+
+
+def quantidade():
+    """Quantidade de shards além do banco principal."""
+    return len(current_app.config.get("SHARDS") or ())
+
+
+def ativo():
+    return quantidade() > 0
+
+
+def indices():
+    """Índices de todos os bancos com listas: 0 (principal) a N."""
+    return range(quantidade() + 1)
+
+
+def chave(indice):
+    """Chave do bind do shard (``None`` para o principal)."""
+    return None if not indice else f"shard{indice}"
+
+
+def atual():
+    """Índice do shard em uso."""
+    chave_atual = shard_atual.get()
+    return 0 if chave_atual is None else int(chave_atual[len("shard"):])
+
+
+def engine(indice):
+    return db.engines[chave(indice)]
+
+
+def configurar_binds(app):
+    """Registra um bind por shard. Deve ser chamado antes de ``db.init_app``."""
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for indice, uri in enumerate(app.config.get("SHARDS") or (), start=1):
+        binds[chave(indice)] = uri
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+@contextmanager
+def usar(indice):
+    """Faz as consultas de listas do bloco irem para o shard ``indice``."""
+    anterior = shard_atual.get()
+    # Volta pelo valor, não por token: o bloco pode atravessar os yields de
+    # um gerador consumido em outro contexto (respostas em stream)
+    shard_atual.set(chave(indice))
+    try:
+        yield
+    finally:
+        shard_atual.set(anterior)
+
+
+def da_lista(lista_id):
+    """Índice do shard da lista pelo id, ou ``None`` se fora das faixas."""
+    indice = lista_id // FAIXA_IDS
+    return indice if 0 <= indice <= quantidade() else None
+
+
+def ler_principal(stmt):
+    """
+    Executa uma leitura no banco principal por uma conexão do pool de
+    leitura, fora da sessão: vê o último commit e não toma o lock de
+    escrita do principal.
+    """
+    leitura = db.engines.get(BIND_LEITURA)
+    if leitura is None:
+        return db.session.execute(stmt, bind_arguments={"bind": db.engine}).all()
+    with leitura.connect() as conexao:
+        return conexao.execute(stmt).all()
+
+
+def dos_usuarios(user_ids):
+    """Mapeia cada id de usuário para o índice do seu shard."""
+    user_ids = set(user_ids)
+    destinos = dict.fromkeys(user_ids, 0)
+    if ativo() and user_ids:
+        destinos.update(
+            ler_principal(
+                select(ShardUsuario.user_id, ShardUsuario.shard).where(
+                    ShardUsuario.user_id.in_(user_ids)
+                )
+            )
+        )
+    return destinos
+
+
+def do_usuario(user_id):
+    """Índice do shard das listas do usuário."""
+    return dos_usuarios([user_id])[user_id]
+
+
+def conferir(user_ids):
+    """
+    Levanta ``UsuarioMovido`` se algum dos usuários não está no shard em
+    uso. As escritas chamam depois do primeiro comando no shard: com o lock
+    de escrita dele, uma mudança de shard já terminou ou ainda não começou.
+    """
+    if not ativo():
+        return
+    indice = atual()
+    movidos = sorted(u for u, s in dos_usuarios(user_ids).items() if s != indice)
+    if movidos:
+        raise UsuarioMovido(f"Usuário(s) {movidos} fora do shard {indice}.")
+
+
+def _jump_hash(valor, baldes):
+    # Jump consistent hash (Lamping e Veach): ao passar de N para N + 1
+    # baldes, só 1/(N + 1) das chaves muda de balde
+    valor &= 0xFFFFFFFFFFFFFFFF
+    balde, proximo = -1, 0
+    while proximo < baldes:
+        balde = proximo
+        valor = (valor * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        proximo = int((balde + 1) * ((1 << 31) / ((valor >> 33) + 1)))
+    return balde
+
+
+def escolher(user_id):
+    """Shard de um usuário novo (o principal, sem shards configurados)."""
+    return 1 + _jump_hash(user_id, quantidade()) if ativo() else 0
+
+
+def espelhar_usuario(user_id, indice):
+    """Copia a linha de ``user`` para o shard, sem commit."""
+    if not indice:
+        return
+    linha = ler_principal(
+        select(User.id, User.nome, User.telefone, User.email, User.senha_hash).where(
+            User.id == user_id
+        )
+    )
+    if not linha:
+        return
+    valores = linha[0]._asdict()
+    db.session.execute(
+        upsert(User)
+        .values(**valores)
+        .on_conflict_do_update(index_elements=[User.id], set_=valores),
+        bind_arguments={"bind": engine(indice)},
+    )
+
+
+def registrar_usuario(user_id):
+    """
+    Põe o usuário recém-criado no seu shard: a cópia de ``user`` primeiro,
+    a linha do diretório depois, cada uma com o seu commit. Se algo falhar,
+    ele fica no banco principal, que também atende usuários.
+    """
+    indice = escolher(user_id)
+    try:
+        espelhar_usuario(user_id, indice)
+        db.session.commit()
+        db.session.add(ShardUsuario(user_id=user_id, shard=indice))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception(
+            "Falha ao pôr o usuário %s no shard %s", user_id, indice
+        )
+
+
+def preparar(indice):
+    """
+    Faz o shard numerar listas e itens a partir da sua faixa de ids. Deve
+    rodar depois das migrações do shard; não mexe em sequências já adiante.
+    """
+    inicio = indice * FAIXA_IDS
+    with engine(indice).begin() as conexao:
+        for tabela in TABELAS_COM_FAIXA:
+            seq = conexao.execute(
+                text("SELECT seq FROM sqlite_sequence WHERE name = :tabela"),
+                {"tabela": tabela},
+            ).scalar()
+            if seq is None:
+                conexao.execute(
+                    text("INSERT INTO sqlite_sequence (name, seq) VALUES (:tabela, :seq)"),
+                    {"tabela": tabela, "seq": inicio},
+                )
+            elif seq < inicio:
+                conexao.execute(
+                    text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :tabela"),
+                    {"tabela": tabela, "seq": inicio},
+                )
+
+
+def por_usuario(obter_user_id):
+    """
+    Roda a rota no shard do usuário. ``obter_user_id`` recebe os argumentos
+    da rota e devolve o id, ou ``None`` para rodar no shard em uso. Deve
+    ficar acima de ``cache.condicional_por_usuario``: a versão das listas
+    também está no shard. Uma escrita que encontra o usuário de mudança
+    (``UsuarioMovido``) é refeita uma vez no shard novo.
+    """
+
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = obter_user_id(**kwargs) if ativo() else None
+            if user_id is None:
+                return view(*args, **kwargs)
+
+            for _ in range(2):
+                with usar(do_usuario(user_id)):
+                    try:
+                        return view(*args, **kwargs)
+                    except UsuarioMovido:
+                        continue
+            return _usuario_mudando()
+
+        return wrapper
+
+    return decorador
+
+
+def _usuario_mudando():
+    return jsonify({"error": "Usuário mudando de shard. Tente novamente."}), 503
+
+
+def por_lista(view):
+    """
+    Roda a rota no shard da lista ``lista_id``, escolhido pelo id. Uma
+    escrita que passa a lista para um usuário de mudança responde 503.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ativo():
+            return view(*args, **kwargs)
+        indice = da_lista(kwargs["lista_id"])
+        if indice is None:
+            return jsonify({"error": "Lista não encontrada"}), 404
+        with usar(indice):
+            try:
+                return view(*args, **kwargs)
+            except UsuarioMovido:
+                return _usuario_mudando()
+
+    return wrapper
+
+
+def _no_shard(indice, funcao, args):
+    # A thread não tem o g da requisição: os comandos voltam com o resultado
+    with usar(indice), metrics.medindo_sql() as medicao:
+        return funcao(*args), medicao
+
+
+def em_todos(funcao, *args):
+    """
+    Roda ``funcao(*args)`` em cada shard, em paralelo, e devolve a lista de
+    resultados na ordem dos shards. Sem shards, roda uma vez, na própria
+    thread. Cada thread tem a sua sessão (um contexto de app próprio).
+    """
+    if not ativo():
+        return [funcao(*args)]
+
+    app = current_app._get_current_object()
+    futuros = []
+    for indice in indices():
+        tarefa = partial(_no_shard, indice, funcao, args)
+        if has_request_context():
+            # Uma cópia do contexto por tarefa: o mesmo não pode estar ativo
+            # em duas threads
+            tarefa = copy_current_request_context(tarefa)
+        else:
+            tarefa = partial(_em_contexto_de_app, app, tarefa)
+        futuros.append(_obter_executor(app).submit(tarefa))
+    resultados = []
+    for futuro in futuros:
+        resultado, medicao = futuro.result()
+        metrics.acumular_na_requisicao(medicao)
+        resultados.append(resultado)
+    return resultados
+
+
+def _em_contexto_de_app(app, tarefa):
+    with app.app_context():
+        return tarefa()
+
+
+def _consumir_em(indice, iteravel):
+    iterador = iter(iteravel)
+    while True:
+        with usar(indice):
+            try:
+                valor = next(iterador)
+            except StopIteration:
+                return
+        yield valor
+
+
+def fixar(iteravel):
+    """
+    Consome ``iteravel`` sempre no shard em uso agora. Respostas em stream
+    são geradas depois de a rota retornar, fora do ``usar`` dela.
+    """
+    if not ativo():
+        return iteravel
+    return _consumir_em(atual(), iteravel)
+
+
+def encadear(gerar, *args):
+    """Concatena, na ordem dos shards, ``gerar(*args)`` rodado em cada um."""
+    if not ativo():
+        yield from gerar(*args)
+        return
+    for indice in indices():
+        with usar(indice):
+            iteravel = gerar(*args)
+        yield from _consumir_em(indice, iteravel)
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _obter_executor(app):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get("SHARDS_THREADS", 8),
+                thread_name_prefix="shards",
+            )
+        return _executor
+
+
+def _esquecer_executor_no_filho():
+    # As threads não sobrevivem ao fork: cada worker cria o seu pool
+    global _executor, _lock
+    _executor = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_esquecer_executor_no_filho)
@@ -0,0 +1,108 @@
+"""
+Sincronização incremental das listas de um usuário.
+
+Cada escrita nas listas de um usuário incrementa ``versao_listas``; o valor
+novo é a revisão da escrita e fica gravado em ``revisao`` nas listas e itens
+tocados. Exclusões (e listas que mudam de dono) deixam uma marca em
+``exclusao`` com a revisão do usuário que perdeu a lista.
+
+``alteracoes(user_id, desde)`` devolve só o que mudou depois da revisão
+``desde``: o cliente guarda a ``revisao`` da resposta e a envia na próxima.
+
+As marcas não ficam para sempre: o expurgo apaga as mais antigas que
+``EXCLUSOES_RETENCAO_DIAS`` e guarda, em ``versao_listas.exclusoes_ate``, a
+maior revisão apagada. Um cliente com ``desde`` anterior a ela pode ter
+perdido exclusões: recebe tudo, com ``completa``, e troca o que tem pelo
+que veio.
+"""
+from sqlalchemy import insert, select
+
+from . import db, serializacao
+from .models import Exclusao, Item, Lista, VersaoListas
+
+
+PROJECAO = serializacao.Projecao(
+    ("id", "userId", "data", "revisao", "atualizadaEm"),
+    serializacao.CAMPOS_ITEM_PADRAO + ("revisao", "atualizadoEm"),
+)
+
+
+def registrar_exclusao_lista(user_id, revisao, lista_id):
+    """Marca a lista como excluída para ``user_id``, sem commit."""
+    db.session.execute(
+        insert(Exclusao).values(user_id=user_id, revisao=revisao, lista_id=lista_id)
+    )
+
+
+def registrar_exclusao_listas(marcas):
+    """``marcas``: sequência de ``(user_id, revisao, lista_id)``; sem commit."""
+    db.session.execute(
+        insert(Exclusao),
+        [
+            {"user_id": user_id, "revisao": revisao, "lista_id": lista_id}
+            for user_id, revisao, lista_id in marcas
+        ],
+    )
+
+
+def registrar_exclusao_itens(user_id, revisao, lista_id, item_ids):
+    """Marca itens removidos de uma lista que continua existindo, sem commit."""
+    if not item_ids:
+        return
+    db.session.execute(
+        insert(Exclusao),
+        [
+            {"user_id": user_id, "revisao": revisao, "lista_id": lista_id, "item_id": item_id}
+            for item_id in item_ids
+        ],
+    )
+
+
+def alteracoes(user_id, desde):
+    """
+    Listas, itens e exclusões de ``user_id`` com revisão maior que ``desde``.
+
+    Uma lista alterada vem só com os itens alterados. Ids que aparecem em
+    ``listas`` (uma lista que voltou ao usuário, um id reaproveitado) não
+    aparecem em ``exclusoes``. Com ``completa``, vêm todas as listas, como
+    com ``desde=0``.
+    """
+    versao = db.session.execute(
+        select(VersaoListas.versao, VersaoListas.exclusoes_ate).where(
+            VersaoListas.user_id == user_id
+        )
+    ).first()
+    revisao, exclusoes_ate = versao if versao else (0, 0)
+    completa = not desde or desde < exclusoes_ate
+    if completa:
+        desde = 0
+
+    listas, _ = serializacao.serializar_listas(
+        PROJECAO,
+        [Lista.user_id == user_id, Lista.revisao > desde],
+        [Item.revisao > desde],
+    )
+
+    listas_excluidas, itens_excluidos = {}, {}
+    # Com desde=0 o cliente não tem nada para excluir
+    if desde:
+        listas_presentes = {lista["id"] for lista in listas}
+        itens_presentes = {item["id"] for lista in listas for item in lista["itens"]}
+        marcas = db.session.execute(
+            select(Exclusao.lista_id, Exclusao.item_id)
+            .where(Exclusao.user_id == user_id, Exclusao.revisao > desde)
+            .order_by(Exclusao.revisao)
+        )
+        for lista_id, item_id in marcas:
+            if item_id is None:
+                if lista_id not in listas_presentes:
+                    listas_excluidas[lista_id] = None
+            elif item_id not in itens_presentes:
+                itens_excluidos[item_id] = None
+
+    return {
+        "revisao": revisao,
+        "completa": completa,
+        "listas": listas,
+        "exclusoes": {"listas": list(listas_excluidas), "itens": list(itens_excluidos)},
+    }
@@ -0,0 +1,118 @@
+import os
+
+
+class Config:
+    """Configuração base, compartilhada por todos os ambientes."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///supermarket.db")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Conexão de escrita: o SQLite aceita um escritor por vez, então uma única
+    # conexão evita disputa pelo lock (as requisições esperam na fila do pool)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": 30,
+    }
+
+    # Rotas GET usam um pool separado de conexões somente leitura
+    ROTEAR_LEITURAS = True
+    POOL_LEITURA_TAMANHO = 8
+    POOL_LEITURA_EXTRA = 4
+
+    # PRAGMAs aplicados a cada nova conexão SQLite. journal_mode só é aplicado
+    # na conexão de escrita (conexões somente leitura não podem alterá-lo).
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,  # em KiB (negativo): 64 MiB por conexão
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        # Chaves estrangeiras valem de fato: excluir uma lista apaga os itens
+        # dela no próprio banco (ON DELETE CASCADE)
+        "foreign_keys": "ON",
+    }
+
+    CACHE_LISTAS_TAMANHO = 256
+
+    # Pool de processos para hash de senha: tamanho, tarefas além dele que
+    # podem esperar, e o Retry-After (s) das recusas
+    SENHAS_PROCESSOS = 2
+    SENHAS_FILA = 4
+    SENHAS_RETRY_AFTER = 1
+
+    # Commit em grupo das escritas de listas (ver app/escrita.py): janela de
+    # espera, tamanho máximo do lote e prazo (s) de uma requisição na fila
+    ESCRITA_AGRUPADA = False
+    ESCRITA_JANELA_MS = 2
+    ESCRITA_MAXIMO_LOTE = 64
+    ESCRITA_TIMEOUT = 30
+
+    # Expurgo das listas excluídas em massa (ver app/expurgo.py): listas
+    # apagadas por transação, pausa entre transações e se roda em uma thread
+    EXPURGO_LOTE = 200
+    EXPURGO_PAUSA_MS = 20
+    EXPURGO_EM_SEGUNDO_PLANO = True
+    # Marcas de exclusão da sincronização incremental guardadas por esse
+    # tempo; clientes sem sincronizar há mais que isso recebem tudo de novo
+    EXCLUSOES_RETENCAO_DIAS = 90
+
+    # Shards das listas por usuário (ver app/shards.py): URIs dos bancos
+    # 1..N, separadas por vírgula. Vazio: tudo fica no banco principal
+    SHARDS = tuple(uri for uri in os.environ.get("SHARDS", "").split(",") if uri)
+    # Threads das consultas que percorrem todos os shards
+    SHARDS_THREADS = 8
+
+    # Comandos SQL mais lentos que isso vão para o log "app.sql"
+    LIMITE_CONSULTA_LENTA_MS = 200
+
+    # Captura de tráfego (ver app/captura.py): arquivo JSONL, relativo à pasta
+    # instance (ex.: captura.jsonl). Sem arquivo, a captura fica desligada
+    CAPTURA_ARQUIVO = os.environ.get("CAPTURA_ARQUIVO")
+    # Fração das requisições gravadas
+    CAPTURA_AMOSTRA = float(os.environ.get("CAPTURA_AMOSTRA", "1.0"))
+    CAPTURA_CORPO_MAXIMO = 1024 * 1024
+    CAPTURA_CAMPOS_OCULTOS = ("senha",)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    POOL_LEITURA_TAMANHO = 16
+    POOL_LEITURA_EXTRA = 8
+    CACHE_LISTAS_TAMANHO = 2048
+    # Metade dos núcleos: o restante atende as requisições
+    SENHAS_PROCESSOS = max(1, (os.cpu_count() or 2) // 2)
+    SENHAS_FILA = 16
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    # Banco em memória usa StaticPool, que não aceita opções de pool
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    ROTEAR_LEITURAS = False
+    SENHAS_PROCESSOS = 0
+    # Expurgo na própria requisição: o resultado é visível logo após ela
+    EXPURGO_EM_SEGUNDO_PLANO = False
+    SHARDS = ()
+    CAPTURA_ARQUIVO = None
+
+
+config_por_ambiente = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+}
+
+
+def obter_config(ambiente=None):
+    """Classe de configuração do ambiente (padrão: variável APP_ENV)."""
+    ambiente = ambiente or os.environ.get("APP_ENV", "development")
+    try:
+        return config_por_ambiente[ambiente]
+    except KeyError:
+        raise ValueError(f"Ambiente desconhecido: {ambiente}") from None
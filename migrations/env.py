@@ -16,6 +16,10 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    # -x shard=N migra o banco do shard N (ver app/shards.py)
+    shard = context.get_x_argument(as_dictionary=True).get('shard')
+    if shard and int(shard):
+        return current_app.extensions['migrate'].db.engines[f'shard{int(shard)}']
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
@@ -97,14 +101,26 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=get_metadata(),
-            **conf_args
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # As migrações em lote do SQLite recriam tabelas (cria a nova, copia,
+        # apaga a antiga): com as chaves estrangeiras ligadas, apagar a
+        # tabela antiga de listas apagaria os itens em cascata. O PRAGMA vai
+        # direto ao driver, fora de transação (dentro de uma, ele é ignorado),
+        # e o valor original volta antes de a conexão retornar ao pool.
+        driver = connection.connection.driver_connection
+        chaves_estrangeiras = driver.execute("PRAGMA foreign_keys").fetchone()[0]
+        driver.execute("PRAGMA foreign_keys=OFF")
+
+        try:
+            context.configure(
+                connection=connection,
+                target_metadata=get_metadata(),
+                **conf_args
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            driver.execute(f"PRAGMA foreign_keys={chaves_estrangeiras}")
 
 
 if context.is_offline_mode():
@@ -0,0 +1,160 @@
+"""Itens referenciam os catálogos
+
+Revision ID: 1c409b0746ed
+Revises: e145ea2c108a
+Create Date: 2026-10-17 15:31:20.772915
+
+Segunda etapa: com todas as linhas convertidas, item passa a guardar apenas
+os ids dos catálogos. As colunas de texto saem, o índice de busca passa a
+cobrir o catálogo de produtos e preco_produto passa a ser indexado por id.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c409b0746ed'
+down_revision = 'e145ea2c108a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pendentes = op.get_bind().exec_driver_sql(
+        "SELECT count(*) FROM item WHERE produto_id IS NULL OR supermercado_id IS NULL"
+    ).scalar()
+    if pendentes:
+        raise RuntimeError(
+            f"{pendentes} itens ainda sem id de catálogo: "
+            "rode novamente a migração e145ea2c108a."
+        )
+
+    # O índice FTS antigo e os gatilhos dependem de item.produto
+    op.execute("DROP TRIGGER IF EXISTS item_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS item_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS item_fts_ai")
+    op.execute("DROP TABLE IF EXISTS item_fts")
+
+    op.drop_index('ix_item_supermercado_lista_id', table_name='item')
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.alter_column('produto_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('supermercado_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_item_produto_id_produto', 'produto', ['produto_id'], ['id'])
+        batch_op.create_foreign_key('fk_item_supermercado_id_supermercado', 'supermercado', ['supermercado_id'], ['id'])
+        batch_op.drop_column('produto')
+        batch_op.drop_column('supermercado')
+        batch_op.create_index(batch_op.f('ix_item_produto_id'), ['produto_id'], unique=False)
+        batch_op.create_index('ix_item_supermercado_id_lista_id', ['supermercado_id', 'lista_id'], unique=False)
+
+    # Busca por substring sobre o catálogo de produtos
+    op.execute(
+        "CREATE VIRTUAL TABLE produto_fts USING fts5("
+        "nome, content='produto', content_rowid='id', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER produto_fts_ai AFTER INSERT ON produto BEGIN "
+        "INSERT INTO produto_fts(rowid, nome) VALUES (new.id, new.nome); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER produto_fts_ad AFTER DELETE ON produto BEGIN "
+        "INSERT INTO produto_fts(produto_fts, rowid, nome) "
+        "VALUES ('delete', old.id, old.nome); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER produto_fts_au AFTER UPDATE OF nome ON produto BEGIN "
+        "INSERT INTO produto_fts(produto_fts, rowid, nome) "
+        "VALUES ('delete', old.id, old.nome); "
+        "INSERT INTO produto_fts(rowid, nome) VALUES (new.id, new.nome); "
+        "END"
+    )
+    op.execute("INSERT INTO produto_fts(produto_fts) VALUES ('rebuild')")
+
+    # Estatísticas de preço passam a ser indexadas pelos ids dos catálogos
+    op.drop_index('ix_preco_produto_supermercado', table_name='preco_produto')
+    op.drop_table('preco_produto')
+    op.create_table('preco_produto',
+    sa.Column('produto_id', sa.Integer(), nullable=False),
+    sa.Column('supermercado_id', sa.Integer(), nullable=False),
+    sa.Column('soma_valor', sa.Float(), nullable=False),
+    sa.Column('ocorrencias', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['produto_id'], ['produto.id'], ),
+    sa.ForeignKeyConstraint(['supermercado_id'], ['supermercado.id'], ),
+    sa.PrimaryKeyConstraint('produto_id', 'supermercado_id')
+    )
+    op.create_index('ix_preco_produto_supermercado_id', 'preco_produto', ['supermercado_id'], unique=False)
+    op.execute(
+        "INSERT INTO preco_produto (produto_id, supermercado_id, soma_valor, ocorrencias) "
+        "SELECT produto_id, supermercado_id, sum(valor), count(*) FROM item "
+        "GROUP BY produto_id, supermercado_id"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_preco_produto_supermercado_id', table_name='preco_produto')
+    op.drop_table('preco_produto')
+    op.create_table('preco_produto',
+    sa.Column('produto', sa.String(length=120), nullable=False),
+    sa.Column('supermercado', sa.String(length=120), nullable=False),
+    sa.Column('soma_valor', sa.Float(), nullable=False),
+    sa.Column('ocorrencias', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('produto', 'supermercado')
+    )
+    op.create_index('ix_preco_produto_supermercado', 'preco_produto', ['supermercado'], unique=False)
+
+    op.execute("DROP TRIGGER IF EXISTS produto_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS produto_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS produto_fts_ai")
+    op.execute("DROP TABLE IF EXISTS produto_fts")
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('produto', sa.String(length=120), nullable=True))
+        batch_op.add_column(sa.Column('supermercado', sa.String(length=120), nullable=True))
+
+    op.execute(
+        "UPDATE item SET "
+        "produto = (SELECT nome FROM produto WHERE produto.id = item.produto_id), "
+        "supermercado = (SELECT nome FROM supermercado WHERE supermercado.id = item.supermercado_id)"
+    )
+    op.execute(
+        "INSERT INTO preco_produto (produto, supermercado, soma_valor, ocorrencias) "
+        "SELECT produto, supermercado, sum(valor), count(*) FROM item "
+        "GROUP BY produto, supermercado"
+    )
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index('ix_item_supermercado_id_lista_id')
+        batch_op.drop_index(batch_op.f('ix_item_produto_id'))
+        batch_op.drop_constraint('fk_item_supermercado_id_supermercado', type_='foreignkey')
+        batch_op.drop_constraint('fk_item_produto_id_produto', type_='foreignkey')
+        batch_op.alter_column('produto', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('supermercado', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('supermercado_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('produto_id', existing_type=sa.Integer(), nullable=True)
+
+    op.create_index('ix_item_supermercado_lista_id', 'item', ['supermercado', 'lista_id'], unique=False)
+    op.execute(
+        "CREATE VIRTUAL TABLE item_fts USING fts5("
+        "produto, content='item', content_rowid='id', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER item_fts_ai AFTER INSERT ON item BEGIN "
+        "INSERT INTO item_fts(rowid, produto) VALUES (new.id, new.produto); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER item_fts_ad AFTER DELETE ON item BEGIN "
+        "INSERT INTO item_fts(item_fts, rowid, produto) "
+        "VALUES ('delete', old.id, old.produto); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER item_fts_au AFTER UPDATE OF produto ON item BEGIN "
+        "INSERT INTO item_fts(item_fts, rowid, produto) "
+        "VALUES ('delete', old.id, old.produto); "
+        "INSERT INTO item_fts(rowid, produto) VALUES (new.id, new.produto); "
+        "END"
+    )
+    op.execute("INSERT INTO item_fts(item_fts) VALUES ('rebuild')")
@@ -0,0 +1,106 @@
+"""Catálogos de produtos e supermercados
+
+Revision ID: e145ea2c108a
+Revises: 5271289cfdc5
+Create Date: 2026-10-17 15:02:44.610392
+
+Primeira etapa da codificação de produto e supermercado em item: cria os
+catálogos, adiciona as colunas de id (ainda opcionais) e converte as linhas
+existentes em lotes. Cada lote é um comando próprio, confirmado sozinho
+(autocommit), então a tabela item nunca fica bloqueada pela conversão
+inteira. Se a migração for interrompida, basta rodá-la de novo: ela
+recomeça a partir da primeira linha ainda não convertida.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e145ea2c108a'
+down_revision = '5271289cfdc5'
+branch_labels = None
+depends_on = None
+
+
+TAMANHO_LOTE = 5000
+
+
+def _nome_exibicao(nome):
+    return " ".join(str(nome).split())
+
+
+def _normalizar(nome):
+    # Cópia congelada de app.catalogo.normalizar
+    return _nome_exibicao(nome).casefold()
+
+
+def _tabela_existe(conexao, nome):
+    return sa.inspect(conexao).has_table(nome)
+
+
+def upgrade():
+    conexao = op.get_bind()
+
+    if not _tabela_existe(conexao, 'produto'):
+        op.create_table('produto',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nome', sa.String(length=120), nullable=False),
+        sa.Column('nome_normalizado', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('nome_normalizado')
+        )
+        op.create_table('supermercado',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nome', sa.String(length=120), nullable=False),
+        sa.Column('nome_normalizado', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('nome_normalizado')
+        )
+        op.add_column('item', sa.Column('produto_id', sa.Integer(), nullable=True))
+        op.add_column('item', sa.Column('supermercado_id', sa.Integer(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        conexao = op.get_bind()
+        driver = conexao.connection.driver_connection
+        driver.create_function('normalizar', 1, _normalizar, deterministic=True)
+        driver.create_function('nome_exibicao', 1, _nome_exibicao, deterministic=True)
+
+        # Retoma da primeira linha ainda sem id de catálogo
+        inicio = conexao.exec_driver_sql(
+            "SELECT min(id) FROM item WHERE produto_id IS NULL OR supermercado_id IS NULL"
+        ).scalar()
+        fim = conexao.exec_driver_sql("SELECT max(id) FROM item").scalar()
+
+        while inicio is not None and inicio <= fim:
+            intervalo = {"inicio": inicio, "fim": inicio + TAMANHO_LOTE - 1}
+            for tabela, coluna in (('produto', 'produto'), ('supermercado', 'supermercado')):
+                conexao.execute(
+                    sa.text(
+                        f"INSERT INTO {tabela} (nome, nome_normalizado) "
+                        f"SELECT nome_exibicao({coluna}), normalizar({coluna}) FROM item "
+                        "WHERE id BETWEEN :inicio AND :fim "
+                        f"GROUP BY normalizar({coluna}) "
+                        "ON CONFLICT (nome_normalizado) DO NOTHING"
+                    ),
+                    intervalo,
+                )
+            conexao.execute(
+                sa.text(
+                    "UPDATE item SET "
+                    "produto_id = (SELECT id FROM produto "
+                    "WHERE nome_normalizado = normalizar(item.produto)), "
+                    "supermercado_id = (SELECT id FROM supermercado "
+                    "WHERE nome_normalizado = normalizar(item.supermercado)) "
+                    "WHERE id BETWEEN :inicio AND :fim"
+                ),
+                intervalo,
+            )
+            inicio += TAMANHO_LOTE
+
+
+def downgrade():
+    op.drop_column('item', 'supermercado_id')
+    op.drop_column('item', 'produto_id')
+    op.drop_table('supermercado')
+    op.drop_table('produto')
@@ -0,0 +1,55 @@
+"""Índice de busca FTS para itens
+
+Revision ID: f6fbe6909c88
+Revises: 267993001f98
+Create Date: 2026-10-17 09:12:41.532118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6fbe6909c88'
+down_revision = '267993001f98'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tabela FTS5 de conteúdo externo: guarda só o índice, os dados ficam em item.
+    # O tokenizador trigram atende buscas por substring (equivalente ao ilike).
+    op.execute(
+        "CREATE VIRTUAL TABLE item_fts USING fts5("
+        "produto, content='item', content_rowid='id', tokenize='trigram')"
+    )
+
+    # Gatilhos mantêm o índice sincronizado em qualquer escrita na tabela item
+    op.execute(
+        "CREATE TRIGGER item_fts_ai AFTER INSERT ON item BEGIN "
+        "INSERT INTO item_fts(rowid, produto) VALUES (new.id, new.produto); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER item_fts_ad AFTER DELETE ON item BEGIN "
+        "INSERT INTO item_fts(item_fts, rowid, produto) "
+        "VALUES ('delete', old.id, old.produto); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER item_fts_au AFTER UPDATE OF produto ON item BEGIN "
+        "INSERT INTO item_fts(item_fts, rowid, produto) "
+        "VALUES ('delete', old.id, old.produto); "
+        "INSERT INTO item_fts(rowid, produto) VALUES (new.id, new.produto); "
+        "END"
+    )
+
+    # Indexa os itens já existentes
+    op.execute("INSERT INTO item_fts(item_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS item_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS item_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS item_fts_ai")
+    op.execute("DROP TABLE IF EXISTS item_fts")
@@ -6,6 +6,7 @@ app = create_app()
 # Permite todas as origens para rotas "/api/*"
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# Inicia o servidor Flask no host 0.0.0.0, tornando-o acessível de qualquer rede
+# Servidor de desenvolvimento no host 0.0.0.0 (debug conforme APP_ENV).
+# Em produção, use serve.py (vários processos).
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0")
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+Servidor de produção: vários processos (prefork), cada um com um número
+fixo de threads, usando apenas o servidor WSGI do Werkzeug.
+
+O processo mestre importa a aplicação e abre o socket uma única vez; os
+workers são criados por fork e herdam os dois. Depois do fork, cada worker
+descarta os pools de conexão herdados e abre as suas próprias conexões.
+
+    python serve.py --workers 4 --threads 8 --max-requests 5000
+
+SIGTERM/SIGINT no mestre param os workers graciosamente: cada um deixa de
+aceitar conexões e termina as requisições em andamento. Com
+``--max-requests``, um worker que atingiu o limite sai do mesmo jeito e o
+mestre cria outro no lugar.
+"""
+import argparse
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Antes de importar a aplicação: o padrão aqui é a configuração de produção
+os.environ.setdefault("APP_ENV", "production")
+
+from app import db  # noqa: E402
+from run import app  # noqa: E402
+
+
+logger = logging.getLogger("serve")
+
+
+class _Requisicao(WSGIRequestHandler):
+    # Uma requisição por conexão: uma conexão keep-alive ociosa prenderia
+    # uma das poucas threads do worker. Keep-alive fica com o proxy reverso.
+    protocol_version = "HTTP/1.0"
+
+    def log_request(self, code="-", size="-"):
+        if self.server.log_acessos:
+            super().log_request(code, size)
+
+
+class ServidorWorker(BaseWSGIServer):
+    """
+    Servidor WSGI de um worker: atende cada conexão em um pool fixo de
+    threads. Com todas ocupadas, o worker para de aceitar conexões, que
+    esperam no backlog do socket (e podem ser aceitas por outro worker).
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, fd, threads, max_requisicoes, log_acessos):
+        # Antes do super(): ele chama server_close() ao trocar o socket
+        self._threads = ThreadPoolExecutor(threads, thread_name_prefix="requisicao")
+        self._vagas = threading.BoundedSemaphore(threads)
+        self._lock = threading.Lock()
+        self._max_requisicoes = max_requisicoes
+        self._atendidas = 0
+        self._encerrando = False
+        self.log_acessos = log_acessos
+        super().__init__("0.0.0.0", 0, app, handler=_Requisicao, fd=fd)
+
+    def process_request(self, request, client_address):
+        self._vagas.acquire()
+        self._threads.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._vagas.release()
+            self._contar_requisicao()
+
+    def _contar_requisicao(self):
+        with self._lock:
+            self._atendidas += 1
+            atingiu = self._max_requisicoes and self._atendidas >= self._max_requisicoes
+        if atingiu:
+            logger.info("Worker %s atingiu %s requisições.", os.getpid(), self._atendidas)
+            self.encerrar()
+
+    def encerrar(self):
+        """Para de aceitar conexões; ``serve_forever`` retorna em seguida."""
+        with self._lock:
+            if self._encerrando:
+                return
+            self._encerrando = True
+        # shutdown() espera o loop de serve_forever: não pode rodar nele
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        # Termina as requisições em andamento antes de fechar o socket
+        if self._encerrando:
+            self._threads.shutdown(wait=True)
+        super().server_close()
+
+
+def _descartar_conexoes(fechar):
+    with app.app_context():
+        for engine in db.engines.values():
+            # No filho, close=False: as conexões herdadas pertencem ao mestre
+            engine.dispose(close=fechar)
+
+
+def _rodar_worker(fd, opcoes):
+    # Ctrl+C chega a todo o grupo de processos: quem coordena é o mestre
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _descartar_conexoes(fechar=False)
+
+    max_requisicoes = opcoes.max_requests
+    if max_requisicoes and opcoes.max_requests_jitter:
+        # Espalha as reciclagens para os workers não reiniciarem juntos
+        max_requisicoes += random.randint(0, opcoes.max_requests_jitter)
+
+    servidor = ServidorWorker(
+        app, fd, opcoes.threads, max_requisicoes, opcoes.access_log
+    )
+    signal.signal(signal.SIGTERM, lambda *_: servidor.encerrar())
+    logger.info("Worker %s pronto.", os.getpid())
+    servidor.serve_forever()
+    _descartar_conexoes(fechar=True)
+
+
+def _criar_worker(fd, opcoes):
+    pid = os.fork()
+    if pid == 0:
+        codigo = 0
+        try:
+            _rodar_worker(fd, opcoes)
+        except BaseException:
+            logger.exception("Worker %s falhou.", os.getpid())
+            codigo = 1
+        finally:
+            logging.shutdown()
+            os._exit(codigo)
+    return pid
+
+
+def servir(opcoes):
+    ouvinte = socket.create_server(
+        (opcoes.host, opcoes.port), backlog=opcoes.backlog
+    )
+    # Nenhuma conexão do mestre pode chegar aos filhos
+    _descartar_conexoes(fechar=True)
+
+    workers = set()
+    parar = threading.Event()
+    prazo = None
+
+    def ao_sinal(numero, _):
+        parar.set()
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, ao_sinal)
+    signal.signal(signal.SIGINT, ao_sinal)
+
+    logger.info(
+        "Mestre %s em %s:%s com %s workers x %s threads.",
+        os.getpid(), opcoes.host, opcoes.port, opcoes.workers, opcoes.threads,
+    )
+    for _ in range(opcoes.workers):
+        workers.add(_criar_worker(ouvinte.fileno(), opcoes))
+
+    while workers:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if parar.is_set():
+                prazo = prazo or time.monotonic() + opcoes.graceful_timeout
+                if time.monotonic() > prazo:
+                    logger.warning("Prazo de encerramento esgotado; matando workers.")
+                    for restante in workers:
+                        os.kill(restante, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+
+        workers.discard(pid)
+        if not parar.is_set():
+            if os.waitstatus_to_exitcode(status) != 0:
+                logger.warning("Worker %s saiu com status %s.", pid, status)
+                # Evita um laço de forks se o worker falhar ao iniciar
+                time.sleep(1)
+            workers.add(_criar_worker(ouvinte.fileno(), opcoes))
+
+    ouvinte.close()
+    logger.info("Mestre %s encerrado.", os.getpid())
+
+
+def _opcoes(argv=None):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Servidor de produção da API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=cpus)
+    parser.add_argument("--threads", type=int, default=4, help="Threads por worker.")
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=0,
+        help="Recicla o worker depois de N requisições (0 desliga).",
+    )
+    parser.add_argument("--max-requests-jitter", type=int, default=0)
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=30,
+        help="Segundos para os workers terminarem antes de serem mortos.",
+    )
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--access-log", action="store_true")
+    opcoes = parser.parse_args(argv)
+    if opcoes.workers < 1 or opcoes.threads < 1:
+        parser.error("--workers e --threads devem ser pelo menos 1.")
+    return opcoes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s [%(process)d] %(levelname)s %(message)s"
+    )
+    servir(_opcoes())